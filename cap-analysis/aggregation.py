@@ -0,0 +1,162 @@
+"""
+Aggregation of the learning curves of several runs of the same algorithm and environment.
+
+All the runs of a group are interpolated on a common timestep grid at once, into a single 2-D array with one row per
+run, from which the statistics of every grid point are computed with whole-array operations.
+"""
+
+import numpy as np
+
+DEFAULT_GRID_STEP = 5
+DEFAULT_QUANTILES = (0.25, 0.75)
+DEFAULT_N_BOOTSTRAP = 1000
+DEFAULT_CONFIDENCE = 0.95
+
+# Maximum number of bootstrap means held in memory at once, when computing the confidence intervals
+BOOTSTRAP_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class AggregateResult:
+    """
+    Statistics of a group of runs at every point of a timestep grid.
+
+    :param x: (np.ndarray) The timestep grid.
+    :param end: (float) End of the grid (excluded), i.e. the last timestep of the shortest run, or max_x.
+    :param ys: (np.ndarray) The value of each run (rows) at each point of the grid (columns).
+    :param mean: (np.ndarray) Mean over the runs.
+    :param median: (np.ndarray) Median over the runs.
+    :param quantiles: ({float: np.ndarray}) Quantiles over the runs.
+    :param ci_low: (np.ndarray) Lower bound of the bootstrap confidence interval of the mean (None if not computed).
+    :param ci_high: (np.ndarray) Upper bound of the bootstrap confidence interval of the mean (None if not computed).
+    :param confidence: (float) Confidence level of the interval.
+    """
+
+    def __init__(self, x, end, ys, mean, median, quantiles, ci_low, ci_high, confidence):
+        self.x = x
+        self.end = end
+        self.ys = ys
+        self.mean = mean
+        self.median = median
+        self.quantiles = quantiles
+        self.ci_low = ci_low
+        self.ci_high = ci_high
+        self.confidence = confidence
+
+    @property
+    def n_runs(self):
+        return self.ys.shape[0]
+
+
+def interpolate_runs(xy_list, x_grid):
+    """
+    Interpolates every run on the same grid, like calling np.interp(x_grid, x, y) for each one, but in a single pass.
+
+    The runs are concatenated, each one shifted by an offset larger than all the x values, so that a single
+    searchsorted finds the interval of every grid point in every run.
+
+    :param xy_list: ([(np.ndarray, np.ndarray)]) The x (increasing) and y values of each run.
+    :param x_grid: (np.ndarray) The common grid.
+    :return: (np.ndarray) The interpolated values, with one row per run.
+    """
+    n_runs = len(xy_list)
+    lengths = np.array([len(x) for x, _ in xy_list])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    xs = np.concatenate([np.asarray(x, dtype=np.float64) for x, _ in xy_list])
+    ys = np.concatenate([np.asarray(y, dtype=np.float64) for _, y in xy_list])
+
+    offset = max(xs.max(), np.max(x_grid)) - min(xs.min(), np.min(x_grid)) + 1
+    row_offsets = np.repeat(np.arange(n_runs) * offset, lengths)
+    shifted_xs = xs + row_offsets
+
+    shifted_grid = x_grid[np.newaxis, :] + (np.arange(n_runs) * offset)[:, np.newaxis]
+
+    # Index of the last point of each run that is not after the grid point, clamped to the points of the run
+    left = np.searchsorted(shifted_xs, shifted_grid, side='right') - 1
+    left = np.clip(left, starts[:, np.newaxis], (ends - 1)[:, np.newaxis])
+    right = np.minimum(left + 1, (ends - 1)[:, np.newaxis])
+
+    x_left, x_right = shifted_xs[left], shifted_xs[right]
+    y_left, y_right = ys[left], ys[right]
+
+    # Outside of the points of a run, np.interp returns the first or last value, hence the clipping
+    width = x_right - x_left
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(width > 0, (shifted_grid - x_left) / width, 0)
+    fraction = np.clip(fraction, 0, 1)
+
+    return y_left + fraction * (y_right - y_left)
+
+
+def bootstrap_mean_ci(ys, n_bootstrap=DEFAULT_N_BOOTSTRAP, confidence=DEFAULT_CONFIDENCE, seed=None):
+    """
+    Percentile bootstrap confidence interval of the mean over the runs, at every grid point.
+
+    Each resample of the runs is represented by how many times each run was drawn, so the means of all the resamples
+    are a single matrix product.
+
+    :param ys: (np.ndarray) The value of each run (rows) at each point of the grid (columns).
+    :return: (np.ndarray, np.ndarray) The lower and upper bounds of the interval.
+    """
+    rng = np.random.default_rng(seed)
+    n_runs, n_points = ys.shape
+
+    counts = rng.multinomial(n_runs, np.full(n_runs, 1.0 / n_runs), size=n_bootstrap).astype(np.float64)
+    weights = counts / n_runs
+
+    alpha = 1 - confidence
+    ci_low = np.empty(n_points)
+    ci_high = np.empty(n_points)
+
+    chunk_size = max(1, BOOTSTRAP_CHUNK_SIZE // n_bootstrap)
+
+    for start in range(0, n_points, chunk_size):
+        end = min(start + chunk_size, n_points)
+        means = weights @ ys[:, start:end]
+        ci_low[start:end], ci_high[start:end] = np.quantile(means, [alpha / 2, 1 - alpha / 2], axis=0)
+
+    return ci_low, ci_high
+
+
+def aggregate_runs(xy_list, max_x=None, grid_step=DEFAULT_GRID_STEP, quantiles=DEFAULT_QUANTILES,
+                   n_bootstrap=DEFAULT_N_BOOTSTRAP, confidence=DEFAULT_CONFIDENCE, seed=None):
+    """
+    Computes the statistics of a group of runs on a common grid.
+
+    :param xy_list: ([(np.ndarray, np.ndarray)]) The x (increasing) and y values of each run, e.g. from ts2xy.
+    :param max_x: (float) End of the grid. It never goes beyond the last x of the shortest run.
+    :param grid_step: (float) Distance between the points of the grid.
+    :param quantiles: ([float]) Quantiles to compute.
+    :param n_bootstrap: (int) Number of bootstrap resamples for the confidence interval (0 to skip it).
+    :param confidence: (float) Confidence level of the interval.
+    :param seed: (int) Seed of the bootstrap resampling.
+    :return: (AggregateResult)
+    """
+    if len(xy_list) == 0:
+        raise ValueError("At least one run is needed.")
+
+    # Do not aggregate timesteps beyond the end of the shortest run
+    end = min(x[-1] for x, _ in xy_list)
+    if max_x is not None:
+        end = min(end, max_x)
+
+    x_grid = np.arange(0, end, grid_step)
+    ys = interpolate_runs(xy_list, x_grid)
+
+    quantile_values = np.quantile(ys, list(quantiles), axis=0) if len(quantiles) > 0 else []
+
+    if n_bootstrap > 0:
+        ci_low, ci_high = bootstrap_mean_ci(ys, n_bootstrap, confidence, seed)
+    else:
+        ci_low, ci_high = None, None
+
+    return AggregateResult(x=x_grid,
+                           end=end,
+                           ys=ys,
+                           mean=ys.mean(axis=0),
+                           median=np.median(ys, axis=0),
+                           quantiles=dict(zip(quantiles, quantile_values)),
+                           ci_low=ci_low,
+                           ci_high=ci_high,
+                           confidence=confidence)
@@ -0,0 +1,310 @@
+"""
+Throughput benchmark of the environments.
+
+Every environment is benchmarked as a single gym.Env and through the vectorized backends of training.py, with a random
+and a fixed action stream, measuring:
+    - steps (or resets) per second, as the best of several repeats, counting every slot of a vectorized environment;
+    - the memory allocated per step, as the peak traced by tracemalloc while a single step runs.
+
+The results can be saved as a JSON baseline, and later runs are compared against it: the benchmark exits with a
+non-zero code when the throughput of a case dropped by more than the threshold. Baselines are only comparable on the
+same machine.
+
+Usage:
+    python benchmark_envs.py --save-baseline
+    python benchmark_envs.py --threshold 0.1
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import training
+
+DEFAULT_BASELINE_PATH = os.path.join("benchmarks", "env_throughput.json")
+DEFAULT_NUM_STEPS = 20000
+DEFAULT_NUM_RESETS = 2000
+DEFAULT_ALLOCATION_STEPS = 500
+DEFAULT_REPEATS = 5
+DEFAULT_N_ENVS = 8
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_SEED = 0
+
+# 'single' steps a gym.Env directly, the others are the vectorized backends of training.py
+AVAILABLE_MODES = ['single'] + training.AVAILABLE_VEC_BACKENDS
+DEFAULT_MODES = ['single', 'dummy', 'native']
+
+ACTION_STREAMS = ['random', 'fixed']
+FIXED_ACTION = 1
+
+
+class Stepper:
+    """
+    Steps an environment in a benchmark loop, resetting it when needed.
+
+    :param environment: (str) One of training.AVAILABLE_ENVIRONMENTS.
+    :param mode: (str) One of AVAILABLE_MODES.
+    :param n_envs: (int) Number of environments of the vectorized modes.
+    """
+
+    def __init__(self, environment, mode, n_envs, seed=DEFAULT_SEED):
+        self.mode = mode
+
+        if mode == 'single':
+            self.env = training.make_env(environment)
+            self.num_envs = 1
+        elif mode == 'native':
+            self.env = training.make_native_vec_env(environment, n_envs)
+            self.num_envs = n_envs
+        else:
+            self.env = self._make_vec_env(environment, mode, n_envs)
+            self.num_envs = n_envs
+
+        self.env.seed(seed)
+        self.env.reset()
+
+        self.num_actions = self.env.action_space.n
+
+    @staticmethod
+    def _make_vec_env(environment, vec_backend, n_envs):
+        from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+        from envs.shm_vec_env import SharedMemoryVecEnv
+
+        env_fns = [functools.partial(training.make_env, environment) for _ in range(n_envs)]
+
+        if vec_backend == 'dummy':
+            return DummyVecEnv(env_fns)
+        elif vec_backend == 'subproc':
+            return SubprocVecEnv(env_fns)
+        elif vec_backend == 'shm':
+            return SharedMemoryVecEnv(env_fns)
+        else:
+            raise Exception("Vectorized environment backend '{}' is unknown.".format(vec_backend))
+
+    def actions(self, action_stream, num_calls, seed=DEFAULT_SEED):
+        """
+        :return: (list) The actions of num_calls calls to step(), drawn in advance so that drawing them is not timed.
+        """
+        shape = (num_calls,) if self.mode == 'single' else (num_calls, self.num_envs)
+
+        if action_stream == 'random':
+            actions = np.random.RandomState(seed).randint(0, self.num_actions, size=shape)
+        elif action_stream == 'fixed':
+            actions = np.full(shape, FIXED_ACTION)
+        else:
+            raise Exception("Action stream '{}' is unknown.".format(action_stream))
+
+        # A gym.Env gets plain ints, like the ones an agent loop would pass
+        return actions.tolist() if self.mode == 'single' else list(actions)
+
+    def step(self, action):
+        if self.mode == 'single':
+            _, _, done, _ = self.env.step(action)
+            if done:
+                self.env.reset()
+        else:
+            # Vectorized environments reset finished slots by themselves
+            self.env.step(action)
+
+    def reset(self):
+        self.env.reset()
+
+    def close(self):
+        self.env.close()
+
+
+def time_calls(function, arguments, repeats):
+    """
+    :return: (float) The best time, in seconds, of calling function once with each argument, over several repeats.
+    """
+    best_time = float('inf')
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for argument in arguments:
+            function(argument)
+        best_time = min(best_time, time.perf_counter() - start_time)
+
+    return best_time
+
+
+def allocated_bytes_per_call(function, arguments):
+    """
+    :return: (float) The average peak memory, in bytes, allocated while a single call to function runs.
+    """
+    total_bytes = 0
+
+    tracemalloc.start()
+    try:
+        for argument in arguments:
+            # Also resets the peak
+            tracemalloc.clear_traces()
+            function(argument)
+            total_bytes += tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return total_bytes / len(arguments)
+
+
+def benchmark_case(environment, mode, n_envs=DEFAULT_N_ENVS, num_steps=DEFAULT_NUM_STEPS,
+                   num_resets=DEFAULT_NUM_RESETS, allocation_steps=DEFAULT_ALLOCATION_STEPS, repeats=DEFAULT_REPEATS,
+                   seed=DEFAULT_SEED):
+    """
+    Benchmarks reset and step (with every action stream) of an environment in a mode.
+
+    :param num_steps: (int) Number of environment steps timed in each repeat, counting every slot of a vectorized
+        environment.
+    :return: ({str: dict}) The results of each case, by name ('<environment>/<mode>/<reset or action stream>').
+    """
+    stepper = Stepper(environment, mode, n_envs, seed)
+    results = {}
+
+    try:
+        num_calls = max(1, num_steps // stepper.num_envs)
+        num_reset_calls = max(1, num_resets // stepper.num_envs)
+
+        for action_stream in ACTION_STREAMS:
+            actions = stepper.actions(action_stream, num_calls, seed)
+
+            # Warm up, so that first-call costs (e.g. lazy imports and caches) are not timed
+            time_calls(stepper.step, actions[:min(num_calls, 100)], 1)
+
+            elapsed_time = time_calls(stepper.step, actions, repeats)
+            allocated_bytes = allocated_bytes_per_call(stepper.step, actions[:allocation_steps])
+
+            results["{}/{}/{}".format(environment, mode, action_stream)] = {
+                'steps_per_second': num_calls * stepper.num_envs / elapsed_time,
+                'allocated_bytes_per_step': allocated_bytes / stepper.num_envs,
+            }
+
+        def reset(_):
+            stepper.reset()
+
+        calls = [None] * num_reset_calls
+        elapsed_time = time_calls(reset, calls, repeats)
+        allocated_bytes = allocated_bytes_per_call(reset, calls[:allocation_steps])
+
+        results["{}/{}/reset".format(environment, mode)] = {
+            'steps_per_second': num_reset_calls * stepper.num_envs / elapsed_time,
+            'allocated_bytes_per_step': allocated_bytes / stepper.num_envs,
+        }
+    finally:
+        stepper.close()
+
+    return results
+
+
+def run_benchmarks(environments, modes, **kwargs):
+    """
+    :return: (dict) The results of every case, with a description of the machine, ready to be saved as a baseline.
+    """
+    results = {}
+
+    for environment in environments:
+        for mode in modes:
+            if mode not in AVAILABLE_MODES:
+                raise Exception("Mode '{}' is unknown.".format(mode))
+            results.update(benchmark_case(environment, mode, **kwargs))
+
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+        },
+        'settings': kwargs,
+        'results': results,
+    }
+
+
+def compare_with_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    :param threshold: (float) Largest accepted relative drop of the throughput of a case.
+    :return: ([str]) The names of the cases whose throughput dropped by more than the threshold.
+    """
+    regressions = []
+
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+
+        ratio = result['steps_per_second'] / baseline['results'][name]['steps_per_second']
+        result['baseline_ratio'] = ratio
+
+        if ratio < 1 - threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def print_report(report, regressions=()):
+    print("{:<32} {:>14} {:>14} {:>10}".format("case", "steps/s", "bytes/step", "vs base"))
+
+    for name, result in sorted(report['results'].items()):
+        ratio = result.get('baseline_ratio')
+        print("{:<32} {:>14,.0f} {:>14,.1f} {:>10} {}".format(
+            name, result['steps_per_second'], result['allocated_bytes_per_step'],
+            "-" if ratio is None else "{:.2f}x".format(ratio), "REGRESSION" if name in regressions else ""))
+
+
+def load_baseline(filename):
+    with open(filename) as file_handler:
+        return json.load(file_handler)
+
+
+def save_baseline(report, filename):
+    training.create_dir(filename)
+    with open(filename, 'w') as file_handler:
+        json.dump(report, file_handler, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the throughput of the environments.')
+    parser.add_argument('--environments', nargs='+', choices=training.AVAILABLE_ENVIRONMENTS,
+                        default=training.AVAILABLE_ENVIRONMENTS, help='Environments to benchmark (default: all)')
+    parser.add_argument('--modes', nargs='+', choices=AVAILABLE_MODES, default=DEFAULT_MODES,
+                        help='How the environments are stepped (default: {})'.format(" ".join(DEFAULT_MODES)))
+    parser.add_argument('--n-envs', type=int, default=DEFAULT_N_ENVS,
+                        help='Number of environments of the vectorized modes (default: {})'.format(DEFAULT_N_ENVS))
+    parser.add_argument('--steps', type=int, default=DEFAULT_NUM_STEPS,
+                        help='Number of steps timed in each repeat (default: {})'.format(DEFAULT_NUM_STEPS))
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS,
+                        help='Number of repeats, of which the best is kept (default: {})'.format(DEFAULT_REPEATS))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH,
+                        help='Baseline JSON file (default: {})'.format(DEFAULT_BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save the results as the new baseline instead of comparing with it')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative throughput drop reported as a regression (default: {})'.format(
+                            DEFAULT_THRESHOLD))
+
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.environments, args.modes, n_envs=args.n_envs, num_steps=args.steps,
+                            repeats=args.repeats)
+
+    regressions = []
+
+    if args.save_baseline:
+        save_baseline(report, args.baseline)
+        print_report(report)
+        print("Saved baseline in: {}".format(args.baseline))
+    elif os.path.isfile(args.baseline):
+        regressions = compare_with_baseline(report, load_baseline(args.baseline), args.threshold)
+        print_report(report, regressions)
+    else:
+        print_report(report)
+        print("No baseline in {}. Run with --save-baseline to create it.".format(args.baseline))
+
+    if regressions:
+        print("Throughput dropped by more than {:.0%} in: {}".format(args.threshold, ", ".join(regressions)))
+        sys.exit(1)
@@ -0,0 +1,183 @@
+"""
+Callbacks for model.learn, which stable-baselines calls as callback(locals, globals) after every update (every step
+for DQN), stopping the training when one returns False.
+
+RewardThresholdStopping ends a run once the task is solved, and CheckpointCallback saves the model periodically, so
+that training.train can resume a run from its latest checkpoint.
+"""
+
+import os
+import re
+from collections import deque
+
+DEFAULT_REWARD_WINDOW = 20  # episodes
+DEFAULT_PATIENCE = 50  # episodes
+DEFAULT_CHECK_FREQ = 1000  # timesteps
+DEFAULT_KEEP_CHECKPOINTS = 3
+
+CHECKPOINT_DIR_NAME = 'checkpoints'
+CHECKPOINT_PREFIX = 'checkpoint-'
+
+# Checkpoints are named after the number of timesteps of the model. stable-baselines may add an extension when saving
+CHECKPOINT_NAME_PATTERN = re.compile(r'^' + CHECKPOINT_PREFIX + r'(\d+)(\.zip|\.pkl)?$')
+
+
+class CallbackList:
+    """
+    Calls several callbacks, stopping the training if any of them returns False.
+    """
+
+    def __init__(self, callbacks):
+        self.callbacks = callbacks
+
+    def __call__(self, locals_, globals_):
+        # Every callback is called, even after one of them asks to stop (e.g. so that a checkpoint is still saved)
+        results = [callback(locals_, globals_) for callback in self.callbacks]
+        return False not in results
+
+
+class EpisodeRewardReader:
+    """
+    Reads the rewards of the episodes finished since the last read, from the Monitor of every environment of a
+    vectorized environment (or from a VecMonitor).
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.num_read = None
+
+    def read(self):
+        if hasattr(self.env, 'get_episode_rewards'):
+            rewards_per_env = [self.env.get_episode_rewards()]
+        else:
+            rewards_per_env = self.env.env_method('get_episode_rewards')
+
+        if self.num_read is None:
+            self.num_read = [0] * len(rewards_per_env)
+
+        new_rewards = []
+        for i, rewards in enumerate(rewards_per_env):
+            new_rewards.extend(rewards[self.num_read[i]:])
+            self.num_read[i] = len(rewards)
+
+        return new_rewards
+
+
+class RewardThresholdStopping:
+    """
+    Stops the training once the moving average of the episode rewards has been at least reward_threshold for patience
+    consecutive episodes.
+
+    :param env: (VecEnv) The environment being trained on, whose environments are wrapped in Monitors.
+    :param reward_threshold: (float) Average reward at which the task is considered solved.
+    :param window: (int) Number of episodes of the moving average. It is only checked once it has that many.
+    :param patience: (int) Number of consecutive episodes for which the average must stay above the threshold.
+    :param check_freq: (int) Minimum number of timesteps between two reads of the episodes.
+    """
+
+    def __init__(self, env, reward_threshold, window=DEFAULT_REWARD_WINDOW, patience=DEFAULT_PATIENCE,
+                 check_freq=DEFAULT_CHECK_FREQ):
+        self.reader = EpisodeRewardReader(env)
+        self.reward_threshold = reward_threshold
+        self.window = window
+        self.patience = patience
+        self.check_freq = check_freq
+
+        self.recent_rewards = deque()
+        self.recent_sum = 0.0
+        self.num_episodes_solved = 0
+        self.last_check_timestep = None
+
+        # Number of timesteps of the model when the training was stopped, if it was
+        self.stopped_at_timestep = None
+
+    def __call__(self, locals_, globals_):
+        num_timesteps = locals_['self'].num_timesteps
+
+        if self.last_check_timestep is not None and num_timesteps - self.last_check_timestep < self.check_freq:
+            return True
+        self.last_check_timestep = num_timesteps
+
+        for reward in self.reader.read():
+            self.recent_rewards.append(reward)
+            self.recent_sum += reward
+            if len(self.recent_rewards) > self.window:
+                self.recent_sum -= self.recent_rewards.popleft()
+
+            if len(self.recent_rewards) == self.window and self.recent_sum / self.window >= self.reward_threshold:
+                self.num_episodes_solved += 1
+            else:
+                self.num_episodes_solved = 0
+
+        if self.num_episodes_solved >= self.patience:
+            self.stopped_at_timestep = num_timesteps
+            print("Stopping: the average reward of the last {} episodes has been at least {} for {} episodes.".format(
+                self.window, self.reward_threshold, self.num_episodes_solved))
+            return False
+
+        return True
+
+
+class CheckpointCallback:
+    """
+    Saves the model every save_freq timesteps, keeping only the latest checkpoints.
+
+    :param checkpoint_dir: (str) Directory of the checkpoints.
+    :param save_freq: (int) Number of timesteps between two checkpoints.
+    :param keep_checkpoints: (int) Number of checkpoints kept, at least 1 (None to keep all of them).
+    """
+
+    def __init__(self, checkpoint_dir, save_freq, keep_checkpoints=DEFAULT_KEEP_CHECKPOINTS):
+        # The latest checkpoint is the one a run resumes from, so it is always kept
+        if keep_checkpoints is not None and keep_checkpoints < 1:
+            raise Exception("At least 1 checkpoint must be kept, not {}.".format(keep_checkpoints))
+
+        self.checkpoint_dir = checkpoint_dir
+        self.save_freq = save_freq
+        self.keep_checkpoints = keep_checkpoints
+        self.last_save_timestep = None
+
+    def __call__(self, locals_, globals_):
+        model = locals_['self']
+
+        if self.last_save_timestep is None:
+            # Do not save again the checkpoint the training may have resumed from
+            self.last_save_timestep = model.num_timesteps
+
+        if model.num_timesteps - self.last_save_timestep >= self.save_freq:
+            self.save(model)
+
+        return True
+
+    def save(self, model):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        model.save(os.path.join(self.checkpoint_dir, "{}{:010d}".format(CHECKPOINT_PREFIX, model.num_timesteps)))
+        self.last_save_timestep = model.num_timesteps
+
+        if self.keep_checkpoints is not None:
+            for _, filename in list_checkpoints(self.checkpoint_dir)[:-self.keep_checkpoints]:
+                os.remove(filename)
+
+
+def list_checkpoints(checkpoint_dir):
+    """
+    :return: ([(int, str)]) The number of timesteps and file of every checkpoint in a directory, oldest first.
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return []
+
+    checkpoints = []
+    for name in os.listdir(checkpoint_dir):
+        match = CHECKPOINT_NAME_PATTERN.match(name)
+        if match is not None:
+            checkpoints.append((int(match.group(1)), os.path.join(checkpoint_dir, name)))
+
+    return sorted(checkpoints)
+
+
+def latest_checkpoint(checkpoint_dir):
+    """
+    :return: (int, str) The number of timesteps and file of the latest checkpoint in a directory, or (None, None).
+    """
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1] if checkpoints else (None, None)
@@ -0,0 +1,220 @@
+"""
+SQLite catalog of the training runs.
+
+Every call to training.train registers its run here, with its metadata, so that plotting, the sweep runner and the
+analysis scripts can look runs up by their attributes with indexed queries, instead of walking training_info/ and
+matching directory names.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_CATALOG_PATH = os.path.join("training_info", "catalog.sqlite")
+
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+# Names of the model saved at the end of a run, depending on the version of stable-baselines
+MODEL_FILE_NAMES = ("model", "model.zip", "model.pkl")
+
+COLUMNS = ('run_dir', 'environment', 'algorithm', 'timesteps', 'seed', 'n_envs', 'vec_backend', 'tag',
+           'start_time', 'end_time', 'status', 'model_path', 'log_dir', 'tensorboard_dir', 'timesteps_per_second',
+           'metadata')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_dir TEXT NOT NULL UNIQUE,
+    environment TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    timesteps INTEGER,
+    seed INTEGER,
+    n_envs INTEGER,
+    vec_backend TEXT,
+    tag TEXT,
+    start_time REAL,
+    end_time REAL,
+    status TEXT NOT NULL,
+    model_path TEXT,
+    log_dir TEXT,
+    tensorboard_dir TEXT,
+    timesteps_per_second REAL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_environment_algorithm ON runs (environment, algorithm, status);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+CREATE INDEX IF NOT EXISTS runs_tag ON runs (tag);
+"""
+
+
+def parse_run_name(run_name, algorithms, environments):
+    """
+    :return: (str, str) The algorithm and environment of a run directory name ('<time>-<algorithm>-<environment>'),
+        or (None, None) if it is not the name of a run.
+    """
+    parts = run_name.rsplit('-', 2)
+    if len(parts) != 3:
+        return None, None
+
+    _, algorithm, environment = parts
+    if algorithm not in algorithms or environment not in environments:
+        return None, None
+
+    return algorithm, environment
+
+
+class RunCatalog:
+    """
+    :param path: (str) The SQLite database file. It is created if it does not exist.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Several training processes may write at the same time, so they wait for each other's locks
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def register_run(self, run_dir, environment, algorithm, status=STATUS_RUNNING, **fields):
+        """
+        Adds a run to the catalog.
+
+        :param fields: Any other column of the runs table. 'metadata' may be a dict, which is stored as JSON.
+        :return: (int) The id of the run.
+        """
+        fields.update(run_dir=run_dir, environment=environment, algorithm=algorithm, status=status)
+        fields.setdefault('start_time', time.time())
+        fields.setdefault('log_dir', run_dir)
+        fields = self._encode(fields)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs ({}) VALUES ({})".format(", ".join(fields), ", ".join("?" * len(fields))),
+                list(fields.values()))
+
+        return cursor.lastrowid
+
+    def update_run(self, run_id, **fields):
+        """
+        Updates some columns of a run. If 'metadata' is a dict, it is merged into the metadata already stored.
+        """
+        if isinstance(fields.get('metadata'), dict):
+            metadata = self.get_run(run_id)['metadata']
+            metadata.update(fields['metadata'])
+            fields['metadata'] = metadata
+
+        fields = self._encode(fields)
+
+        with self.connection:
+            self.connection.execute(
+                "UPDATE runs SET {} WHERE id = ?".format(", ".join("{} = ?".format(name) for name in fields)),
+                list(fields.values()) + [run_id])
+
+    def get_run(self, run_id=None, run_dir=None):
+        """
+        :return: (dict) The run with the given id or directory, or None if there is none.
+        """
+        if run_id is not None:
+            row = self.connection.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        else:
+            row = self.connection.execute("SELECT * FROM runs WHERE run_dir = ?", (run_dir,)).fetchone()
+
+        return None if row is None else self._decode(row)
+
+    def find_runs(self, **conditions):
+        """
+        Finds the runs whose columns have the given values, e.g. find_runs(environment='cpa_dense', algorithm='ppo').
+
+        A condition with a list or tuple value matches any of its elements.
+
+        :return: ([dict]) The runs, in the order in which they started.
+        """
+        clauses = []
+        values = []
+
+        for name, value in conditions.items():
+            if name not in COLUMNS and name != 'id':
+                raise ValueError("Unknown column '{}'.".format(name))
+
+            if isinstance(value, (list, tuple)):
+                clauses.append("{} IN ({})".format(name, ", ".join("?" * len(value))))
+                values.extend(value)
+            else:
+                clauses.append("{} = ?".format(name))
+                values.append(value)
+
+        query = "SELECT * FROM runs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY start_time, id"
+
+        return [self._decode(row) for row in self.connection.execute(query, values)]
+
+    def index_existing_runs(self, training_info_dir, algorithms, environments):
+        """
+        Registers the run directories of training_info_dir that are not in the catalog yet (e.g. runs trained before
+        the catalog existed), as completed runs. Directories without a saved model are skipped, as they may belong to
+        runs that are starting.
+
+        :return: (int) Number of runs added.
+        """
+        num_added = 0
+
+        for entry in os.scandir(training_info_dir):
+            if not entry.is_dir():
+                continue
+
+            algorithm, environment = parse_run_name(entry.name, algorithms, environments)
+            if algorithm is None:
+                continue
+
+            if not any(os.path.isfile(os.path.join(entry.path, name)) for name in MODEL_FILE_NAMES):
+                continue
+
+            run_dir = entry.path + os.path.sep
+
+            with self.connection:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO runs (run_dir, environment, algorithm, status, start_time, log_dir) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (run_dir, environment, algorithm, STATUS_COMPLETED, entry.stat().st_mtime, run_dir))
+            num_added += cursor.rowcount
+
+        return num_added
+
+    @staticmethod
+    def _encode(fields):
+        if isinstance(fields.get('metadata'), dict):
+            fields['metadata'] = json.dumps(fields['metadata'])
+
+        for name in fields:
+            if name not in COLUMNS:
+                raise ValueError("Unknown column '{}'.".format(name))
+
+        return fields
+
+    @staticmethod
+    def _decode(row):
+        run = dict(row)
+        run['metadata'] = json.loads(run['metadata']) if run['metadata'] else {}
+        return run
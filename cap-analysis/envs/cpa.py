@@ -1,6 +1,31 @@
 import gym
+import numpy as np
 from gym import spaces
 
+# Number of observations drawn at once from the random generator
+OBSERVATION_BUFFER_SIZE = 4096
+
+
+def make_np_random(seed=None):
+    """
+    Creates the random generator of a CPA environment.
+
+    :param seed: (int or np.random.SeedSequence) The seed, or None for a random one.
+    :return: (np.random.Generator, int) The generator, and the entropy of its seed, from which it can be created again.
+    """
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return np.random.Generator(np.random.PCG64(seed_sequence)), seed_sequence.entropy
+
+
+def sample_observations(np_random, n, n_observations):
+    """
+    Draws n uniform observations in [0, n_observations).
+
+    They are computed from uniform floats, of which the generator draws exactly one per value, so the same seed gives
+    the same observations whether they are drawn one by one or in blocks of any size.
+    """
+    return np.floor(np_random.random(n) * n_observations).astype(np.int64)
+
 
 class CPAEnv(gym.Env):
     """Custom Environment that follows gym interface.
@@ -12,6 +37,9 @@ class CPAEnv(gym.Env):
     Every time it gets it right, it gets a positive reward.
 
     After getting it right a number of times, the episode ends.
+
+    :param buffer_size: (int) Number of observations drawn at once from the random generator. With 1 they are drawn
+        one by one, which gives the same observations.
     """
     metadata = {'render.modes': ['console']}
 
@@ -24,7 +52,7 @@ class CPAEnv(gym.Env):
     NEEDED_CORRECT_ANSWERS = 100
     MAX_NUM_STEPS = 3 * NEEDED_CORRECT_ANSWERS
 
-    def __init__(self):
+    def __init__(self, buffer_size=OBSERVATION_BUFFER_SIZE):
         super(CPAEnv, self).__init__()
         # Define action and observation space
         # They must be gym.spaces objects
@@ -41,6 +69,37 @@ class CPAEnv(gym.Env):
 
         self.current_step_num = None
 
+        self.buffer_size = buffer_size
+        self.observation_buffer = []
+        self.observation_buffer_index = 0
+
+        self.seed()
+
+    def seed(self, seed=None):
+        """
+        :param seed: (int or np.random.SeedSequence) The seed, or None for a random one. A vectorized environment can
+            give each of its environments a child of the same SeedSequence (see training.derive_worker_seeds).
+        :return: ([int]) The entropy of the seed.
+        """
+        self.np_random, seed = make_np_random(seed)
+
+        # Observations drawn with the previous seed are discarded
+        self.observation_buffer = []
+        self.observation_buffer_index = 0
+
+        return [seed]
+
+    def sample_observation(self):
+        if self.observation_buffer_index >= len(self.observation_buffer):
+            self.observation_buffer = sample_observations(self.np_random, self.buffer_size,
+                                                          self.N_DISCRETE_OBS).tolist()
+            self.observation_buffer_index = 0
+
+        observation = self.observation_buffer[self.observation_buffer_index]
+        self.observation_buffer_index += 1
+
+        return observation
+
     def step(self, action):
         pass
 
@@ -50,7 +109,7 @@ class CPAEnv(gym.Env):
         self.current_step_num = 0
 
         # Current number if randomly decided from the observation space
-        self.current_observation = self.observation_space.sample()
+        self.current_observation = self.sample_observation()
         observation = self.current_observation
 
         return observation  # reward, done, info can't be included
@@ -99,7 +158,7 @@ class CPAEnvDense(CPAEnv):
 
         # Save previous observation and generate new one
         self.last_observation = self.current_observation
-        self.current_observation = self.observation_space.sample()
+        self.current_observation = self.sample_observation()
         observation = self.current_observation
 
         self.last_action = action
@@ -128,7 +187,7 @@ class CPAEnvSparse(CPAEnv):
 
         # Save previous observation and generate new one
         self.last_observation = self.current_observation
-        self.current_observation = self.observation_space.sample()
+        self.current_observation = self.sample_observation()
         observation = self.current_observation
 
         self.last_action = action
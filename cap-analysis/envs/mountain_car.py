@@ -32,6 +32,7 @@ class MountainCarEnv(gym.Env):
         self.high = np.array([self.max_position, self.max_speed])
 
         self.viewer = None
+        self.renderer = None
 
         self.action_space = spaces.Discrete(3)
         self.observation_space = spaces.Box(self.low, self.high, dtype=np.float32)
@@ -53,6 +54,13 @@ class MountainCarEnv(gym.Env):
         return np.sin(3 * xs) * .45 + .55
 
     def render(self, mode='human'):
+        if mode == 'rgb_array':
+            # Drawn without pyglet, so that frames can be recorded on machines without a display
+            if self.renderer is None:
+                from envs.mountain_car_render import MountainCarRenderer
+                self.renderer = MountainCarRenderer(self.min_position, self.max_position, self.goal_position)
+            return self.renderer.render(self.state[0])
+
         screen_width = 600
         screen_height = 400
 
@@ -103,7 +111,7 @@ class MountainCarEnv(gym.Env):
         self.cartrans.set_translation((pos - self.min_position) * scale, self._height(pos) * scale)
         self.cartrans.set_rotation(math.cos(3 * pos))
 
-        return self.viewer.render(return_rgb_array=mode == 'rgb_array')
+        return self.viewer.render()
 
     def get_keys_to_action(self):
         return {(): 1, (276,): 0, (275,): 2, (275, 276): 1}  # control with left and right arrow keys
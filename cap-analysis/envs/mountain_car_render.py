@@ -0,0 +1,202 @@
+"""
+Software renderer of the MountainCar environments, in pure NumPy.
+
+It draws the same picture as MountainCarEnv.render (track, car, wheels and flag) into rgb_array frames, without pyglet
+or a display. The track and the flag do not change, so they are rasterized once: every frame is a copy of that static
+layer, on which only the pixels around the car are computed. Frames of many positions (e.g. a whole episode) can be
+rendered at once, with the car sprites of all of them computed in the same array operations.
+"""
+
+import numpy as np
+
+SCREEN_WIDTH = 600
+SCREEN_HEIGHT = 400
+
+CAR_WIDTH = 40
+CAR_HEIGHT = 20
+CLEARANCE = 10
+WHEEL_RADIUS = CAR_HEIGHT / 2.5
+TRACK_LINE_WIDTH = 4
+TRACK_NUM_POINTS = 100
+FLAG_HEIGHT = 50
+
+BACKGROUND_COLOR = (255, 255, 255)
+TRACK_COLOR = (0, 0, 0)
+CAR_COLOR = (0, 0, 0)
+WHEEL_COLOR = (128, 128, 128)
+FLAG_POLE_COLOR = (0, 0, 0)
+FLAG_COLOR = (204, 204, 0)
+
+# Number of frames rendered at once by iter_frames
+DEFAULT_CHUNK_SIZE = 32
+
+# Half of the side of the square around the car where its sprite is drawn, large enough for any rotation
+SPRITE_HALF_SIZE = int(np.ceil(np.hypot(CAR_WIDTH / 2, CLEARANCE + CAR_HEIGHT))) + 2
+
+
+def _segment_distances(px, py, x1, y1, x2, y2):
+    """
+    :return: (np.ndarray) The distance of every point (px, py) to the segment from (x1, y1) to (x2, y2).
+    """
+    dx, dy = x2 - x1, y2 - y1
+    fraction = np.clip(((px - x1) * dx + (py - y1) * dy) / (dx * dx + dy * dy), 0, 1)
+    return np.hypot(px - (x1 + fraction * dx), py - (y1 + fraction * dy))
+
+
+def _inside_triangle(px, py, vertices):
+    """
+    :return: (np.ndarray) Whether every point (px, py) is inside the triangle, whatever the order of its vertices.
+    """
+    signs = []
+    for (x1, y1), (x2, y2) in zip(vertices, vertices[1:] + vertices[:1]):
+        signs.append((x2 - x1) * (py - y1) - (y2 - y1) * (px - x1))
+    signs = np.stack(signs)
+    return (signs >= 0).all(axis=0) | (signs <= 0).all(axis=0)
+
+
+class MountainCarRenderer:
+    """
+    :param min_position: (float) Left end of the track, as in MountainCarEnv.
+    :param max_position: (float) Right end of the track.
+    :param goal_position: (float) Position of the flag.
+    """
+
+    def __init__(self, min_position=-1.2, max_position=0.6, goal_position=0.5):
+        self.min_position = min_position
+        self.max_position = max_position
+        self.goal_position = goal_position
+
+        self.scale = SCREEN_WIDTH / (max_position - min_position)
+
+        # Coordinates of the center of every pixel, with the origin at the bottom left corner like in pyglet
+        self.pixel_x = np.arange(SCREEN_WIDTH) + 0.5
+        self.pixel_y = SCREEN_HEIGHT - np.arange(SCREEN_HEIGHT) - 0.5
+
+        self.background = self._draw_background()
+        self.foreground_pixels, self.foreground_colors = self._draw_foreground()
+
+    @staticmethod
+    def _height(xs):
+        return np.sin(3 * xs) * .45 + .55
+
+    def _draw_background(self):
+        """
+        :return: (np.ndarray) The track.
+        """
+        image = np.empty((SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+        image[:] = BACKGROUND_COLOR
+
+        px, py = np.meshgrid(self.pixel_x, self.pixel_y)
+
+        xs = np.linspace(self.min_position, self.max_position, TRACK_NUM_POINTS)
+        track_x = (xs - self.min_position) * self.scale
+        track_y = self._height(xs) * self.scale
+
+        on_track = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH), dtype=np.bool_)
+        for i in range(TRACK_NUM_POINTS - 1):
+            on_track |= _segment_distances(px, py, track_x[i], track_y[i], track_x[i + 1],
+                                           track_y[i + 1]) <= TRACK_LINE_WIDTH / 2
+        image[on_track] = TRACK_COLOR
+
+        return image
+
+    def _draw_foreground(self):
+        """
+        :return: (tuple, np.ndarray) The indices and colors of the pixels of the flag, which is drawn over the car.
+        """
+        image = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+        drawn = np.zeros((SCREEN_HEIGHT, SCREEN_WIDTH), dtype=np.bool_)
+
+        px, py = np.meshgrid(self.pixel_x, self.pixel_y)
+
+        flag_x = (self.goal_position - self.min_position) * self.scale
+        flag_y1 = self._height(self.goal_position) * self.scale
+        flag_y2 = flag_y1 + FLAG_HEIGHT
+
+        pole = _segment_distances(px, py, flag_x, flag_y1, flag_x, flag_y2) <= 0.5
+        image[pole] = FLAG_POLE_COLOR
+        drawn |= pole
+
+        flag = _inside_triangle(px, py, [(flag_x, flag_y2), (flag_x, flag_y2 - 10), (flag_x + 25, flag_y2 - 5)])
+        image[flag] = FLAG_COLOR
+        drawn |= flag
+
+        pixels = np.nonzero(drawn)
+        return pixels, image[pixels]
+
+    def render(self, position):
+        """
+        :param position: (float) Position of the car.
+        :return: (np.ndarray) The frame, of shape (SCREEN_HEIGHT, SCREEN_WIDTH, 3) and type uint8.
+        """
+        return self.render_batch(np.array([position]))[0]
+
+    def render_batch(self, positions, out=None):
+        """
+        Renders the frames of many positions at once.
+
+        Each frame takes SCREEN_HEIGHT * SCREEN_WIDTH * 3 bytes, so long episodes are best rendered in chunks of a few
+        dozen frames (see iter_frames), reusing the same output array.
+
+        :param positions: (np.ndarray) Positions of the car.
+        :param out: (np.ndarray) Array where the frames are written, instead of a new one.
+        :return: (np.ndarray) The frames, of shape (len(positions), SCREEN_HEIGHT, SCREEN_WIDTH, 3) and type uint8.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1)
+        num_frames = len(positions)
+
+        if out is None:
+            frames = np.empty((num_frames, SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+        else:
+            frames = out[:num_frames]
+        frames[:] = self.background
+
+        # Position and rotation of the car in every frame
+        car_x = (positions - self.min_position) * self.scale
+        car_y = self._height(positions) * self.scale
+        angle = np.cos(3 * positions)
+
+        # Pixels of the square around the car in every frame, shape (num_frames, side, side)
+        offsets = np.arange(-SPRITE_HALF_SIZE, SPRITE_HALF_SIZE + 1)
+        columns = np.floor(car_x).astype(np.int64)[:, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+        rows = (SCREEN_HEIGHT - 1 - np.floor(car_y).astype(np.int64))[:, np.newaxis, np.newaxis] + \
+            offsets[np.newaxis, :, np.newaxis]
+        columns, rows = np.broadcast_arrays(columns, rows)
+
+        # Pixel centers in the frame of the car
+        dx = columns + 0.5 - car_x[:, np.newaxis, np.newaxis]
+        dy = SCREEN_HEIGHT - rows - 0.5 - car_y[:, np.newaxis, np.newaxis]
+        cos = np.cos(angle)[:, np.newaxis, np.newaxis]
+        sin = np.sin(angle)[:, np.newaxis, np.newaxis]
+        local_x = cos * dx + sin * dy
+        local_y = -sin * dx + cos * dy
+
+        in_screen = (columns >= 0) & (columns < SCREEN_WIDTH) & (rows >= 0) & (rows < SCREEN_HEIGHT)
+        frame_indices = np.broadcast_to(np.arange(num_frames)[:, np.newaxis, np.newaxis], columns.shape)
+
+        body = (np.abs(local_x) <= CAR_WIDTH / 2) & (local_y >= CLEARANCE) & (local_y <= CLEARANCE + CAR_HEIGHT)
+        wheels = (np.hypot(np.abs(local_x) - CAR_WIDTH / 4, local_y - CLEARANCE) <= WHEEL_RADIUS)
+
+        # The wheels are drawn over the body, like in MountainCarEnv.render
+        for mask, color in ((body, CAR_COLOR), (wheels, WHEEL_COLOR)):
+            mask = mask & in_screen
+            frames[frame_indices[mask], rows[mask], columns[mask]] = color
+
+        rows, columns = self.foreground_pixels
+        frames[:, rows, columns] = self.foreground_colors
+
+        return frames
+
+    def iter_frames(self, positions, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Renders the frames of many positions (e.g. a whole episode) chunk by chunk, reusing the same buffer.
+
+        :return: (iterator of np.ndarray) Every frame. A frame is overwritten when the next chunk is rendered, so it must
+            be copied to be kept.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1)
+        buffer = np.empty((min(chunk_size, len(positions)), SCREEN_HEIGHT, SCREEN_WIDTH, 3), dtype=np.uint8)
+
+        for start in range(0, len(positions), chunk_size):
+            for frame in self.render_batch(positions[start:start + chunk_size], out=buffer):
+                yield frame
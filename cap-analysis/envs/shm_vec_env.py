@@ -0,0 +1,245 @@
+"""
+Multi-process VecEnv whose workers exchange observations, rewards, dones and actions through shared memory.
+
+SubprocVecEnv sends every observation through a pipe, pickling it on the way. Here, each worker writes the results of
+its environments straight into NumPy arrays backed by shared memory, and the pipes only carry short commands and the
+(usually empty) info dicts.
+"""
+
+import ctypes
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+
+from gym import spaces
+from stable_baselines.common.vec_env import VecEnv
+from stable_baselines.common.vec_env.base_vec_env import CloudpickleWrapper
+
+
+def _shared_array(context, shape, dtype):
+    dtype = np.dtype(dtype)
+    raw_array = context.RawArray(ctypes.c_byte, int(np.prod(shape)) * dtype.itemsize)
+    return raw_array, shape, dtype
+
+
+def _as_numpy(shared_array):
+    raw_array, shape, dtype = shared_array
+    return np.frombuffer(raw_array, dtype=dtype).reshape(shape)
+
+
+def _worker(remote, parent_remote, env_fns_wrapper, start, shared_arrays):
+    parent_remote.close()
+
+    envs = [env_fn() for env_fn in env_fns_wrapper.var]
+    end = start + len(envs)
+
+    buffers = {name: _as_numpy(shared_array)[start:end] for name, shared_array in shared_arrays.items()}
+    observations = buffers['observations']
+    terminal_observations = buffers['terminal_observations']
+    rewards = buffers['rewards']
+    dones = buffers['dones']
+    actions = buffers['actions']
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+
+            if cmd == 'step':
+                infos = None
+
+                for i, env in enumerate(envs):
+                    observation, reward, done, info = env.step(actions[i])
+
+                    if done:
+                        terminal_observations[i] = observation
+                        observation = env.reset()
+
+                    observations[i] = observation
+                    rewards[i] = reward
+                    dones[i] = done
+
+                    # Most steps have no info at all, so only the ones that do are sent back
+                    if info:
+                        if infos is None:
+                            infos = {}
+                        infos[i] = info
+
+                remote.send(infos)
+            elif cmd == 'reset':
+                for i, env in enumerate(envs):
+                    observations[i] = env.reset()
+                remote.send(None)
+            elif cmd == 'close':
+                for env in envs:
+                    env.close()
+                remote.close()
+                break
+            elif cmd == 'seed':
+                remote.send([env.seed(None if data is None else data + i) for i, env in enumerate(envs)])
+            elif cmd == 'get_spaces':
+                remote.send((envs[0].observation_space, envs[0].action_space))
+            elif cmd == 'env_method':
+                indices, method_name, method_args, method_kwargs = data
+                remote.send([getattr(envs[i], method_name)(*method_args, **method_kwargs) for i in indices])
+            elif cmd == 'get_attr':
+                indices, attr_name = data
+                remote.send([getattr(envs[i], attr_name) for i in indices])
+            elif cmd == 'set_attr':
+                indices, attr_name, value = data
+                remote.send([setattr(envs[i], attr_name, value) for i in indices])
+            else:
+                raise NotImplementedError
+        except EOFError:
+            break
+
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Runs the environments in worker processes, each one stepping a contiguous chunk of them, and shares the step
+    results with the main process through shared-memory NumPy buffers.
+
+    :param env_fns: ([callable]) The functions that create each environment.
+    :param n_workers: (int) Number of worker processes (default: one per CPU, at most one per environment).
+    :param start_method: (str) Method used to start the workers (default: 'forkserver' if available, else 'spawn').
+    """
+
+    def __init__(self, env_fns, n_workers=None, start_method=None):
+        self.waiting = False
+        self.closed = False
+
+        n_envs = len(env_fns)
+
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        n_workers = max(1, min(n_workers, n_envs))
+
+        if start_method is None:
+            # Fork is not a thread safe method (see issue #217 of stable-baselines)
+            forkserver_available = 'forkserver' in multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if forkserver_available else 'spawn'
+        context = multiprocessing.get_context(start_method)
+
+        # The spaces are needed to size the buffers, so they are read from a throwaway instance of the environment
+        probe_env = env_fns[0]()
+        observation_space, action_space = probe_env.observation_space, probe_env.action_space
+        probe_env.close()
+
+        VecEnv.__init__(self, n_envs, observation_space, action_space)
+
+        if isinstance(action_space, spaces.Discrete):
+            action_shape, action_dtype = (), np.int64
+        else:
+            action_shape, action_dtype = action_space.shape, action_space.dtype
+
+        self.shared_arrays = OrderedDict([
+            ('observations', _shared_array(context, (n_envs,) + observation_space.shape, observation_space.dtype)),
+            ('terminal_observations', _shared_array(context, (n_envs,) + observation_space.shape,
+                                                    observation_space.dtype)),
+            ('rewards', _shared_array(context, (n_envs,), np.float32)),
+            ('dones', _shared_array(context, (n_envs,), np.bool_)),
+            ('actions', _shared_array(context, (n_envs,) + action_shape, action_dtype)),
+        ])
+
+        self.buf_obs = _as_numpy(self.shared_arrays['observations'])
+        self.buf_terminal_obs = _as_numpy(self.shared_arrays['terminal_observations'])
+        self.buf_rews = _as_numpy(self.shared_arrays['rewards'])
+        self.buf_dones = _as_numpy(self.shared_arrays['dones'])
+        self.buf_actions = _as_numpy(self.shared_arrays['actions'])
+
+        # Split the environments in contiguous chunks, one per worker
+        chunks = np.array_split(np.arange(n_envs), n_workers)
+        self.worker_starts = [int(chunk[0]) for chunk in chunks]
+        self.worker_sizes = [len(chunk) for chunk in chunks]
+
+        self.remotes, self.work_remotes = zip(*[context.Pipe() for _ in range(n_workers)])
+        self.processes = []
+
+        for work_remote, remote, chunk in zip(self.work_remotes, self.remotes, chunks):
+            chunk_env_fns = CloudpickleWrapper([env_fns[i] for i in chunk])
+            args = (work_remote, remote, chunk_env_fns, int(chunk[0]), self.shared_arrays)
+            # daemon=True: if the main process crashes, we should not cause things to hang
+            process = context.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+    def step_async(self, actions):
+        self.buf_actions[:] = np.asarray(actions).reshape(self.buf_actions.shape)
+
+        for remote in self.remotes:
+            remote.send(('step', None))
+        self.waiting = True
+
+    def step_wait(self):
+        infos = [{} for _ in range(self.num_envs)]
+
+        for start, remote in zip(self.worker_starts, self.remotes):
+            worker_infos = remote.recv()
+            if worker_infos is not None:
+                for i, info in worker_infos.items():
+                    infos[start + i] = info
+        self.waiting = False
+
+        for i in np.flatnonzero(self.buf_dones):
+            infos[i]['terminal_observation'] = self.buf_terminal_obs[i].copy()
+
+        return np.copy(self.buf_obs), np.copy(self.buf_rews), np.copy(self.buf_dones), infos
+
+    def seed(self, seed=None):
+        for start, remote in zip(self.worker_starts, self.remotes):
+            remote.send(('seed', None if seed is None else seed + start))
+        return [env_seed for remote in self.remotes for env_seed in remote.recv()]
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        for remote in self.remotes:
+            remote.recv()
+        return np.copy(self.buf_obs)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        elif isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def _send_to_owners(self, indices, make_command):
+        """
+        Sends a command to each worker that owns one of the indices, and returns their answers in order.
+
+        :param make_command: (callable) Creates the command, given the indices local to the worker.
+        """
+        indices = list(self._get_indices(indices))
+        targets = []
+
+        for start, size, remote in zip(self.worker_starts, self.worker_sizes, self.remotes):
+            local_indices = [i - start for i in indices if start <= i < start + size]
+            if local_indices:
+                remote.send(make_command(local_indices))
+                targets.append(remote)
+
+        return [result for remote in targets for result in remote.recv()]
+
+    def get_attr(self, attr_name, indices=None):
+        return self._send_to_owners(indices, lambda local: ('get_attr', (local, attr_name)))
+
+    def set_attr(self, attr_name, value, indices=None):
+        self._send_to_owners(indices, lambda local: ('set_attr', (local, attr_name, value)))
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return self._send_to_owners(indices,
+                                    lambda local: ('env_method', (local, method_name, method_args, method_kwargs)))
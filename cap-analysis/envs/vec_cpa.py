@@ -0,0 +1,140 @@
+"""
+Vectorized version of the CPA environments in cpa.py.
+
+Score, step count and current observation of every episode are kept in NumPy arrays, and the parity of the whole
+action vector is checked at once.
+"""
+
+from types import MappingProxyType
+
+import numpy as np
+
+from gym import spaces
+from stable_baselines.common.vec_env import VecEnv
+
+from envs.cpa import CPAEnv, make_np_random, sample_observations
+
+# Shared by every slot that did not finish its episode in a step, so that no dict has to be created for it.
+# It is read-only, so a wrapper that tries to add keys to it fails loudly instead of leaking them to other slots.
+NO_INFO = MappingProxyType({})
+
+
+class CPAVecEnv(VecEnv):
+    """
+    Native vectorized CPA environment that follows the stable-baselines VecEnv interface.
+
+    Episodes end in the same conditions as CPAEnv's subclasses, and finished slots are reset automatically, with their
+    last observation stored in the info dict under 'terminal_observation', like DummyVecEnv does.
+    """
+    metadata = {'render.modes': []}
+
+    N_DISCRETE_ACTIONS = CPAEnv.N_DISCRETE_ACTIONS
+    EVEN = CPAEnv.EVEN
+    ODD = CPAEnv.ODD
+
+    N_DISCRETE_OBS = CPAEnv.N_DISCRETE_OBS
+
+    NEEDED_CORRECT_ANSWERS = CPAEnv.NEEDED_CORRECT_ANSWERS
+    MAX_NUM_STEPS = CPAEnv.MAX_NUM_STEPS
+
+    def __init__(self, num_envs):
+        action_space = spaces.Discrete(self.N_DISCRETE_ACTIONS)
+        observation_space = spaces.Discrete(self.N_DISCRETE_OBS)
+
+        super(CPAVecEnv, self).__init__(num_envs, observation_space, action_space)
+
+        self.current_score = np.zeros(num_envs, dtype=np.int64)
+        self.current_step_num = np.zeros(num_envs, dtype=np.int64)
+        self.current_observation = np.zeros(num_envs, dtype=np.int64)
+
+        self.actions = None
+
+        self.seed()
+
+    def seed(self, seed=None):
+        """
+        Every slot draws its observations from the same generator. With a single slot, a seed gives the same
+        observations as CPAEnv's.
+
+        :param seed: (int or np.random.SeedSequence) The seed, or None for a random one.
+        :return: ([int]) The entropy of the seed.
+        """
+        self.np_random, seed = make_np_random(seed)
+        return [seed]
+
+    def reset(self):
+        self.current_score[:] = 0
+        self.current_step_num[:] = 0
+        self.current_observation = self._sample_observations(self.num_envs)
+        return self.current_observation.copy()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        self.current_step_num += 1
+
+        correct = self.correct_parity_guesses(self.current_observation, self.actions)
+        self.current_score += correct
+
+        rewards = self._reward(correct)
+        dones = self._done()
+
+        self.current_observation = self._sample_observations(self.num_envs)
+
+        infos = [NO_INFO] * self.num_envs
+
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i] = {'terminal_observation': self.current_observation[i]}
+
+            num_resets = int(np.count_nonzero(dones))
+            self.current_score[dones] = 0
+            self.current_step_num[dones] = 0
+            self.current_observation[dones] = self._sample_observations(num_resets)
+
+        return self.current_observation.copy(), rewards, dones, infos
+
+    def correct_parity_guesses(self, observations, actions):
+        expected_actions = np.where(observations % 2 == 0, self.EVEN, self.ODD)
+        return expected_actions == actions
+
+    def _sample_observations(self, n):
+        return sample_observations(self.np_random, n, self.N_DISCRETE_OBS)
+
+    def _reward(self, correct):
+        raise NotImplementedError
+
+    def _done(self):
+        return (self.current_score >= self.NEEDED_CORRECT_ANSWERS) | (self.current_step_num >= self.MAX_NUM_STEPS)
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        elif isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        # Every episode shares the same attributes, since they are all stored in this object
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+
+class CPAVecEnvDense(CPAVecEnv):
+    def _reward(self, correct):
+        return np.where(correct, 1.0, -1.0).astype(np.float32)
+
+
+class CPAVecEnvSparse(CPAVecEnv):
+    def _reward(self, correct):
+        solved = self.current_score >= self.NEEDED_CORRECT_ANSWERS
+        return np.where(solved, float(self.NEEDED_CORRECT_ANSWERS), 0.0).astype(np.float32)
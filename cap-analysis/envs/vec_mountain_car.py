@@ -0,0 +1,153 @@
+"""
+Vectorized version of the MountainCar environments in mountain_car.py.
+
+The state of every car is kept in contiguous NumPy arrays, so a single call to step() advances all of them at once,
+instead of looping over a DummyVecEnv with one Python env per car.
+"""
+
+import numpy as np
+
+from gym import spaces
+from gym.utils import seeding
+from stable_baselines.common.vec_env import VecEnv
+
+
+class MountainCarVecEnv(VecEnv):
+    """
+    Native vectorized MountainCar that follows the stable-baselines VecEnv interface.
+
+    The dynamics, clipping, wall rule and done detection are the same as MountainCarEnv's subclasses, applied to
+    whole arrays. Cars that reach the goal are reset automatically, and their last observation is stored in the info
+    dict under 'terminal_observation', like DummyVecEnv does.
+    """
+    metadata = {
+        'render.modes': ['rgb_array'],
+        'video.frames_per_second': 30
+    }
+
+    def __init__(self, num_envs, goal_velocity=0):
+        self.min_position = -1.2
+        self.max_position = 0.6
+        self.max_speed = 0.07
+        self.goal_position = 0.5
+        self.goal_velocity = goal_velocity
+
+        self.force = 0.001
+        self.gravity = 0.0025
+
+        self.low = np.array([self.min_position, -self.max_speed])
+        self.high = np.array([self.max_position, self.max_speed])
+
+        observation_space = spaces.Box(self.low, self.high, dtype=np.float32)
+        action_space = spaces.Discrete(3)
+
+        super(MountainCarVecEnv, self).__init__(num_envs, observation_space, action_space)
+
+        self.position = np.zeros(num_envs, dtype=np.float64)
+        self.velocity = np.zeros(num_envs, dtype=np.float64)
+
+        # Scratch buffers, so that stepping does not allocate temporaries for every operation
+        self._acceleration = np.zeros(num_envs, dtype=np.float64)
+        self._gravity_term = np.zeros(num_envs, dtype=np.float64)
+
+        self.actions = None
+        self.renderer = None
+
+        self.seed()
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def reset(self):
+        self._reset_cars(np.ones(self.num_envs, dtype=np.bool_))
+        return self._observation()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        actions = self.actions
+        assert ((actions >= 0) & (actions < self.action_space.n)).all(), "%r invalid" % (actions,)
+
+        position = self.position
+        velocity = self.velocity
+
+        # velocity += (action - 1) * force + cos(3 * position) * (-gravity)
+        np.multiply(position, 3, out=self._gravity_term)
+        np.cos(self._gravity_term, out=self._gravity_term)
+        self._gravity_term *= -self.gravity
+        np.subtract(actions, 1, out=self._acceleration)
+        self._acceleration *= self.force
+        self._acceleration += self._gravity_term
+        velocity += self._acceleration
+        np.clip(velocity, -self.max_speed, self.max_speed, out=velocity)
+
+        position += velocity
+        np.clip(position, self.min_position, self.max_position, out=position)
+        velocity[(position == self.min_position) & (velocity < 0)] = 0
+
+        dones = (position >= self.goal_position) & (velocity >= self.goal_velocity)
+
+        rewards = self._reward(dones)
+
+        infos = [{} for _ in range(self.num_envs)]
+
+        if dones.any():
+            terminal_observations = self._observation()
+            for i in np.flatnonzero(dones):
+                infos[i]['terminal_observation'] = terminal_observations[i]
+            self._reset_cars(dones)
+
+        return self._observation(), rewards, dones, infos
+
+    def _reward(self, dones):
+        raise NotImplementedError
+
+    def _reset_cars(self, mask):
+        num_resets = int(np.count_nonzero(mask))
+        self.position[mask] = self.np_random.uniform(low=-0.6, high=-0.4, size=num_resets)
+        self.velocity[mask] = 0
+
+    def _observation(self):
+        observation = np.empty((self.num_envs, 2), dtype=np.float32)
+        observation[:, 0] = self.position
+        observation[:, 1] = self.velocity
+        return observation
+
+    def _get_indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        elif isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def close(self):
+        pass
+
+    def get_images(self):
+        # Every car is rendered in the same batch, which VecEnv.render tiles into a single image
+        if self.renderer is None:
+            from envs.mountain_car_render import MountainCarRenderer
+            self.renderer = MountainCarRenderer(self.min_position, self.max_position, self.goal_position)
+        return list(self.renderer.render_batch(self.position))
+
+    def get_attr(self, attr_name, indices=None):
+        # Every car shares the same attributes, since they are all stored in this object
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+
+class MountainCarSparseVecEnv(MountainCarVecEnv):
+    def _reward(self, dones):
+        return np.where(dones, 100.0, 0.0).astype(np.float32)
+
+
+class MountainCarDenseVecEnv(MountainCarVecEnv):
+    def _reward(self, dones):
+        return (-np.abs(self.position - self.goal_position)).astype(np.float32)
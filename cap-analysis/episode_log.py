@@ -0,0 +1,273 @@
+"""
+Binary columnar format for the episode logs of a training run.
+
+Monitor writes one CSV line per episode, and plotting.py has to parse all of them again for every figure. This module
+buffers the episodes in memory instead, and appends them to the log in blocks, each with one raw array per column:
+
+    magic (8 bytes) | header size (uint64) | JSON header, padded to 8 bytes
+    block: number of episodes n (uint64) | r (n float64) | l (n int64) | t (n float64)
+    block: ...
+
+The loader memory-maps the file and reads the columns of every block without any parsing. A block that was only
+partially written (e.g. because the run crashed) is ignored.
+"""
+
+import json
+import os
+import time
+
+import gym
+import numpy as np
+import pandas
+
+MAGIC = b'EPLOG\x00\x01\n'
+EXT = "monitor.eplog"
+
+COLUMNS = (('r', np.dtype('<f8')), ('l', np.dtype('<i8')), ('t', np.dtype('<f8')))
+
+DEFAULT_BLOCK_SIZE = 4096
+DEFAULT_FLUSH_INTERVAL = 30  # seconds
+
+_COUNT_DTYPE = np.dtype('<u8')
+
+
+class EpisodeLogWriter:
+    """
+    Buffers episodes in memory and appends them to a binary episode log in blocks.
+
+    A block is written when block_size episodes have been buffered, when flush_interval seconds have passed since the
+    last block was written, or when the writer is closed.
+    """
+
+    def __init__(self, filename, t_start=None, env_id=None, block_size=DEFAULT_BLOCK_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        if not filename.endswith(EXT):
+            if os.path.isdir(filename):
+                filename = os.path.join(filename, EXT)
+            else:
+                filename = filename + "." + EXT
+
+        self.filename = filename
+        self.t_start = time.time() if t_start is None else t_start
+        self.flush_interval = flush_interval
+        self.last_flush_time = time.time()
+
+        self.buffers = {name: np.empty(block_size, dtype=dtype) for name, dtype in COLUMNS}
+        self.num_buffered = 0
+
+        header = json.dumps({"t_start": self.t_start, 'env_id': env_id,
+                             'columns': [(name, dtype.str) for name, dtype in COLUMNS]}).encode()
+        header += b' ' * (-len(header) % 8)
+
+        self.file_handler = open(filename, 'wb')
+        self.file_handler.write(MAGIC)
+        self.file_handler.write(np.array(len(header), dtype=_COUNT_DTYPE).tobytes())
+        self.file_handler.write(header)
+        self.file_handler.flush()
+
+    def write(self, reward, length, elapsed_time):
+        """
+        Adds an episode to the log.
+
+        :param elapsed_time: (float) Time at which the episode ended, in seconds since t_start.
+        """
+        i = self.num_buffered
+        self.buffers['r'][i] = reward
+        self.buffers['l'][i] = length
+        self.buffers['t'][i] = elapsed_time
+        self.num_buffered += 1
+
+        if self.num_buffered == len(self.buffers['r']) or time.time() - self.last_flush_time > self.flush_interval:
+            self.flush()
+
+    def write_block(self, rewards, lengths, elapsed_times):
+        """
+        Adds many episodes to the log at once, after the ones that are buffered.
+        """
+        self.flush()
+        self._append_block({'r': rewards, 'l': lengths, 't': elapsed_times}, len(rewards))
+        self.file_handler.flush()
+
+    def flush(self):
+        if self.num_buffered > 0:
+            self._append_block(self.buffers, self.num_buffered)
+            self.num_buffered = 0
+
+        self.file_handler.flush()
+        self.last_flush_time = time.time()
+
+    def _append_block(self, arrays, count):
+        self.file_handler.write(np.array(count, dtype=_COUNT_DTYPE).tobytes())
+        for name, dtype in COLUMNS:
+            self.file_handler.write(np.asarray(arrays[name][:count], dtype=dtype).tobytes())
+
+    def close(self):
+        if self.file_handler is not None:
+            self.flush()
+            self.file_handler.close()
+            self.file_handler = None
+
+
+def load_episode_log(filename):
+    """
+    Reads a binary episode log.
+
+    :return: (dict, dict) The header of the log, and the arrays of each column. If the log has a single block, the
+        arrays are views of the memory-mapped file.
+    """
+    if os.path.getsize(filename) < len(MAGIC) + _COUNT_DTYPE.itemsize:
+        raise ValueError("File '{}' is not an episode log.".format(filename))
+
+    data = np.memmap(filename, dtype=np.uint8, mode='r')
+
+    if data[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError("File '{}' is not an episode log.".format(filename))
+
+    offset = len(MAGIC)
+    header_size = int(np.frombuffer(data, dtype=_COUNT_DTYPE, count=1, offset=offset)[0])
+    offset += _COUNT_DTYPE.itemsize
+    header = json.loads(data[offset:offset + header_size].tobytes().decode())
+    offset += header_size
+
+    columns = [(name, np.dtype(dtype)) for name, dtype in header['columns']]
+    row_size = sum(dtype.itemsize for _, dtype in columns)
+
+    blocks = {name: [] for name, _ in columns}
+
+    while offset + _COUNT_DTYPE.itemsize <= len(data):
+        count = int(np.frombuffer(data, dtype=_COUNT_DTYPE, count=1, offset=offset)[0])
+        block_end = offset + _COUNT_DTYPE.itemsize + count * row_size
+
+        if block_end > len(data):
+            # Partially written block
+            break
+
+        offset += _COUNT_DTYPE.itemsize
+        for name, dtype in columns:
+            blocks[name].append(np.frombuffer(data, dtype=dtype, count=count, offset=offset))
+            offset += count * dtype.itemsize
+
+    arrays = {}
+    for name, dtype in columns:
+        if len(blocks[name]) == 1:
+            arrays[name] = blocks[name][0]
+        elif len(blocks[name]) == 0:
+            arrays[name] = np.empty(0, dtype=dtype)
+        else:
+            arrays[name] = np.concatenate(blocks[name])
+
+    return header, arrays
+
+
+def get_episode_log_files(path):
+    """
+    :return: ([str]) The binary episode logs in a directory.
+    """
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(EXT))
+
+
+def load_episode_logs(path):
+    """
+    Loads the binary episode logs of a directory, like load_results does for the CSV monitor files.
+
+    The episodes of every log are merged and sorted by the time they ended, relative to the earliest start time.
+
+    :return: (pandas.DataFrame) The 'r', 'l' and 't' columns of every episode.
+    """
+    logs = [load_episode_log(filename) for filename in get_episode_log_files(path)]
+
+    if len(logs) == 0:
+        raise ValueError("No episode log found in '{}'.".format(path))
+
+    if len(logs) == 1:
+        header, arrays = logs[0]
+        data_frame = pandas.DataFrame(arrays, copy=False)
+        data_frame.t_start = header['t_start']
+        return data_frame
+
+    t_start = min(header['t_start'] for header, _ in logs)
+
+    arrays = {name: np.concatenate([log_arrays[name] for _, log_arrays in logs]) for name, _ in COLUMNS}
+    arrays['t'] += np.concatenate([np.full(len(log_arrays['t']), header['t_start'] - t_start)
+                                   for header, log_arrays in logs])
+
+    order = np.argsort(arrays['t'], kind='stable')
+    data_frame = pandas.DataFrame({name: arrays[name][order] for name, _ in COLUMNS}, copy=False)
+    data_frame.t_start = t_start
+
+    return data_frame
+
+
+def merge_episode_logs(path, filename, env_id=None):
+    """
+    Merges the binary episode logs of a directory into a single one, with the episodes sorted by the time at which
+    they ended.
+    """
+    data_frame = load_episode_logs(path)
+
+    writer = EpisodeLogWriter(filename, t_start=data_frame.t_start, env_id=env_id)
+    writer.write_block(data_frame.r.values, data_frame.l.values, data_frame.t.values)
+    writer.close()
+
+
+class EpisodeLogMonitor(gym.Wrapper):
+    """
+    Replacement for stable-baselines' Monitor that writes a binary episode log instead of a CSV file.
+
+    It keeps the same interface, so it can be used by the algorithms (the 'episode' key of the info dict) and by the
+    callbacks (get_episode_rewards, ...) in the same way.
+    """
+
+    def __init__(self, env, filename, block_size=DEFAULT_BLOCK_SIZE):
+        gym.Wrapper.__init__(self, env=env)
+
+        self.t_start = time.time()
+        self.writer = EpisodeLogWriter(filename, t_start=self.t_start, env_id=env.spec and env.spec.id,
+                                       block_size=block_size)
+
+        self.rewards = []
+        self.episode_rewards = []
+        self.episode_lengths = []
+        self.episode_times = []
+        self.total_steps = 0
+
+    def reset(self, **kwargs):
+        self.rewards = []
+        return self.env.reset(**kwargs)
+
+    def step(self, action):
+        observation, reward, done, info = self.env.step(action)
+        self.rewards.append(reward)
+
+        if done:
+            ep_rew = sum(self.rewards)
+            eplen = len(self.rewards)
+            elapsed_time = time.time() - self.t_start
+
+            ep_info = {"r": round(ep_rew, 6), "l": eplen, "t": round(elapsed_time, 6)}
+            self.episode_rewards.append(ep_rew)
+            self.episode_lengths.append(eplen)
+            self.episode_times.append(elapsed_time)
+            self.writer.write(ep_rew, eplen, elapsed_time)
+
+            info['episode'] = ep_info
+
+        self.total_steps += 1
+
+        return observation, reward, done, info
+
+    def close(self):
+        self.writer.close()
+        return self.env.close()
+
+    def get_total_steps(self):
+        return self.total_steps
+
+    def get_episode_rewards(self):
+        return self.episode_rewards
+
+    def get_episode_lengths(self):
+        return self.episode_lengths
+
+    def get_episode_times(self):
+        return self.episode_times
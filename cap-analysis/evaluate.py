@@ -0,0 +1,207 @@
+"""
+Evaluation of the models saved by training.train.
+
+Every model plays a number of deterministic episodes in a native vectorized environment, choosing the actions of all
+of its slots with a single call to model.predict per step. Each slot plays a fixed share of the episodes, so that
+short episodes are not over-represented. Models are evaluated in parallel, each in its own process.
+
+The reward and length statistics of every model are written to 'evaluation.json' in its run directory, and to the
+metadata of its run in the catalog.
+
+Usage:
+    python evaluate.py --environments cpa_dense --algorithms ppo a2c --episodes 100
+"""
+
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import training
+from catalog import DEFAULT_CATALOG_PATH, RunCatalog, STATUS_COMPLETED
+
+EVALUATION_FILE_NAME = "evaluation.json"
+
+DEFAULT_NUM_EPISODES = 100
+DEFAULT_N_ENVS = 16
+DEFAULT_SEED = 0
+# MountainCar episodes only end at the goal, so a policy that never reaches it would be evaluated forever
+DEFAULT_MAX_EPISODE_STEPS = 10000
+
+
+def run_episodes(model, venv, num_episodes, max_episode_steps=DEFAULT_MAX_EPISODE_STEPS):
+    """
+    Plays deterministic episodes in a native vectorized environment, which resets finished slots by itself.
+
+    A slot whose episode reaches max_episode_steps is stopped, and the episodes it had left are not played.
+
+    :return: (np.ndarray, np.ndarray, int) The reward and length of every episode, and the number of them that were
+        truncated.
+    """
+    n_envs = venv.num_envs
+
+    # Slot i plays episodes_left[i] episodes, whatever their length
+    episodes_left = np.full(n_envs, num_episodes // n_envs)
+    episodes_left[:num_episodes % n_envs] += 1
+
+    episode_rewards = np.zeros(n_envs)
+    episode_lengths = np.zeros(n_envs, dtype=np.int64)
+
+    rewards = []
+    lengths = []
+    num_truncated = 0
+
+    observations = venv.reset()
+
+    while episodes_left.any():
+        actions, _ = model.predict(observations, deterministic=True)
+        observations, step_rewards, dones, _ = venv.step(actions)
+
+        episode_rewards += step_rewards
+        episode_lengths += 1
+
+        truncated = ~dones & (episode_lengths >= max_episode_steps)
+        finished = (dones | truncated) & (episodes_left > 0)
+
+        if finished.any():
+            rewards.extend(episode_rewards[finished].tolist())
+            lengths.extend(episode_lengths[finished].tolist())
+            num_truncated += int(np.count_nonzero(truncated & finished))
+
+            episodes_left[finished] -= 1
+            episodes_left[truncated] = 0
+
+        episode_rewards[dones | truncated] = 0
+        episode_lengths[dones | truncated] = 0
+
+    return np.array(rewards), np.array(lengths), num_truncated
+
+
+def evaluate_run(run, num_episodes=DEFAULT_NUM_EPISODES, n_envs=DEFAULT_N_ENVS, seed=DEFAULT_SEED,
+                 max_episode_steps=DEFAULT_MAX_EPISODE_STEPS):
+    """
+    Evaluates the model of a run of the catalog. This is the function executed in the worker processes.
+
+    :return: (dict) The statistics of the episodes, or the error that made the evaluation fail.
+    """
+    start_time = time.time()
+
+    try:
+        model_path = run['model_path'] or os.path.join(run['run_dir'], "model")
+        model = training.get_algorithm_class(run['algorithm']).load(model_path)
+
+        venv = training.make_native_vec_env(run['environment'], min(n_envs, num_episodes))
+        venv.seed(seed)
+
+        try:
+            rewards, lengths, num_truncated = run_episodes(model, venv, num_episodes, max_episode_steps)
+        finally:
+            venv.close()
+
+        result = {
+            'num_episodes': len(rewards),
+            'num_truncated': num_truncated,
+            'mean_reward': float(np.mean(rewards)),
+            'std_reward': float(np.std(rewards)),
+            'median_reward': float(np.median(rewards)),
+            'min_reward': float(np.min(rewards)),
+            'max_reward': float(np.max(rewards)),
+            'mean_length': float(np.mean(lengths)),
+            'std_length': float(np.std(lengths)),
+            'deterministic': True,
+            'seed': seed,
+            'duration': time.time() - start_time,
+            'episode_rewards': rewards.tolist(),
+            'episode_lengths': lengths.tolist(),
+        }
+    except Exception:
+        result = {'error': traceback.format_exc()}
+
+    return result
+
+
+def evaluate_runs(runs, max_workers=None, catalog_path=DEFAULT_CATALOG_PATH, **kwargs):
+    """
+    Evaluates the models of several runs of the catalog in parallel, and saves their statistics.
+
+    :param kwargs: Extra keyword arguments passed to evaluate_run.
+    :return: ({str: dict}) The result of every run, by run directory.
+    """
+    results = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, RunCatalog(catalog_path) as catalog:
+        futures = {executor.submit(evaluate_run, run, **kwargs): run for run in runs}
+
+        for i, future in enumerate(as_completed(futures)):
+            run = futures[future]
+            result = future.result()
+            results[run['run_dir']] = result
+
+            if 'error' in result:
+                print("[{}/{}] Failed to evaluate {}:\n{}".format(i + 1, len(runs), run['run_dir'], result['error']))
+                continue
+
+            with open(os.path.join(run['run_dir'], EVALUATION_FILE_NAME), 'w') as file_handler:
+                json.dump(result, file_handler, indent=2)
+
+            # The metadata only gets the statistics, the episodes are in the evaluation file
+            statistics = {name: value for name, value in result.items() if not name.startswith('episode_')}
+            catalog.update_run(run['id'], metadata={'evaluation': statistics})
+
+            print("[{}/{}] {}: {:.3f} +/- {:.3f} over {} episodes ({:.1f}s)".format(
+                i + 1, len(runs), run['run_dir'], result['mean_reward'], result['std_reward'], result['num_episodes'],
+                result['duration']))
+
+    return results
+
+
+if __name__ == '__main__':
+    TRAINING_INFO_DIR = "training_info"
+
+    parser = argparse.ArgumentParser(description='Evaluate the trained models.')
+    parser.add_argument('--environments', nargs='+', choices=training.AVAILABLE_ENVIRONMENTS,
+                        default=training.AVAILABLE_ENVIRONMENTS, help='Environments of the runs (default: all)')
+    parser.add_argument('--algorithms', nargs='+', choices=training.AVAILABLE_ALGORITHMS,
+                        default=training.AVAILABLE_ALGORITHMS, help='Algorithms of the runs (default: all)')
+    parser.add_argument('--run-dirs', nargs='+', default=None,
+                        help='Evaluate these runs only, instead of every completed run of the environments and '
+                             'algorithms')
+    parser.add_argument('--episodes', type=int, default=DEFAULT_NUM_EPISODES,
+                        help='Number of episodes per model (default: {})'.format(DEFAULT_NUM_EPISODES))
+    parser.add_argument('--n-envs', type=int, default=DEFAULT_N_ENVS,
+                        help='Number of episodes played at the same time (default: {})'.format(DEFAULT_N_ENVS))
+    parser.add_argument('--max-episode-steps', type=int, default=DEFAULT_MAX_EPISODE_STEPS,
+                        help='Episodes are truncated after this number of steps (default: {})'.format(
+                            DEFAULT_MAX_EPISODE_STEPS))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of models evaluated at the same time (default: number of CPUs)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help='Seed of the environments (default: {})'.format(DEFAULT_SEED))
+    parser.add_argument('--skip-evaluated', action='store_true', help='Skip the runs that were already evaluated')
+
+    args = parser.parse_args()
+
+    catalog_path = os.path.join(TRAINING_INFO_DIR, training.CATALOG_FILE_NAME)
+
+    with RunCatalog(catalog_path) as catalog:
+        catalog.index_existing_runs(TRAINING_INFO_DIR, training.AVAILABLE_ALGORITHMS, training.AVAILABLE_ENVIRONMENTS)
+
+        if args.run_dirs is not None:
+            runs = [catalog.get_run(run_dir=os.path.join(run_dir, "")) for run_dir in args.run_dirs]
+            if None in runs:
+                raise Exception("Run '{}' is not in the catalog.".format(args.run_dirs[runs.index(None)]))
+        else:
+            runs = catalog.find_runs(environment=args.environments, algorithm=args.algorithms,
+                                     status=STATUS_COMPLETED)
+
+    if args.skip_evaluated:
+        runs = [run for run in runs if 'evaluation' not in run['metadata']]
+
+    print("Evaluating {} models.".format(len(runs)))
+
+    evaluate_runs(runs, max_workers=args.jobs, catalog_path=catalog_path, num_episodes=args.episodes,
+                  n_envs=args.n_envs, seed=args.seed, max_episode_steps=args.max_episode_steps)
@@ -0,0 +1,384 @@
+"""
+Asynchronous successive halving (ASHA) search of the hyperparameters of an algorithm in an environment.
+
+Many configurations sampled from the search space of the algorithm are trained with a small budget of timesteps (rung
+0). Whenever a worker process is free, the best 1 / reduction_factor of the trials of a rung that were not promoted yet
+are promoted to the next rung, where they are trained for reduction_factor times longer, resuming from the checkpoint of
+their previous rung. Otherwise a new configuration is started. Only the most promising configurations reach the full
+budget. As with any resumed run (see training.train), the schedules of a promoted trial restart over the timesteps of
+its new rung, so it is not trained exactly as a configuration trained for the full budget at once.
+
+Every finished trial is appended to a ledger (see sweep.JobLedger), so an interrupted search continues where it stopped.
+
+Usage:
+    python hyperparameter_search.py cpa_dense ppo --trials 27 --min-timesteps 5000 --max-timesteps 100000
+"""
+
+import argparse
+import math
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import training
+from sweep import DEFAULT_MAX_RETRIES, JobLedger, STATUS_COMPLETED, STATUS_FAILED
+
+DEFAULT_SEARCH_DIR = "training_info" + os.path.sep + "search"
+DEFAULT_NUM_TRIALS = 27
+DEFAULT_MIN_TIMESTEPS = 5000
+DEFAULT_MAX_TIMESTEPS = training.DEFAULT_TIMESTEPS
+DEFAULT_REDUCTION_FACTOR = 3
+DEFAULT_SCORE_EPISODES = 20
+
+# Status of the attempts of a trial that were stopped by a worker dying, and that are tried again
+STATUS_INTERRUPTED = 'interrupted'
+
+# Distributions of the hyperparameters of every algorithm, as ('log_uniform', low, high), ('uniform', low, high) or
+# ('choice', [values])
+SEARCH_SPACES = {
+    'ppo': {
+        'gamma': ('choice', [0.9, 0.95, 0.98, 0.99, 0.995, 0.999]),
+        'n_steps': ('choice', [32, 64, 128, 256, 512, 1024]),
+        'learning_rate': ('log_uniform', 1e-5, 1e-2),
+        'ent_coef': ('log_uniform', 1e-8, 1e-1),
+        'cliprange': ('choice', [0.1, 0.2, 0.3, 0.4]),
+        'noptepochs': ('choice', [1, 4, 10, 20]),
+        'nminibatches': ('choice', [1, 2, 4, 8]),
+        'lam': ('choice', [0.8, 0.9, 0.95, 0.98, 1.0]),
+    },
+    'a2c': {
+        'gamma': ('choice', [0.9, 0.95, 0.98, 0.99, 0.995, 0.999]),
+        'n_steps': ('choice', [5, 8, 16, 32, 64]),
+        'learning_rate': ('log_uniform', 1e-5, 1e-2),
+        'ent_coef': ('log_uniform', 1e-8, 1e-1),
+        'vf_coef': ('uniform', 0.1, 1.0),
+        'lr_schedule': ('choice', ['linear', 'constant']),
+    },
+    'acktr': {
+        'gamma': ('choice', [0.9, 0.95, 0.98, 0.99, 0.995, 0.999]),
+        'n_steps': ('choice', [5, 8, 16, 32, 64]),
+        'learning_rate': ('log_uniform', 1e-3, 1.0),
+        'ent_coef': ('log_uniform', 1e-8, 1e-1),
+        'vf_coef': ('uniform', 0.1, 1.0),
+        'lr_schedule': ('choice', ['linear', 'constant']),
+    },
+    'dqn': {
+        'gamma': ('choice', [0.9, 0.95, 0.98, 0.99, 0.995, 0.999]),
+        'learning_rate': ('log_uniform', 1e-5, 1e-2),
+        'batch_size': ('choice', [16, 32, 64, 128]),
+        'buffer_size': ('choice', [10000, 50000, 100000]),
+        'exploration_fraction': ('uniform', 0.0, 0.5),
+        'exploration_final_eps': ('uniform', 0.0, 0.2),
+        'target_network_update_freq': ('choice', [100, 500, 1000, 5000]),
+        'learning_starts': ('choice', [0, 1000, 5000]),
+    },
+}
+
+
+def sample_config(search_space, rng):
+    """
+    :param rng: (np.random.Generator)
+    :return: (dict) Hyperparameters drawn from the search space, as plain Python values.
+    """
+    config = {}
+
+    for name, (distribution, *arguments) in sorted(search_space.items()):
+        if distribution == 'log_uniform':
+            low, high = arguments
+            config[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        elif distribution == 'uniform':
+            low, high = arguments
+            config[name] = float(rng.uniform(low, high))
+        elif distribution == 'choice':
+            values = arguments[0]
+            config[name] = values[int(rng.integers(len(values)))]
+        else:
+            raise Exception("Distribution '{}' is unknown.".format(distribution))
+
+    return config
+
+
+class ASHAScheduler:
+    """
+    Decides which trial to train next.
+
+    :param num_trials: (int) Number of configurations started at rung 0.
+    :param min_timesteps: (int) Budget of rung 0.
+    :param max_timesteps: (int) Budget of the last rung.
+    :param reduction_factor: (int) Ratio between the budgets of consecutive rungs, and inverse of the fraction of the
+        trials of a rung that are promoted.
+    """
+
+    def __init__(self, num_trials, min_timesteps, max_timesteps, reduction_factor=DEFAULT_REDUCTION_FACTOR):
+        self.num_trials = num_trials
+        self.reduction_factor = reduction_factor
+
+        self.budgets = []
+        budget = min_timesteps
+        while budget < max_timesteps:
+            self.budgets.append(budget)
+            budget *= reduction_factor
+        self.budgets.append(max_timesteps)
+
+        # Score of every finished trial of each rung, and trials started (finished or not) in each rung
+        self.scores = [{} for _ in self.budgets]
+        self.started = [set() for _ in self.budgets]
+
+    def next_task(self):
+        """
+        :return: (int, int) The trial and rung to train next, or None if there is nothing to start now.
+        """
+        # Promotions to the highest rungs first, so that the best configurations are known as soon as possible
+        for rung in reversed(range(len(self.budgets) - 1)):
+            scores = self.scores[rung]
+            num_promoted = len(scores) // self.reduction_factor
+            # Failed trials count in the rung, but are never promoted
+            candidates = [trial_id for trial_id, score in scores.items() if math.isfinite(score)]
+            for trial_id in sorted(candidates, key=scores.get, reverse=True)[:num_promoted]:
+                if trial_id not in self.started[rung + 1]:
+                    return trial_id, rung + 1
+
+        # Trials may have finished out of order before the search was continued, so the lowest one not started is taken
+        for trial_id in range(self.num_trials):
+            if trial_id not in self.started[0]:
+                return trial_id, 0
+
+        return None
+
+    def start(self, trial_id, rung):
+        self.started[rung].add(trial_id)
+
+    def record(self, trial_id, rung, score):
+        """
+        :param score: (float) The score of the trial, or None if it failed, so that it is never promoted.
+        """
+        self.started[rung].add(trial_id)
+        self.scores[rung][trial_id] = float('-inf') if score is None else score
+
+
+def score_run(run_dir, num_episodes=DEFAULT_SCORE_EPISODES):
+    """
+    :return: (float) The average reward of the last episodes of a run.
+    """
+    from stable_baselines.results_plotter import load_results
+    from episode_log import get_episode_log_files, load_episode_logs
+
+    episodes = load_episode_logs(run_dir) if get_episode_log_files(run_dir) else load_results(run_dir)
+
+    if len(episodes) == 0:
+        raise Exception("Run '{}' did not finish any episode.".format(run_dir))
+
+    return float(episodes.r.values[-num_episodes:].mean())
+
+
+def run_trial(task):
+    """
+    Trains a trial up to the budget of its rung. This is the function executed in the worker processes.
+
+    :return: (dict) The run directory, score and wall time of the trial, or the error that made it fail.
+    """
+    start_time = time.time()
+
+    try:
+        # Every rung saves a checkpoint at its end, from which the next rung resumes
+        run_dir = training.train(task['environment'], task['algorithm'], task['timesteps'], seed=task['seed'],
+                                 tag=task['tag'], model_kwargs=task['config'], checkpoint_freq=task['timesteps'],
+                                 keep_checkpoints=1, resume_dir=task['run_dir'], **task['train_kwargs'])
+        result = {'status': STATUS_COMPLETED, 'run_dir': run_dir,
+                  'score': score_run(run_dir, task['score_episodes'])}
+    except Exception:
+        result = {'status': STATUS_FAILED, 'run_dir': task['run_dir'], 'score': None,
+                  'error': traceback.format_exc()}
+
+    result['duration'] = time.time() - start_time
+
+    return result
+
+
+def run_search(environment, algorithm, num_trials=DEFAULT_NUM_TRIALS, min_timesteps=DEFAULT_MIN_TIMESTEPS,
+               max_timesteps=DEFAULT_MAX_TIMESTEPS, reduction_factor=DEFAULT_REDUCTION_FACTOR, max_workers=None,
+               seed=0, name=None, search_dir=DEFAULT_SEARCH_DIR, score_episodes=DEFAULT_SCORE_EPISODES,
+               max_retries=DEFAULT_MAX_RETRIES, **train_kwargs):
+    """
+    Runs (or continues) a search, with at most max_workers trials trained at the same time.
+
+    When a worker dies, the trials that were running are started again, until they have been attempted
+    max_retries + 1 times. Then they fail, as the trial that killed the worker would otherwise kill every new pool.
+
+    :param name: (str) Name of the search, and of its ledger in search_dir (default: '<algorithm>-<environment>').
+    :param train_kwargs: Extra keyword arguments passed to training.train in every trial.
+    :return: ([dict]) The ledger entries of the trials that reached the highest rung, best first.
+    """
+    if algorithm not in SEARCH_SPACES:
+        raise Exception("Algorithm '{}' has no search space.".format(algorithm))
+
+    name = name or "{}-{}".format(algorithm, environment)
+    ledger = JobLedger(os.path.join(search_dir, name + ".jsonl"))
+    scheduler = ASHAScheduler(num_trials, min_timesteps, max_timesteps, reduction_factor)
+
+    # The configurations only depend on the seed, so they are the same when the search is continued
+    rng = np.random.default_rng(seed)
+    configs = [sample_config(SEARCH_SPACES[algorithm], rng) for _ in range(num_trials)]
+    trial_seeds = training.derive_worker_seeds(seed, num_trials)
+
+    run_dirs = {}
+    num_finished = 0
+    for entry in ledger.entries:
+        # Interrupted attempts only count towards the retries of their trial, which is started again
+        if entry['status'] == STATUS_INTERRUPTED:
+            continue
+
+        num_finished += 1
+        scheduler.record(entry['trial_id'], entry['rung'], entry['score'])
+        if entry['run_dir'] is not None:
+            run_dirs[entry['trial_id']] = entry['run_dir']
+
+    if num_finished:
+        print("Continuing search '{}' with {} finished trials.".format(name, num_finished))
+
+    print("Budgets of the rungs: {}".format(scheduler.budgets))
+
+    def make_task(trial_id, rung):
+        return {
+            'environment': environment,
+            'algorithm': algorithm,
+            'timesteps': scheduler.budgets[rung],
+            'seed': trial_seeds[trial_id],
+            'tag': "search-{}-{}".format(name, trial_id),
+            'config': configs[trial_id],
+            'run_dir': run_dirs.get(trial_id) if rung > 0 else None,
+            'score_episodes': score_episodes,
+            'train_kwargs': train_kwargs,
+        }
+
+    def record(trial_id, rung, result):
+        entry = {
+            'job_id': "{}@{}".format(trial_id, rung),
+            'trial_id': trial_id,
+            'rung': rung,
+            'timesteps': scheduler.budgets[rung],
+            'config': configs[trial_id],
+            'status': result['status'],
+            'score': result['score'],
+            'run_dir': result['run_dir'],
+            'duration': result['duration'],
+            'finished_at': time.time(),
+        }
+        if 'error' in result:
+            entry['error'] = result['error']
+
+        ledger.record(entry)
+        scheduler.record(trial_id, rung, result['score'])
+        if result['run_dir'] is not None:
+            run_dirs[trial_id] = result['run_dir']
+
+        if result['status'] == STATUS_COMPLETED:
+            print("Trial {} finished rung {} ({} timesteps) in {:.1f}s with score {:.3f}.".format(
+                trial_id, rung, entry['timesteps'], result['duration'], result['score']))
+        else:
+            print("Trial {} failed in rung {}:\n{}".format(trial_id, rung, result['error']))
+
+    running = {}
+    # Interrupted trials, submitted again before any new one
+    retry_tasks = []
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    max_running = max_workers or os.cpu_count()
+
+    try:
+        while True:
+            try:
+                while len(running) < max_running:
+                    task = retry_tasks.pop(0) if retry_tasks else scheduler.next_task()
+                    if task is None:
+                        break
+                    # Only started once submitted, so that it is offered again if the pool broke in the meantime
+                    future = executor.submit(run_trial, make_task(*task))
+                    scheduler.start(*task)
+                    running[future] = task
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    result = future.result()
+                    record(*running.pop(future), result)
+            except BrokenProcessPool as exc:
+                # A worker died, taking the pool with it. The trials that were still running are started again in a
+                # new pool, from the checkpoint of their previous rung, unless they were attempted too many times
+                for future, task in list(running.items()):
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        record(*running.pop(future), future.result())
+
+                executor.shutdown(wait=True)
+                executor = ProcessPoolExecutor(max_workers=max_workers)
+                interrupted_tasks = list(running.values())
+                running = {}
+
+                for trial_id, rung in interrupted_tasks:
+                    job_id = "{}@{}".format(trial_id, rung)
+                    attempt = ledger.attempts(job_id) + 1
+                    error = "The worker died (attempt {}): {!r}".format(attempt, exc)
+
+                    if attempt > max_retries:
+                        record(trial_id, rung, {'status': STATUS_FAILED, 'score': None,
+                                                'run_dir': run_dirs.get(trial_id) if rung > 0 else None,
+                                                'duration': None, 'error': error})
+                        continue
+
+                    print("Trial {} was interrupted in rung {}, starting it again: {}".format(trial_id, rung, error))
+                    ledger.record({'job_id': job_id, 'trial_id': trial_id, 'rung': rung, 'status': STATUS_INTERRUPTED,
+                                   'attempt': attempt, 'error': error, 'finished_at': time.time()})
+                    retry_tasks.append((trial_id, rung))
+    finally:
+        executor.shutdown(wait=True)
+
+    finished_rungs = [rung for rung in range(len(scheduler.budgets)) if scheduler.scores[rung]]
+    if not finished_rungs:
+        return []
+
+    top_rung = finished_rungs[-1]
+    best = sorted((entry for entry in ledger.entries if entry['rung'] == top_rung and entry['score'] is not None),
+                  key=lambda entry: entry['score'], reverse=True)
+
+    print("Best trials ({} timesteps):".format(scheduler.budgets[top_rung]))
+    for entry in best[:5]:
+        print("  trial {}: score {:.3f} {}".format(entry['trial_id'], entry['score'], entry['config']))
+
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search the hyperparameters of an algorithm with successive halving.')
+    parser.add_argument('environment', choices=training.AVAILABLE_ENVIRONMENTS, help='The environment')
+    parser.add_argument('algorithm', choices=sorted(SEARCH_SPACES), help='The DRL algorithm')
+    parser.add_argument('--trials', type=int, default=DEFAULT_NUM_TRIALS,
+                        help='Number of configurations (default: {})'.format(DEFAULT_NUM_TRIALS))
+    parser.add_argument('--min-timesteps', type=int, default=DEFAULT_MIN_TIMESTEPS,
+                        help='Budget of the first rung (default: {})'.format(DEFAULT_MIN_TIMESTEPS))
+    parser.add_argument('--max-timesteps', type=int, default=DEFAULT_MAX_TIMESTEPS,
+                        help='Budget of the last rung (default: {})'.format(DEFAULT_MAX_TIMESTEPS))
+    parser.add_argument('--reduction-factor', type=int, default=DEFAULT_REDUCTION_FACTOR,
+                        help='Ratio between the budgets of consecutive rungs (default: {})'.format(
+                            DEFAULT_REDUCTION_FACTOR))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of trials trained at the same time (default: number of CPUs)')
+    parser.add_argument('--score-episodes', type=int, default=DEFAULT_SCORE_EPISODES,
+                        help='Number of last episodes whose average reward is the score of a trial (default: {})'.format(
+                            DEFAULT_SCORE_EPISODES))
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the configurations and the trials')
+    parser.add_argument('--name', default=None, help='Name of the search (default: <algorithm>-<environment>)')
+    parser.add_argument('--retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help='Number of times a trial interrupted by a worker dying is started again (default: {})'
+                        .format(DEFAULT_MAX_RETRIES))
+
+    args = parser.parse_args()
+
+    run_search(args.environment, args.algorithm, num_trials=args.trials, min_timesteps=args.min_timesteps,
+               max_timesteps=args.max_timesteps, reduction_factor=args.reduction_factor, max_workers=args.jobs,
+               seed=args.seed, name=args.name, score_episodes=args.score_episodes, max_retries=args.retries)
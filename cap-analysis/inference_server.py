@@ -0,0 +1,324 @@
+"""
+Inference server for the trained models.
+
+The server loads the model of a run once, and answers the observations sent to it over a local socket with the actions
+chosen by the model. Requests from concurrent clients are merged into micro-batches, so that model.predict is called
+once for many observations: a batch is predicted as soon as it has max_batch_size observations, or max_wait seconds
+after its first observation arrived, whichever comes first. The server keeps latency and throughput statistics, which
+clients can request.
+
+Start the server with:
+    python inference_server.py training_info/<run> --max-batch-size 64 --max-wait 0.002
+
+And query it from Python with InferenceClient, or benchmark it with load_generator.py.
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from worker import DEFAULT_HOST, DEFAULT_AUTHKEY, parse_address
+
+DEFAULT_PORT = 6001
+DEFAULT_ADDRESS = (DEFAULT_HOST, DEFAULT_PORT)
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.002  # seconds
+DEFAULT_STATS_INTERVAL = 10  # seconds
+
+LISTEN_BACKLOG = 128
+
+# Number of recent requests whose latency is kept for the percentiles
+LATENCY_WINDOW = 10000
+
+REQUEST_PREDICT = 'predict'
+REQUEST_STATS = 'stats'
+
+
+def latency_summary(latencies):
+    """
+    :param latencies: ([float]) Latencies, in seconds.
+    :return: (dict) Their mean, percentiles and maximum, in milliseconds.
+    """
+    if len(latencies) == 0:
+        return {}
+
+    latencies_ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+
+    return {
+        'mean_ms': float(np.mean(latencies_ms)),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(np.max(latencies_ms)),
+    }
+
+
+class PendingRequest:
+    def __init__(self, observation):
+        self.observation = observation
+        self.received_time = time.perf_counter()
+        self.done = threading.Event()
+        self.action = None
+        self.error = None
+
+
+class InferenceStats:
+    """
+    Counters of the requests and batches answered by the server, updated by its batching thread.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.num_errors = 0
+        self.predict_time = 0.0
+        self.batch_sizes = Counter()
+        # Time from the arrival of a request to its action being ready
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.lock = threading.Lock()
+
+    def record_batch(self, requests, predict_time):
+        now = time.perf_counter()
+
+        with self.lock:
+            self.num_requests += len(requests)
+            self.num_batches += 1
+            self.num_errors += sum(1 for request in requests if request.error is not None)
+            self.predict_time += predict_time
+            self.batch_sizes[len(requests)] += 1
+            self.latencies.extend(now - request.received_time for request in requests)
+
+    def to_dict(self):
+        with self.lock:
+            uptime = time.perf_counter() - self.start_time
+
+            return {
+                'uptime': uptime,
+                'num_requests': self.num_requests,
+                'num_batches': self.num_batches,
+                'num_errors': self.num_errors,
+                'requests_per_second': self.num_requests / uptime,
+                'mean_batch_size': self.num_requests / self.num_batches if self.num_batches else None,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'predict_time': self.predict_time,
+                'latency': latency_summary(self.latencies),
+            }
+
+
+class InferenceServer:
+    """
+    Serves the actions of a model to the clients connected to it.
+
+    Each client connection is served by its own thread, which puts the observations it receives in a queue. A single
+    batching thread takes them from the queue in micro-batches and calls model.predict.
+
+    :param model: (BaseRLModel) The model, already loaded.
+    :param max_batch_size: (int) Maximum number of observations predicted at once.
+    :param max_wait: (float) Maximum time, in seconds, that the first observation of a batch waits for others.
+    :param deterministic: (bool) Whether the actions are deterministic.
+    """
+
+    def __init__(self, model, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait=DEFAULT_MAX_WAIT, deterministic=True):
+        self.model = model
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.deterministic = deterministic
+
+        self.request_queue = queue.Queue()
+        self.stats = InferenceStats()
+
+    def serve_forever(self, stats_interval=DEFAULT_STATS_INTERVAL):
+        threading.Thread(target=self._batch_requests, daemon=True).start()
+        if stats_interval:
+            threading.Thread(target=self._print_stats, args=(stats_interval,), daemon=True).start()
+
+        # Many clients (e.g. those of the load generator) may connect at the same time
+        with Listener(self.address, backlog=LISTEN_BACKLOG, authkey=self.authkey) as listener:
+            print("Inference server listening on {}:{} (max batch size: {}, max wait: {}s).".format(
+                self.address[0], self.address[1], self.max_batch_size, self.max_wait))
+
+            while True:
+                connection = listener.accept()
+                threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        with connection:
+            while True:
+                try:
+                    request_type, observation = connection.recv()
+                except EOFError:
+                    break
+
+                if request_type == REQUEST_STATS:
+                    connection.send({'status': 'ok', 'stats': self.stats.to_dict()})
+                    continue
+
+                request = PendingRequest(observation)
+                self.request_queue.put(request)
+                request.done.wait()
+
+                if request.error is not None:
+                    connection.send({'status': 'failed', 'error': request.error})
+                else:
+                    connection.send({'status': 'ok', 'action': request.action})
+
+    def _next_batch(self):
+        """
+        :return: ([PendingRequest]) The next requests to predict, once the batch is full or its first request has
+            waited max_wait.
+        """
+        batch = [self.request_queue.get()]
+        deadline = batch[0].received_time + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+
+            try:
+                # After the deadline, only the requests that are already waiting are added
+                if timeout > 0:
+                    batch.append(self.request_queue.get(timeout=timeout))
+                else:
+                    batch.append(self.request_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _batch_requests(self):
+        while True:
+            batch = self._next_batch()
+
+            start_time = time.perf_counter()
+
+            try:
+                self._predict(batch)
+            except Exception:
+                # An invalid observation must not fail the requests batched with it, so they are predicted one by one
+                for request in batch:
+                    try:
+                        self._predict([request])
+                    except Exception:
+                        request.error = traceback.format_exc()
+
+            self.stats.record_batch(batch, time.perf_counter() - start_time)
+
+            for request in batch:
+                request.done.set()
+
+    def _predict(self, requests):
+        actions, _ = self.model.predict(np.asarray([request.observation for request in requests]),
+                                        deterministic=self.deterministic)
+        for request, action in zip(requests, actions):
+            request.action = action
+
+    def _print_stats(self, interval):
+        while True:
+            time.sleep(interval)
+
+            stats = self.stats.to_dict()
+            if stats['num_requests'] == 0:
+                continue
+
+            print("{} requests ({:.1f}/s), mean batch size {:.1f}, latency p50 {:.2f}ms, p99 {:.2f}ms.".format(
+                stats['num_requests'], stats['requests_per_second'], stats['mean_batch_size'],
+                stats['latency']['p50_ms'], stats['latency']['p99_ms']))
+
+
+class InferenceClient:
+    """
+    A connection to an inference server. It sends one request at a time, so concurrent requests need one client each.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY):
+        self.connection = Client(address, authkey=authkey)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _request(self, request_type, observation=None):
+        self.connection.send((request_type, observation))
+        response = self.connection.recv()
+
+        if response['status'] != 'ok':
+            raise Exception("Request failed in the inference server:\n{}".format(response['error']))
+
+        return response
+
+    def predict(self, observation):
+        """
+        :return: The action of the model for a single observation.
+        """
+        return self._request(REQUEST_PREDICT, observation)['action']
+
+    def get_stats(self):
+        """
+        :return: (dict) The statistics of the server (see InferenceStats.to_dict).
+        """
+        return self._request(REQUEST_STATS)['stats']
+
+
+def load_model(run_dir, algorithm=None):
+    """
+    Loads the model of a run directory, whose algorithm is taken from its name unless given.
+
+    :return: (BaseRLModel, str, str) The model, and the algorithm and environment of the run (None if not in its name).
+    """
+    import training
+    from catalog import parse_run_name
+
+    run_algorithm, environment = parse_run_name(os.path.basename(os.path.normpath(run_dir)),
+                                                training.AVAILABLE_ALGORITHMS, training.AVAILABLE_ENVIRONMENTS)
+    algorithm = algorithm or run_algorithm
+
+    if algorithm is None:
+        raise Exception("The algorithm of run '{}' is unknown, it must be given.".format(run_dir))
+
+    model = training.get_algorithm_class(algorithm).load(os.path.join(run_dir, "model"))
+
+    return model, algorithm, environment
+
+
+if __name__ == '__main__':
+    import training
+
+    parser = argparse.ArgumentParser(description='Serve the actions of a trained model.')
+    parser.add_argument('run_dir', help='Directory of the run whose model is served')
+    parser.add_argument('--algorithm', choices=training.AVAILABLE_ALGORITHMS, default=None,
+                        help='Algorithm of the model (default: taken from the name of the run directory)')
+    parser.add_argument('--address', default='{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT), metavar='HOST:PORT',
+                        help='Address to listen on (default: {}:{})'.format(DEFAULT_HOST, DEFAULT_PORT))
+    parser.add_argument('--max-batch-size', type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help='Maximum number of observations predicted at once (default: {})'.format(
+                            DEFAULT_MAX_BATCH_SIZE))
+    parser.add_argument('--max-wait', type=float, default=DEFAULT_MAX_WAIT,
+                        help='Maximum time in seconds an observation waits for others to be batched with '
+                             '(default: {})'.format(DEFAULT_MAX_WAIT))
+    parser.add_argument('--stochastic', action='store_true', help='Sample the actions instead of taking the best one')
+    parser.add_argument('--stats-interval', type=float, default=DEFAULT_STATS_INTERVAL,
+                        help='Print the statistics every this number of seconds, 0 to never print them (default: {})'
+                        .format(DEFAULT_STATS_INTERVAL))
+
+    args = parser.parse_args()
+
+    loaded_model, _, _ = load_model(args.run_dir, args.algorithm)
+
+    InferenceServer(loaded_model, parse_address(args.address), max_batch_size=args.max_batch_size,
+                    max_wait=args.max_wait, deterministic=not args.stochastic).serve_forever(args.stats_interval)
@@ -0,0 +1,320 @@
+"""
+Live view of the learning curves of the runs that are still training.
+
+The monitor files of every run under training_info/ are tailed: each poll only reads the bytes appended since the
+previous one, and every new episode updates the moving average of its run in constant time. The curves are printed as
+a terminal summary and/or redrawn into a figure file on an interval.
+
+Usage:
+    python live_monitor.py --interval 10 --figure figures/live.png
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+import episode_log
+import training
+from catalog import RunCatalog, STATUS_RUNNING
+
+DEFAULT_TRAINING_INFO_DIR = "training_info"
+DEFAULT_INTERVAL = 10  # seconds
+DEFAULT_WINDOW = 100  # episodes
+
+
+class RunningCurve:
+    """
+    Learning curve of a run, with the moving average of its rewards updated in O(1) per episode.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.recent_rewards = deque()
+        self.recent_sum = 0.0
+
+        self.num_episodes = 0
+        self.num_timesteps = 0
+        self.last_time = 0.0
+
+        # One point per episode: cumulative timesteps and moving average of the reward
+        self.timesteps = []
+        self.smoothed_rewards = []
+
+    def add_episode(self, reward, length, elapsed_time):
+        self.recent_rewards.append(reward)
+        self.recent_sum += reward
+        if len(self.recent_rewards) > self.window:
+            self.recent_sum -= self.recent_rewards.popleft()
+
+        self.num_episodes += 1
+        self.num_timesteps += length
+        self.last_time = elapsed_time
+
+        self.timesteps.append(self.num_timesteps)
+        self.smoothed_rewards.append(self.moving_average)
+
+    @property
+    def moving_average(self):
+        if not self.recent_rewards:
+            return float('nan')
+        return self.recent_sum / len(self.recent_rewards)
+
+
+class CsvTail:
+    """
+    Reads the episodes appended to a CSV monitor file since the last read.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.remainder = b''
+        self.header_lines_left = 2  # The JSON line and the column names
+
+    def read_episodes(self):
+        with open(self.filename, 'rb') as file_handler:
+            file_handler.seek(self.offset)
+            data = file_handler.read()
+        self.offset += len(data)
+
+        # The last line may still be being written
+        lines = (self.remainder + data).split(b'\n')
+        self.remainder = lines.pop()
+
+        episodes = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if self.header_lines_left > 0:
+                self.header_lines_left -= 1
+                continue
+            reward, length, elapsed_time = line.split(b',')[:3]
+            episodes.append((float(reward), int(length), float(elapsed_time)))
+
+        return episodes
+
+
+class EpisodeLogTail:
+    """
+    Reads the blocks appended to a binary episode log since the last read.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = None
+        self.row_dtype = None
+
+    def read_episodes(self):
+        with open(self.filename, 'rb') as file_handler:
+            if self.offset is None:
+                prefix = file_handler.read(len(episode_log.MAGIC) + 8)
+                if len(prefix) < len(episode_log.MAGIC) + 8:
+                    return []
+                header_size = int(np.frombuffer(prefix[len(episode_log.MAGIC):], dtype='<u8')[0])
+                header = json.loads(file_handler.read(header_size).decode())
+                self.row_dtype = [(name, np.dtype(dtype)) for name, dtype in header['columns']]
+                self.offset = len(prefix) + header_size
+
+            file_handler.seek(self.offset)
+            data = file_handler.read()
+
+        row_size = sum(dtype.itemsize for _, dtype in self.row_dtype)
+        episodes = []
+        position = 0
+
+        while position + 8 <= len(data):
+            count = int(np.frombuffer(data, dtype='<u8', count=1, offset=position)[0])
+            if position + 8 + count * row_size > len(data):
+                # The block is still being written
+                break
+            position += 8
+
+            columns = {}
+            for name, dtype in self.row_dtype:
+                columns[name] = np.frombuffer(data, dtype=dtype, count=count, offset=position)
+                position += count * dtype.itemsize
+
+            episodes.extend(zip(columns['r'].tolist(), columns['l'].tolist(), columns['t'].tolist()))
+
+        self.offset += position
+
+        return episodes
+
+
+class LiveMonitor:
+    """
+    Keeps the curves of every run under a training info directory up to date.
+    """
+
+    def __init__(self, training_info_dir=DEFAULT_TRAINING_INFO_DIR, window=DEFAULT_WINDOW):
+        self.training_info_dir = training_info_dir
+        self.window = window
+
+        self.catalog = RunCatalog(os.path.join(training_info_dir, training.CATALOG_FILE_NAME))
+        self.catalog.index_existing_runs(training_info_dir, training.AVAILABLE_ALGORITHMS,
+                                         training.AVAILABLE_ENVIRONMENTS)
+
+        # Run directory -> (algorithm, environment, RunningCurve)
+        self.runs = {}
+        # (device, inode) of a monitor file -> (run directory, tail). Files are identified by their inode, so that
+        # renaming one (as archive_monitors does when a run is resumed) does not make it look like a new file.
+        self.tails = {}
+        # Runs whose monitor files can no longer change, or that had already finished when first seen
+        self.finished_runs = set()
+
+    def _discover_files(self):
+        for run in self.catalog.find_runs():
+            run_dir = run['log_dir']
+
+            # A finished run may be resumed (training.py --resume)
+            if run['status'] == STATUS_RUNNING:
+                self.finished_runs.discard(run_dir)
+
+            if run_dir in self.finished_runs or not os.path.isdir(run_dir):
+                continue
+
+            if run_dir not in self.runs:
+                # Only the runs that are training are followed
+                if run['status'] != STATUS_RUNNING:
+                    self.finished_runs.add(run_dir)
+                    continue
+
+                self.runs[run_dir] = (run['algorithm'], run['environment'], RunningCurve(self.window))
+
+            # A run with several environments logs each one in the workers subdirectory while it trains
+            worker_monitor_dir = os.path.join(run_dir, training.WORKER_MONITOR_DIR_NAME)
+            directory = worker_monitor_dir if os.path.isdir(worker_monitor_dir) else run_dir
+
+            for name in os.listdir(directory):
+                if name.endswith("monitor.csv"):
+                    tail_class = CsvTail
+                elif name.endswith(episode_log.EXT):
+                    tail_class = EpisodeLogTail
+                else:
+                    continue
+
+                filename = os.path.join(directory, name)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+
+                key = (stat.st_dev, stat.st_ino)
+                tail = self.tails[key][1] if key in self.tails else None
+
+                # A file shorter than what was read of the inode is a new file that reuses the inode of a deleted one
+                if tail is not None and (tail.offset or 0) <= stat.st_size:
+                    tail.filename = filename
+                else:
+                    self.tails[key] = (run_dir, tail_class(filename))
+
+            # Its files are read one last time in this poll
+            if run['status'] != STATUS_RUNNING:
+                self.finished_runs.add(run_dir)
+
+    def poll(self):
+        """
+        Reads the episodes written since the last poll.
+
+        :return: (int) Number of new episodes.
+        """
+        self._discover_files()
+
+        num_new_episodes = 0
+
+        for filename, (run_name, tail) in self.tails.items():
+            curve = self.runs[run_name][2]
+            try:
+                episodes = tail.read_episodes()
+            except (OSError, ValueError):
+                continue
+
+            for reward, length, elapsed_time in episodes:
+                curve.add_episode(reward, length, elapsed_time)
+            num_new_episodes += len(episodes)
+
+        return num_new_episodes
+
+    def groups(self):
+        """
+        :return: ({(str, str): [RunningCurve]}) The curves of the runs of every (algorithm, environment) pair.
+        """
+        groups = {}
+        for algorithm, environment, curve in self.runs.values():
+            groups.setdefault((algorithm, environment), []).append(curve)
+        return groups
+
+    def print_summary(self):
+        print("{:<8} {:<12} {:>5} {:>9} {:>12} {:>14}".format("alg", "env", "runs", "episodes", "timesteps",
+                                                            "avg reward"))
+
+        for (algorithm, environment), curves in sorted(self.groups().items()):
+            num_episodes = sum(curve.num_episodes for curve in curves)
+            num_timesteps = sum(curve.num_timesteps for curve in curves)
+            average_reward = np.nanmean([curve.moving_average for curve in curves]) if num_episodes else float('nan')
+            print("{:<8} {:<12} {:>5} {:>9} {:>12} {:>14.3f}".format(algorithm, environment, len(curves),
+                                                                    num_episodes, num_timesteps, average_reward))
+
+    def save_figure(self, figure_file_name):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        groups = self.groups()
+        environments = sorted({environment for _, environment in groups})
+
+        if not environments:
+            return
+
+        fig, axes = plt.subplots(len(environments), 1, figsize=(8, 3 * len(environments)), squeeze=False)
+
+        for ax, environment in zip(axes[:, 0], environments):
+            for (algorithm, group_environment), curves in sorted(groups.items()):
+                if group_environment != environment:
+                    continue
+                for i, curve in enumerate(curves):
+                    ax.plot(curve.timesteps, curve.smoothed_rewards, linewidth=1,
+                            color='C{}'.format(training.AVAILABLE_ALGORITHMS.index(algorithm)),
+                            label=algorithm if i == 0 else None)
+            ax.set_title(environment)
+            ax.set_xlabel("Number of Timesteps")
+            ax.set_ylabel("Average Reward")
+            ax.legend(loc=0)
+
+        fig.tight_layout()
+
+        training.create_dir(figure_file_name)
+        fig.savefig(figure_file_name)
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Follow the learning curves of the runs that are training.')
+    parser.add_argument('--training-info-dir', default=DEFAULT_TRAINING_INFO_DIR,
+                        help='Directory with the runs (default: {})'.format(DEFAULT_TRAINING_INFO_DIR))
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='Seconds between updates (default: {})'.format(DEFAULT_INTERVAL))
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help='Number of episodes of the moving average (default: {})'.format(DEFAULT_WINDOW))
+    parser.add_argument('--figure', default=None, help='Figure file redrawn on every update')
+    parser.add_argument('--once', action='store_true', help='Update once and exit')
+
+    args = parser.parse_args()
+
+    monitor = LiveMonitor(args.training_info_dir, args.window)
+
+    while True:
+        monitor.poll()
+        monitor.print_summary()
+
+        if args.figure is not None:
+            monitor.save_figure(args.figure)
+
+        if args.once:
+            break
+
+        time.sleep(args.interval)
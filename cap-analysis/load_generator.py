@@ -0,0 +1,111 @@
+"""
+Load generator for the inference server.
+
+A number of clients, each in its own thread with its own connection, send observations of an environment to the
+server as fast as it answers them. The latency seen by the clients and the throughput are reported, together with the
+statistics of the server, which show how the requests were batched.
+
+Usage:
+    python load_generator.py cpa_dense --clients 16 --requests 1000
+"""
+
+import argparse
+import threading
+import time
+
+import training
+from inference_server import DEFAULT_HOST, DEFAULT_PORT, InferenceClient, latency_summary
+from worker import DEFAULT_AUTHKEY, parse_address
+
+DEFAULT_N_CLIENTS = 16
+DEFAULT_N_REQUESTS = 1000  # per client
+NUM_OBSERVATIONS = 1000
+
+
+def sample_observations(environment, num_observations=NUM_OBSERVATIONS, seed=0):
+    observation_space = training.make_env(environment).observation_space
+    observation_space.seed(seed)
+    return [observation_space.sample() for _ in range(num_observations)]
+
+
+def run_client(address, authkey, observations, num_requests, latencies, start_barrier):
+    try:
+        client = InferenceClient(address, authkey)
+    except Exception:
+        # Otherwise the other clients would wait for this one forever
+        start_barrier.abort()
+        raise
+
+    with client:
+        start_barrier.wait()
+
+        for i in range(num_requests):
+            start_time = time.perf_counter()
+            client.predict(observations[i % len(observations)])
+            latencies.append(time.perf_counter() - start_time)
+
+
+def generate_load(observations, address, authkey=DEFAULT_AUTHKEY, n_clients=DEFAULT_N_CLIENTS,
+                  n_requests=DEFAULT_N_REQUESTS):
+    """
+    Sends n_requests observations from each of n_clients concurrent clients, each waiting for the answer to a request
+    before sending the next one.
+
+    :return: (dict) The throughput and latency seen by the clients, and the statistics of the server afterwards.
+    """
+    latencies_per_client = [[] for _ in range(n_clients)]
+    # The clients start together, once all of them are connected
+    start_barrier = threading.Barrier(n_clients + 1)
+
+    threads = [threading.Thread(target=run_client, args=(address, authkey, observations, n_requests, latencies,
+                                                         start_barrier), daemon=True)
+               for latencies in latencies_per_client]
+
+    for thread in threads:
+        thread.start()
+
+    start_barrier.wait()
+    start_time = time.perf_counter()
+
+    for thread in threads:
+        thread.join()
+
+    duration = time.perf_counter() - start_time
+    latencies = [latency for client_latencies in latencies_per_client for latency in client_latencies]
+
+    with InferenceClient(address, authkey) as client:
+        server_stats = client.get_stats()
+
+    return {
+        'n_clients': n_clients,
+        'num_requests': len(latencies),
+        'duration': duration,
+        'requests_per_second': len(latencies) / duration,
+        'latency': latency_summary(latencies),
+        'server': server_stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark a running inference server.')
+    parser.add_argument('environment', choices=training.AVAILABLE_ENVIRONMENTS,
+                        help='Environment whose observations are sent')
+    parser.add_argument('--address', default='{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT), metavar='HOST:PORT',
+                        help='Address of the server (default: {}:{})'.format(DEFAULT_HOST, DEFAULT_PORT))
+    parser.add_argument('--clients', type=int, default=DEFAULT_N_CLIENTS,
+                        help='Number of concurrent clients (default: {})'.format(DEFAULT_N_CLIENTS))
+    parser.add_argument('--requests', type=int, default=DEFAULT_N_REQUESTS,
+                        help='Number of requests per client (default: {})'.format(DEFAULT_N_REQUESTS))
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the observations (default: 0)')
+
+    args = parser.parse_args()
+
+    report = generate_load(sample_observations(args.environment, seed=args.seed), parse_address(args.address),
+                           n_clients=args.clients, n_requests=args.requests)
+
+    print("{} requests from {} clients in {:.2f}s: {:.1f} requests/s.".format(
+        report['num_requests'], report['n_clients'], report['duration'], report['requests_per_second']))
+    print("Client latency: mean {mean_ms:.2f}ms, p50 {p50_ms:.2f}ms, p95 {p95_ms:.2f}ms, p99 {p99_ms:.2f}ms, "
+          "max {max_ms:.2f}ms.".format(**report['latency']))
+    print("Server: mean batch size {:.1f}, {:.2f}s in predict, batch sizes {}.".format(
+        report['server']['mean_batch_size'], report['server']['predict_time'], report['server']['batch_sizes']))
@@ -5,10 +5,15 @@ from typing import List
 
 from stable_baselines.results_plotter import load_results, X_EPISODES, X_WALLTIME, X_TIMESTEPS
 import matplotlib.pyplot as plt
+from matplotlib.colors import to_rgb
 import numpy as np
 from scipy.interpolate import make_interp_spline
 
 import training
+from aggregation import aggregate_runs, DEFAULT_N_BOOTSTRAP
+from catalog import RunCatalog, STATUS_COMPLETED
+from episode_log import get_episode_log_files, load_episode_logs
+from results_cache import ResultsCache
 
 Y_REWARDS = 'r'
 Y_EPISODE_LENGTH = 'l'
@@ -18,16 +23,38 @@ lines = ["-", "--", ":", "-."]
 markers = ['o', 'x', '+', '^']
 colors = ['#000000', '#222222', '#444444', '#666666']
 
-CURRENT_ALG = None
-LINE_NUMBER = None
-HANDLES = None
-MIN_NUM_TIMESTEPS = None
+# Set to None to always parse the runs again
+RESULTS_CACHE = ResultsCache()
+
+
+def parse_run(folder):
+    """
+    Parses the episodes of a run, from its binary episode logs if it has any, or from its CSV monitor files otherwise.
+
+    :param folder: (str) The directory of the run.
+    :return: (pandas.DataFrame) The 'r', 'l' and 't' columns of every episode.
+    """
+    if get_episode_log_files(folder):
+        return load_episode_logs(folder)
+    return load_results(folder)
+
+
+def load_run(folder):
+    """
+    Loads the episodes of a run through RESULTS_CACHE, so that each run is only parsed again when its logs change.
+
+    :param folder: (str) The directory of the run.
+    :return: (pandas.DataFrame) The 'r', 'l' and 't' columns of every episode.
+    """
+    if RESULTS_CACHE is None:
+        return parse_run(folder)
+    return RESULTS_CACHE.load(folder, parse_run)
 
 
 def calculate_average_time_per_timestep(dirs):
     tslist = []
     for folder in dirs:
-        timesteps = load_results(folder)
+        timesteps = load_run(folder)
         tslist.append(timesteps)
 
     xy_list = [ts2xy(timesteps_item, X_TIMESTEPS, Y_TIME_ELAPSED) for timesteps_item in tslist]
@@ -49,45 +76,32 @@ def calculate_average_time_per_timestep(dirs):
     return average_time_per_timestep
 
 
-def plot_average_reward_per_number_of_timesteps(dirs):
+def plot_average_reward_per_number_of_timesteps(dirs, label=None, max_timesteps=None, confidence_band=True):
     """
     Plots the average reward for cumulative timesteps of several runs.
     :param dirs: The list of directories with monitors for the runs that should be averaged.
-    :return:
+    :param label: The label of the line.
+    :param max_timesteps: Do not plot timesteps beyond this point (nor beyond the end of the shortest run).
+    :param confidence_band: Whether to shade the bootstrap confidence interval of the average.
+    :return: The plotted line, and the AggregateResult of the runs.
     """
-    global MIN_NUM_TIMESTEPS
+    xy_list = [ts2xy(load_run(folder), X_TIMESTEPS, Y_REWARDS) for folder in dirs]
 
-    tslist = []
-    for folder in dirs:
-        timesteps = load_results(folder)
-        tslist.append(timesteps)
+    result = aggregate_runs(xy_list, max_x=max_timesteps, n_bootstrap=DEFAULT_N_BOOTSTRAP if confidence_band else 0)
 
-    xy_list = [ts2xy(timesteps_item, X_TIMESTEPS, Y_REWARDS) for timesteps_item in tslist]
+    x_new, y_new = smooth_moving_average(result.x, result.mean, 100)
 
-    min_num_timesteps = np.Inf
-    for (i, (x, y)) in enumerate(xy_list):
-        min_num_timesteps = min(min_num_timesteps, x[-1])
-
-    # Determine the dataset with less timesteps, so that we do not plot timesteps beyond that point
-    MIN_NUM_TIMESTEPS = min(min_num_timesteps, MIN_NUM_TIMESTEPS)
-
-    # Create new timestep axis and average reward axis
-    x_timesteps = np.arange(0, MIN_NUM_TIMESTEPS, 5)
-    y_average_rewards = np.zeros(len(x_timesteps))
-
-    # Because the timesteps are different in each dataset, we need to
-    for (i, (x, y)) in enumerate(xy_list):
-        y_interpolated = np.interp(x_timesteps, x, y)
-        y_average_rewards = np.add(y_average_rewards, y_interpolated)
+    line, = plt.plot(x_new, y_new, linewidth=1, label=label)
 
-    num_datasets = len(xy_list)
-    average_y = np.true_divide(y_average_rewards, num_datasets)
+    if confidence_band:
+        _, ci_low = smooth_moving_average(result.x, result.ci_low, 100)
+        _, ci_high = smooth_moving_average(result.x, result.ci_high, 100)
+        # EPS does not support transparency, so the band is drawn with an opaque lighter color, below every line
+        background = np.array(to_rgb(plt.gca().get_facecolor()))
+        band_color = 0.2 * np.array(to_rgb(line.get_color())) + 0.8 * background
+        plt.fill_between(x_new, ci_low, ci_high, color=band_color, linewidth=0, zorder=1)
 
-    x_new, y_new = smooth_moving_average(x_timesteps, average_y, 100)
-
-    line, = plt.plot(x_new, y_new, linewidth=1, label=CURRENT_ALG)
-
-    HANDLES.append(line)
+    return line, result
 
 
 def plot_results(dirs, num_timesteps, xaxis, yaxis, task_name):
@@ -103,7 +117,7 @@ def plot_results(dirs, num_timesteps, xaxis, yaxis, task_name):
 
     tslist = []
     for folder in dirs:
-        timesteps = load_results(folder)
+        timesteps = load_run(folder)
         if num_timesteps is not None:
             timesteps = timesteps[timesteps.l.cumsum() <= num_timesteps]
         tslist.append(timesteps)
@@ -201,36 +215,34 @@ if __name__ == '__main__':
 
     plt.style.use('ggplot')
 
+    catalog = RunCatalog(os.path.join(TRAINING_INFO_DIR, training.CATALOG_FILE_NAME))
+    # Runs trained before the catalog existed are only found in the directory
+    catalog.index_existing_runs(TRAINING_INFO_DIR, training.AVAILABLE_ALGORITHMS, training.AVAILABLE_ENVIRONMENTS)
+
     for env in training.AVAILABLE_ENVIRONMENTS:
-        LINE_NUMBER = 0
-        HANDLES = []
-        MIN_NUM_TIMESTEPS = 100000
+        handles = []
+        # Determine the dataset with less timesteps, so that we do not plot timesteps beyond that point
+        min_num_timesteps = 100000
 
         found_dirs = True
 
         average_time_per_timestep = {}
 
         for alg in training.AVAILABLE_ALGORITHMS:
-            CURRENT_ALG = alg
-            search_term = '-' + alg + '-' + env
-
-            log_dirs = []
-
-            for dirpath, dirnames, filenames in os.walk(TRAINING_INFO_DIR):
-                for dirname in dirnames:
-                    if dirname.endswith(search_term):
-                        log_dirs.append(os.path.join(TRAINING_INFO_DIR, dirname))
+            log_dirs = [run['log_dir'] for run in catalog.find_runs(environment=env, algorithm=alg,
+                                                                   status=STATUS_COMPLETED)]
 
             if len(log_dirs) == 0:
                 found_dirs = False
                 continue
 
-            plot_average_reward_per_number_of_timesteps(log_dirs)
+            line, result = plot_average_reward_per_number_of_timesteps(log_dirs, label=alg,
+                                                                       max_timesteps=min_num_timesteps)
+            handles.append(line)
+            min_num_timesteps = result.end
 
             average_time_per_timestep[alg] = calculate_average_time_per_timestep(log_dirs)
 
-            LINE_NUMBER += 1
-
         if not found_dirs:
             continue
 
@@ -241,7 +253,7 @@ if __name__ == '__main__':
         plt.xlabel("Number of Timesteps")
         plt.ylabel("Average Reward")
         plt.tight_layout()
-        plt.legend(handles=HANDLES)
+        plt.legend(handles=handles)
 
         figure_file_name = 'figures' + os.path.sep + '{}.eps'.format(env)
 
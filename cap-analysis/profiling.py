@@ -0,0 +1,237 @@
+"""
+Opt-in profiling of the phases of a training run.
+
+PhaseProfiler wraps the methods that make up every phase of the training (environment steps, policy inference,
+gradient updates, Monitor bookkeeping and TensorBoard writes) in timers, which only cost a couple of perf_counter calls
+each. For every phase it keeps the number of calls, the total time with and without the phases nested in it, and a
+histogram of the durations in power-of-two buckets of microseconds.
+
+StackSampler periodically samples the stack of the training thread, and writes the samples in the folded format read
+by flame graph tools.
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_FILE_NAME = "profile.json"
+STACKS_FILE_NAME = "profile.stacks.txt"
+
+NUM_HISTOGRAM_BUCKETS = 32
+DEFAULT_SAMPLING_INTERVAL = 0.005  # seconds
+MAX_STACK_DEPTH = 64
+
+PHASE_ENV_STEP = 'env_step'
+PHASE_ENV_RESET = 'env_reset'
+PHASE_MONITOR = 'monitor'
+PHASE_ENV_COMPUTE = 'env_compute'
+PHASE_INFERENCE = 'inference'
+PHASE_GRADIENT_UPDATE = 'gradient_update'
+PHASE_TENSORBOARD = 'tensorboard'
+
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        # Time not spent in a nested phase
+        self.self_time = 0.0
+        self.min_time = float('inf')
+        self.max_time = 0.0
+        # Bucket i counts the durations in [2^(i-1), 2^i) microseconds (bucket 0 those under 1 microsecond)
+        self.histogram = [0] * NUM_HISTOGRAM_BUCKETS
+
+    def record(self, duration, self_duration):
+        self.count += 1
+        self.total_time += duration
+        self.self_time += self_duration
+        self.min_time = min(self.min_time, duration)
+        self.max_time = max(self.max_time, duration)
+
+        microseconds = duration * 1e6
+        bucket = 0 if microseconds < 1 else min(int(math.log2(microseconds)) + 1, NUM_HISTOGRAM_BUCKETS - 1)
+        self.histogram[bucket] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_time': self.total_time,
+            'self_time': self.self_time,
+            'mean_time': self.total_time / self.count if self.count else None,
+            'min_time': self.min_time if self.count else None,
+            'max_time': self.max_time,
+            # Upper bound of each bucket, in microseconds, and its count. Empty buckets are left out
+            'histogram_us': {str(2 ** i): count for i, count in enumerate(self.histogram) if count},
+        }
+
+
+class PhaseProfiler:
+    """
+    Times the phases of a training run, by wrapping the methods of the environment and the model that make them up.
+
+    Phases can be nested (e.g. the Monitor of an environment is called during the step of the vectorized
+    environment), in which case the time of the inner phase is also part of the total time of the outer one, but not
+    of its self time. The self times of all the phases and the 'other' time of the report add up to the wall time.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        # Time spent in nested phases, for every phase being timed
+        self.nested_times = []
+        self.notes = []
+
+        self.start_time = None
+        self.wall_time = 0.0
+
+    def timed(self, phase, function):
+        """
+        :return: (callable) function, timed as part of phase.
+        """
+        stats = self.stats.setdefault(phase, PhaseStats())
+        nested_times = self.nested_times
+
+        def timed_function(*args, **kwargs):
+            nested_times.append(0.0)
+            start_time = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start_time
+                nested_time = nested_times.pop()
+                if nested_times:
+                    nested_times[-1] += duration
+                stats.record(duration, duration - nested_time)
+
+        return timed_function
+
+    def wrap(self, obj, method_name, phase):
+        setattr(obj, method_name, self.timed(phase, getattr(obj, method_name)))
+
+    def instrument_env(self, env):
+        """
+        Times the steps and resets of a vectorized environment and, if they run in this process, its Monitors and the
+        environments they wrap.
+        """
+        from stable_baselines.bench import Monitor
+        from episode_log import EpisodeLogMonitor
+        from vec_monitor import VecMonitor
+
+        if isinstance(env, VecMonitor):
+            # The episode bookkeeping of VecMonitor happens around the step of the environment it wraps
+            self.wrap(env.venv, 'step_wait', PHASE_ENV_COMPUTE)
+            self.wrap(env, 'step_wait', PHASE_MONITOR)
+        elif hasattr(env, 'envs'):
+            for monitor in env.envs:
+                if isinstance(monitor, (Monitor, EpisodeLogMonitor)):
+                    self.wrap(monitor.env, 'step', PHASE_ENV_COMPUTE)
+                    self.wrap(monitor, 'step', PHASE_MONITOR)
+        else:
+            self.notes.append("The environments run in other processes, so their Monitors are not timed separately "
+                              "from '{}'.".format(PHASE_ENV_STEP))
+
+        self.wrap(env, 'step_async', PHASE_ENV_STEP)
+        self.wrap(env, 'step_wait', PHASE_ENV_STEP)
+        self.wrap(env, 'reset', PHASE_ENV_RESET)
+
+    def instrument_model(self, model):
+        """
+        Times the policy inference and the gradient updates of a stable-baselines model.
+        """
+        # DQN selects its actions with act, and the other algorithms with step
+        self.wrap(model, 'act' if hasattr(model, 'act') else 'step', PHASE_INFERENCE)
+        self.wrap(model, '_train_step', PHASE_GRADIENT_UPDATE)
+
+    @contextmanager
+    def instrument_tensorboard(self):
+        """
+        Times the writes of TensorBoard summaries while in the context.
+
+        The summaries are computed in the same session call as the gradient update, so only their writing is timed here.
+        """
+        import tensorflow as tf
+
+        add_summary = tf.summary.FileWriter.add_summary
+        timed_add_summary = self.timed(PHASE_TENSORBOARD, add_summary)
+
+        tf.summary.FileWriter.add_summary = timed_add_summary
+        try:
+            yield
+        finally:
+            tf.summary.FileWriter.add_summary = add_summary
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        self.wall_time += time.perf_counter() - self.start_time
+
+    def report(self, **extra):
+        """
+        :param extra: Other values to add to the report, e.g. the number of timesteps.
+        :return: (dict)
+        """
+        self_time = sum(stats.self_time for stats in self.stats.values())
+
+        report = {
+            'wall_time': self.wall_time,
+            'phases': {phase: stats.to_dict() for phase, stats in self.stats.items()},
+            # Whatever is not in any phase, e.g. the computation of the advantages or the logging of the algorithm
+            'other_time': self.wall_time - self_time,
+            'notes': self.notes,
+        }
+        report.update(extra)
+
+        return report
+
+    def write_report(self, filename, **extra):
+        with open(filename, 'w') as file_handler:
+            json.dump(self.report(**extra), file_handler, indent=2)
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread every interval seconds, in a background thread.
+
+    :param thread_id: (int) The thread to sample (default: the one that creates the sampler).
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLING_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.samples = Counter()
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, filename):
+        """
+        Writes the samples in the folded format: one line per distinct stack, outermost frame first, with its count.
+        """
+        with open(filename, 'w') as file_handler:
+            for stack, count in self.samples.most_common():
+                file_handler.write("{} {}\n".format(stack, count))
@@ -0,0 +1,134 @@
+"""
+On-disk cache of the episodes of each run, as decoded by plotting.load_run.
+
+Every entry is keyed on the run directory and stores the size and modification time of its monitor files, so it is
+invalidated as soon as one of them changes. Entries are also kept in memory, so the plotting functions that need the
+same run only load it once per process. When the cache grows beyond its size limit, the least recently used entries
+are evicted.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas
+
+from stable_baselines.results_plotter import get_monitor_files
+
+from episode_log import get_episode_log_files
+
+DEFAULT_CACHE_DIR = os.path.join("training_info", ".results_cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+COLUMNS = ('r', 'l', 't')
+
+
+def run_signature(folder):
+    """
+    :return: (str) A description of the monitor files of a run, that changes whenever one of them changes.
+    """
+    files = sorted(get_monitor_files(folder) + get_episode_log_files(folder))
+    signature = []
+
+    for filename in files:
+        stat = os.stat(filename)
+        signature.append((os.path.basename(filename), stat.st_size, stat.st_mtime_ns))
+
+    return json.dumps(signature)
+
+
+class ResultsCache:
+    """
+    :param cache_dir: (str) Directory where the entries are stored.
+    :param max_bytes: (int) Maximum total size of the entries on disk.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, folder):
+        key = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, folder, parse_run):
+        """
+        Returns the episodes of a run, parsing its monitor files only if they changed since they were cached.
+
+        :param parse_run: (callable) Function that parses the monitor files of a run, returning a DataFrame with the
+            'r', 'l' and 't' columns.
+        :return: (pandas.DataFrame) The episodes of the run.
+        """
+        signature = run_signature(folder)
+
+        if folder in self.memory and self.memory[folder][0] == signature:
+            self.hits += 1
+            return self.memory[folder][1]
+
+        entry_path = self.entry_path(folder)
+        data_frame = self._read_entry(entry_path, signature)
+
+        if data_frame is None:
+            self.misses += 1
+            data_frame = parse_run(folder)
+            self._write_entry(entry_path, signature, data_frame)
+            self._evict()
+        else:
+            self.hits += 1
+
+        self.memory[folder] = (signature, data_frame)
+
+        return data_frame
+
+    def _read_entry(self, entry_path, signature):
+        try:
+            with np.load(entry_path) as entry:
+                if str(entry['signature']) != signature:
+                    return None
+                data_frame = pandas.DataFrame({column: entry[column] for column in COLUMNS})
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # Mark the entry as recently used, for the eviction
+        os.utime(entry_path)
+
+        return data_frame
+
+    def _write_entry(self, entry_path, signature, data_frame):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Written to a temporary file first, so that a concurrent reader never sees a partial entry
+        temporary_path = "{}.{}.tmp".format(entry_path, os.getpid())
+        with open(temporary_path, 'wb') as entry_file:
+            np.savez(entry_file, signature=np.array(signature),
+                     **{column: data_frame[column].values for column in COLUMNS})
+        os.replace(temporary_path, entry_path)
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total_bytes = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total_bytes -= size
+
+    def clear(self):
+        self.memory = {}
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -1,13 +1,36 @@
-import sys
+import argparse
+import os
 
+import sweep
 import training
+import worker
+
+NUM_TIMESTEPS = 100000
+NUM_RUNS = 10
 
 if __name__ == '__main__':
-    NUM_TIMESTEPS = 100000
-    NUM_RUNS = 10
-
-    # Run every combination of algorithm and environment 10 times
-    for alg in training.AVAILABLE_ALGORITHMS:
-        for env in training.AVAILABLE_ENVIRONMENTS:
-            for _ in range(10):
-                training.train(env, alg, NUM_TIMESTEPS)
+    parser = argparse.ArgumentParser(description='Train every combination of algorithm and environment.')
+    parser.add_argument('--runs', type=int, default=NUM_RUNS,
+                        help='Number of runs of each combination (default: {})'.format(NUM_RUNS))
+    parser.add_argument('--timesteps', type=int, default=NUM_TIMESTEPS,
+                        help='Number of training timesteps of each run (default: {})'.format(NUM_TIMESTEPS))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='Number of runs trained at the same time (default: number of CPUs)')
+    parser.add_argument('--ledger', default=sweep.DEFAULT_LEDGER_PATH,
+                        help='File where completed runs are recorded, so that they are skipped when the sweep is '
+                             'restarted (default: {})'.format(sweep.DEFAULT_LEDGER_PATH))
+    parser.add_argument('--retries', type=int, default=sweep.DEFAULT_MAX_RETRIES,
+                        help='Number of times a failed run is retried (default: {})'.format(
+                            sweep.DEFAULT_MAX_RETRIES))
+    parser.add_argument('--daemon', default=None, metavar='HOST:PORT',
+                        help='Submit the runs to a training worker daemon (see worker.py) instead of training here')
+
+    args = parser.parse_args()
+
+    # Run every combination of algorithm and environment several times
+    jobs = sweep.make_jobs(training.AVAILABLE_ALGORITHMS, training.AVAILABLE_ENVIRONMENTS, args.runs, args.timesteps)
+
+    daemon_address = None if args.daemon is None else worker.parse_address(args.daemon)
+
+    sweep.run_sweep(jobs, max_workers=args.jobs, ledger_path=args.ledger, max_retries=args.retries,
+                    daemon_address=daemon_address)
@@ -0,0 +1,163 @@
+"""
+Asynchronous writing of the TensorBoard summaries of a training run.
+
+stable-baselines writes its summaries with tf.summary.FileWriter.add_summary on the training thread, after every
+update. AsyncSummaryWriter replaces it (and add_run_metadata) while installed, so that the training thread only puts the
+summaries in a bounded queue, and a background thread parses, filters and writes them. When the queue is full the
+summary is dropped instead of blocking the training.
+
+With a log frequency, the values of a summary are only written if the previous value with the same tag was written at
+least log_freq steps before, which keeps the event files of short runs small.
+"""
+
+import queue
+import threading
+import traceback
+from contextlib import contextmanager
+
+DEFAULT_MAX_QUEUE_SIZE = 1024
+
+# Tag under which the frequency of the run metadata (the traces of the session) is limited
+RUN_METADATA_TAG = 'run_metadata'
+
+
+class AsyncSummaryWriter:
+    """
+    :param log_freq: (int) Minimum number of steps between two values written with the same tag (None to write them
+        all).
+    :param max_queue_size: (int) Number of summaries waiting to be written after which new ones are dropped.
+    """
+
+    def __init__(self, log_freq=None, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        self.log_freq = log_freq
+        self.queue = queue.Queue(max_queue_size)
+
+        # Step of the last value written, by tag
+        self.last_steps = {}
+
+        self.num_written = 0
+        self.num_skipped = 0
+        self.num_dropped = 0
+
+        self.summary_class = None
+        self.add_summary = None
+        self.add_run_metadata = None
+
+    @contextmanager
+    def install(self):
+        """
+        Routes the summaries of every tf.summary.FileWriter through the queue while in the context. On exit, even
+        because of an exception, the summaries in the queue are written before the writers are restored.
+        """
+        import tensorflow as tf
+
+        file_writer_class = tf.summary.FileWriter
+        self.summary_class = tf.Summary
+        self.add_summary = add_summary = file_writer_class.add_summary
+        self.add_run_metadata = add_run_metadata = file_writer_class.add_run_metadata
+        flush = file_writer_class.flush
+        close = file_writer_class.close
+
+        def queued_add_summary(writer, summary, global_step=None):
+            self._put((writer, summary, None, global_step))
+
+        def queued_add_run_metadata(writer, run_metadata, tag, global_step=None):
+            self._put((writer, run_metadata, tag, global_step))
+
+        # stable-baselines flushes its writer at the end of learn, which must include the summaries still queued
+        def queued_flush(writer):
+            self.queue.join()
+            flush(writer)
+
+        def queued_close(writer):
+            self.queue.join()
+            close(writer)
+
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+        file_writer_class.add_summary = queued_add_summary
+        file_writer_class.add_run_metadata = queued_add_run_metadata
+        file_writer_class.flush = queued_flush
+        file_writer_class.close = queued_close
+
+        try:
+            yield self
+        finally:
+            self.queue.put(None)
+            thread.join()
+
+            file_writer_class.add_summary = add_summary
+            file_writer_class.add_run_metadata = add_run_metadata
+            file_writer_class.flush = flush
+            file_writer_class.close = close
+
+            if self.num_dropped:
+                print("Dropped {} TensorBoard summaries, which were produced faster than they could be written.".format(
+                    self.num_dropped))
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.num_dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception:
+                # A summary that cannot be written must not stop the training, nor the writing of the others
+                traceback.print_exc()
+            finally:
+                self.queue.task_done()
+
+    def _write(self, writer, summary, run_metadata_tag, global_step):
+        if run_metadata_tag is not None:
+            if self._is_due(RUN_METADATA_TAG, global_step):
+                self.add_run_metadata(writer, summary, run_metadata_tag, global_step)
+                self.num_written += 1
+            return
+
+        summary = self._filter(summary, global_step)
+        if summary is not None:
+            self.add_summary(writer, summary, global_step)
+            self.num_written += 1
+
+    def _is_due(self, tag, global_step):
+        if self.log_freq is None or global_step is None:
+            return True
+
+        last_step = self.last_steps.get(tag)
+        # The step goes back when a new learn starts counting from 0
+        if last_step is None or global_step - last_step >= self.log_freq or global_step < last_step:
+            self.last_steps[tag] = global_step
+            return True
+
+        self.num_skipped += 1
+        return False
+
+    def _filter(self, summary, global_step):
+        """
+        :return: (tf.Summary or bytes) The values of the summary that are due, or None if there are none.
+        """
+        if self.log_freq is None or global_step is None:
+            return summary
+
+        if isinstance(summary, bytes):
+            summary = self.summary_class.FromString(summary)
+
+        values = [value for value in summary.value if self._is_due(value.tag, global_step)]
+
+        if not values:
+            return None
+        if len(values) == len(summary.value):
+            return summary
+
+        filtered_summary = self.summary_class()
+        filtered_summary.value.extend(values)
+        return filtered_summary
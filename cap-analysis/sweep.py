@@ -0,0 +1,228 @@
+"""
+Runs a sweep of training jobs over a pool of processes.
+
+Every finished or failed attempt is appended to a ledger file, so that a sweep that is restarted skips the jobs that
+were already completed and only runs the missing (or failed) ones.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import training
+from catalog import RunCatalog, STATUS_COMPLETED, STATUS_FAILED
+
+DEFAULT_LEDGER_PATH = "training_info" + os.path.sep + "sweep_ledger.jsonl"
+DEFAULT_MAX_RETRIES = 2
+
+
+def config_hash(train_kwargs):
+    """
+    :return: (str) A short hash of the training arguments, the same in every process and sweep.
+    """
+    return hashlib.sha1(json.dumps(train_kwargs, sort_keys=True, default=str).encode()).hexdigest()[:8]
+
+
+def make_jobs(algorithms, environments, num_runs, timesteps, **train_kwargs):
+    """
+    Creates one job for every run of every combination of algorithm and environment.
+
+    The id of a job includes its timesteps and a hash of train_kwargs, so that a sweep with other settings does not
+    skip its jobs because those of a previous sweep were completed.
+
+    :param train_kwargs: Extra keyword arguments passed to training.train in every job.
+    :return: ([dict]) The jobs, each with a unique 'job_id'.
+    """
+    jobs = []
+    train_kwargs_hash = config_hash(train_kwargs)
+
+    for algorithm in algorithms:
+        for environment in environments:
+            for run in range(num_runs):
+                jobs.append({
+                    'job_id': "{}-{}-{}-{}-{}".format(algorithm, environment, timesteps, train_kwargs_hash, run),
+                    'environment': environment,
+                    'algorithm': algorithm,
+                    'timesteps': timesteps,
+                    'run': run,
+                    'train_kwargs': train_kwargs,
+                })
+
+    return jobs
+
+
+class JobLedger:
+    """
+    Append-only record of the attempts of every job of a sweep, stored as one JSON object per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+
+        if os.path.exists(path):
+            with open(path) as ledger_file:
+                for line in ledger_file:
+                    line = line.strip()
+                    # A line may be truncated if the sweep was killed while writing it
+                    try:
+                        self.entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+
+    def completed_job_ids(self):
+        return {entry['job_id'] for entry in self.entries if entry['status'] == STATUS_COMPLETED}
+
+    def attempts(self, job_id):
+        return sum(1 for entry in self.entries if entry['job_id'] == job_id)
+
+    def record(self, entry):
+        training.create_dir(self.path)
+
+        with open(self.path, 'a') as ledger_file:
+            ledger_file.write(json.dumps(entry) + '\n')
+            ledger_file.flush()
+            os.fsync(ledger_file.fileno())
+
+        self.entries.append(entry)
+
+
+def run_job(job, daemon_address=None):
+    """
+    Runs a single job. This is the function executed in the worker processes.
+
+    :param daemon_address: (tuple) If given, the job is submitted to the training worker daemon at this address, which
+        already has TensorFlow loaded, instead of being trained in the worker process.
+    :return: (dict) The run directory and the wall time of the training.
+    """
+    start_time = time.time()
+
+    if daemon_address is not None:
+        import worker
+
+        result = worker.submit(job['environment'], job['algorithm'], job['timesteps'], address=daemon_address,
+                               tag=job['job_id'], **job['train_kwargs'])
+        run_dir = result['run_dir']
+    else:
+        run_dir = training.train(job['environment'], job['algorithm'], job['timesteps'], tag=job['job_id'],
+                                 **job['train_kwargs'])
+
+    return {'run_dir': run_dir, 'duration': time.time() - start_time}
+
+
+def run_sweep(jobs, max_workers=None, ledger_path=DEFAULT_LEDGER_PATH, max_retries=DEFAULT_MAX_RETRIES,
+              daemon_address=None):
+    """
+    Runs the jobs that are not yet completed in the ledger, with at most max_workers jobs at the same time.
+
+    If daemon_address is given, the jobs are trained by the training worker daemon at that address (see worker.py),
+    and max_workers only limits how many of them are submitted to it at the same time.
+
+    A failed job is resubmitted until it has been attempted max_retries + 1 times in this sweep.
+
+    :return: (JobLedger) The ledger with the attempts of this sweep appended.
+    """
+    ledger = JobLedger(ledger_path)
+
+    # Jobs are tagged with their id in the run catalog, so runs that completed after the ledger was last written
+    # (e.g. when the sweep was killed while they were being saved) are not trained again either
+    with RunCatalog(os.path.join("training_info", training.CATALOG_FILE_NAME)) as catalog:
+        catalog_completed = {run['tag'] for run in catalog.find_runs(tag=[job['job_id'] for job in jobs],
+                                                                    status=STATUS_COMPLETED)}
+
+    completed = ledger.completed_job_ids() | catalog_completed
+    pending = [job for job in jobs if job['job_id'] not in completed]
+
+    num_skipped = len(jobs) - len(pending)
+    if num_skipped > 0:
+        print("Skipping {} jobs that were already completed.".format(num_skipped))
+
+    num_finished = 0
+    num_jobs = len(pending)
+    num_failures = {}
+    sweep_start_time = time.time()
+
+    def record_attempt(job, status, result=None, error=None):
+        nonlocal num_finished
+
+        entry = {
+            'job_id': job['job_id'],
+            'environment': job['environment'],
+            'algorithm': job['algorithm'],
+            'timesteps': job['timesteps'],
+            'run': job['run'],
+            'status': status,
+            'attempt': ledger.attempts(job['job_id']) + 1,
+            'finished_at': time.time(),
+        }
+
+        if result is not None:
+            entry['run_dir'] = result['run_dir']
+            entry['duration'] = result['duration']
+            entry['timesteps_per_second'] = job['timesteps'] / result['duration']
+
+        if error is not None:
+            entry['error'] = error
+
+        ledger.record(entry)
+
+        if status == STATUS_COMPLETED:
+            num_finished += 1
+            elapsed = time.time() - sweep_start_time
+            print("[{}/{}] {} finished in {:.1f}s ({:.1f} timesteps/s). {:.2f} jobs/min overall.".format(
+                num_finished, num_jobs, job['job_id'], result['duration'], entry['timesteps_per_second'],
+                60 * num_finished / elapsed))
+            return True
+
+        print("[{}/{}] {} failed (attempt {}): {}".format(num_finished, num_jobs, job['job_id'], entry['attempt'],
+                                                         error))
+
+        num_failures[job['job_id']] = num_failures.get(job['job_id'], 0) + 1
+        if num_failures[job['job_id']] <= max_retries:
+            return False
+
+        # Gave up on this job, but it still counts towards the progress of the sweep
+        num_finished += 1
+        return True
+
+    queue = list(pending)
+
+    while queue:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(run_job, job, daemon_address): job for job in queue}
+        queue = []
+
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    job = futures.pop(future)
+
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        # A worker died (e.g. killed by the OOM killer), taking the pool with it. Every job that was
+                        # still in it is resubmitted to a new pool.
+                        raise
+                    except Exception as exc:
+                        # Retried in a new pool, once the jobs of this one have finished
+                        if not record_attempt(job, STATUS_FAILED, error=repr(exc)):
+                            queue.append(job)
+                    else:
+                        record_attempt(job, STATUS_COMPLETED, result=result)
+        except BrokenProcessPool as exc:
+            futures[future] = job
+
+            for future, job in futures.items():
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    record_attempt(job, STATUS_COMPLETED, result=future.result())
+                elif not record_attempt(job, STATUS_FAILED, error=repr(exc)):
+                    queue.append(job)
+        finally:
+            executor.shutdown(wait=True)
+
+    return ledger
@@ -1,14 +1,31 @@
 import argparse
+import contextlib
 import errno
 import os
+import time
 
 from datetime import datetime
 
 AVAILABLE_ALGORITHMS = ['acktr', 'ppo', 'a2c', 'dqn']
-AVAILABLE_ENVIRONMENTS = ['cpa_sparse', 'cpa_dense', 'mc_sparse', 'mpc_dense']
+AVAILABLE_ENVIRONMENTS = ['cpa_sparse', 'cpa_dense', 'mc_sparse', 'mc_dense']
 DEFAULT_TIMESTEPS = 100000
 
+# 'dummy' steps one gym.Env per slot in the main process, 'subproc' and 'shm' step them in worker processes (the latter
+# sharing the results through shared memory) and 'native' uses an environment that steps every slot at once
+AVAILABLE_VEC_BACKENDS = ['dummy', 'subproc', 'shm', 'native']
+DEFAULT_VEC_BACKEND = 'dummy'
+DEFAULT_N_ENVS = 1
+
+# 'csv' is the Monitor format read by load_results, 'binary' the columnar format of episode_log.py
+AVAILABLE_LOG_FORMATS = ['csv', 'binary']
+DEFAULT_LOG_FORMAT = 'csv'
+
 TENSORBOARD_DIR_NAME = 'tensorboard'
+WORKER_MONITOR_DIR_NAME = 'workers'
+CATALOG_FILE_NAME = 'catalog.sqlite'
+
+# Prefix of the episode logs of the previous attempts of a resumed run
+RESUMED_MONITOR_PREFIX = 'resumed-'
 
 
 def create_dir(directory):
@@ -19,31 +36,22 @@ def create_dir(directory):
             raise
 
 
-def train(environment, algorithm, timesteps):
-    from envs import cpa, mountain_car
-
-    from stable_baselines.common.vec_env import DummyVecEnv
-    from stable_baselines.bench import Monitor
-    from stable_baselines import PPO2, ACKTR, DQN, A2C
-
-    now = datetime.now()
-    current_time = now.strftime("%Y-%m-%d-%H-%M-%S")
-
-    training_info_dir = "training_info" + os.path.sep
-    current_training_info = "{}-{}-{}".format(current_time, algorithm, environment)
-    current_training_info_dir = training_info_dir + current_training_info + os.path.sep
+def derive_worker_seeds(seed, n_envs):
+    """
+    Derives independent seeds for the environments of a vectorized environment, instead of seed, seed + 1, ...
 
-    model_file_path = current_training_info_dir + "model"
-    log_file_path = current_training_info_dir + "monitor.csv"
+    :return: ([int]) One seed per environment, or Nones if seed is None.
+    """
+    import numpy as np
 
-    tensorboard_dir = training_info_dir + TENSORBOARD_DIR_NAME + os.path.sep
+    if seed is None:
+        return [None] * n_envs
 
-    dirs_to_create = [model_file_path, tensorboard_dir, model_file_path]
+    return [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(n_envs)]
 
-    for directory in dirs_to_create:
-        create_dir(directory)
 
-    env = None
+def make_env(environment, seed=None):
+    from envs import cpa, mountain_car
 
     if environment == 'cpa_sparse':
         env = cpa.CPAEnvSparse()
@@ -56,31 +64,323 @@ def train(environment, algorithm, timesteps):
     else:
         raise Exception("Environment '{}' is unknown.".format(environment))
 
-    # Optional: PPO2 requires a vectorized environment to run
-    # the env is now wrapped automatically when passing it to the constructor
-    env = Monitor(env, filename=log_file_path, allow_early_resets=True)
-    env = DummyVecEnv([lambda: env])
+    if seed is not None:
+        env.seed(seed)
+
+    return env
+
+
+def make_native_vec_env(environment, n_envs):
+    from envs import vec_cpa, vec_mountain_car
+
+    if environment == 'cpa_sparse':
+        return vec_cpa.CPAVecEnvSparse(n_envs)
+    elif environment == 'cpa_dense':
+        return vec_cpa.CPAVecEnvDense(n_envs)
+    elif environment == 'mc_sparse':
+        return vec_mountain_car.MountainCarSparseVecEnv(n_envs)
+    elif environment == 'mc_dense':
+        return vec_mountain_car.MountainCarDenseVecEnv(n_envs)
+    else:
+        raise Exception("Environment '{}' is unknown.".format(environment))
+
+
+def make_monitored_vec_env(environment, n_envs, vec_backend, log_dir, log_format=DEFAULT_LOG_FORMAT, seed=None):
+    """
+    Creates the vectorized environment used for training, with its episodes logged in log_dir.
+
+    With a seed, every environment is seeded with its own seed, derived from it by derive_worker_seeds.
+
+    With a single environment (or a native vectorized one) the log is written straight to 'monitor.csv' (or
+    'monitor.eplog' in the binary format). Otherwise, every environment writes its own log in the
+    WORKER_MONITOR_DIR_NAME subdirectory, and those logs are merged by merge_worker_monitors when the training ends.
+    """
+    from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+    from stable_baselines.bench import Monitor
+    from envs.shm_vec_env import SharedMemoryVecEnv
+    from episode_log import EpisodeLogMonitor
+    from vec_monitor import VecMonitor
+
+    if log_format not in AVAILABLE_LOG_FORMATS:
+        raise Exception("Log format '{}' is unknown.".format(log_format))
+
+    if vec_backend == 'native':
+        log_file_path = log_dir + ("monitor.csv" if log_format == 'csv' else "monitor.eplog")
+        venv = make_native_vec_env(environment, n_envs)
+        if seed is not None:
+            venv.seed(seed)
+        return VecMonitor(venv, filename=log_file_path, env_id=environment, log_format=log_format)
+
+    worker_seeds = derive_worker_seeds(seed, n_envs)
+
+    def make_monitored_env(index):
+        if n_envs == 1:
+            log_file_path = log_dir + ("monitor.csv" if log_format == 'csv' else "monitor.eplog")
+        else:
+            log_file_path = log_dir + WORKER_MONITOR_DIR_NAME + os.path.sep + str(index)
+
+        env_seed = worker_seeds[index]
+
+        if log_format == 'binary':
+            return lambda: EpisodeLogMonitor(make_env(environment, env_seed), filename=log_file_path)
+        return lambda: Monitor(make_env(environment, env_seed), filename=log_file_path, allow_early_resets=True)
 
-    model = None
+    if n_envs > 1:
+        create_dir(log_dir + WORKER_MONITOR_DIR_NAME + os.path.sep)
+
+    env_fns = [make_monitored_env(i) for i in range(n_envs)]
+
+    if vec_backend == 'dummy':
+        return DummyVecEnv(env_fns)
+    elif vec_backend == 'subproc':
+        return SubprocVecEnv(env_fns)
+    elif vec_backend == 'shm':
+        return SharedMemoryVecEnv(env_fns)
+    else:
+        raise Exception("Vectorized environment backend '{}' is unknown.".format(vec_backend))
+
+
+def merge_worker_monitors(environment, log_dir):
+    """
+    Merges the logs written by every environment of a run into its 'monitor.csv' (or 'monitor.eplog'), if there is
+    more than one.
+    """
+    from stable_baselines.results_plotter import get_monitor_files
+    from episode_log import get_episode_log_files, merge_episode_logs
+    from vec_monitor import merge_monitor_files
+
+    worker_monitor_dir = log_dir + WORKER_MONITOR_DIR_NAME
+
+    if not os.path.isdir(worker_monitor_dir):
+        return
+
+    if get_monitor_files(worker_monitor_dir):
+        merge_monitor_files(get_monitor_files(worker_monitor_dir), log_dir + "monitor.csv", env_id=environment)
+    if get_episode_log_files(worker_monitor_dir):
+        merge_episode_logs(worker_monitor_dir, log_dir + "monitor.eplog", env_id=environment)
+
+
+def get_algorithm_class(algorithm):
+    from stable_baselines import PPO2, ACKTR, DQN, A2C
 
     if algorithm == 'acktr':
-        model = ACKTR('MlpPolicy', env, verbose=1, tensorboard_log=tensorboard_dir)
+        return ACKTR
     elif algorithm == 'ppo':
-        model = PPO2('MlpPolicy', env, verbose=1, tensorboard_log=tensorboard_dir)
+        return PPO2
     elif algorithm == 'a2c':
-        model = A2C('MlpPolicy', env, verbose=1, tensorboard_log=tensorboard_dir)
+        return A2C
     elif algorithm == 'dqn':
-        model = DQN('MlpPolicy', env, verbose=1, tensorboard_log=tensorboard_dir)
+        return DQN
     else:
         raise Exception("Algorithm '{}' is unknown.".format(algorithm))
 
-    # Train the agent
-    model.learn(total_timesteps=timesteps, tb_log_name=current_training_info)
 
-    model.save(model_file_path)
+def archive_monitors(environment, log_dir):
+    """
+    Renames the episode logs of a run that is about to be resumed, which would otherwise be overwritten.
+
+    Their names still end with 'monitor.csv' (or 'monitor.eplog'), so they are loaded together with the logs of the
+    resumed training, and their episodes sorted by time.
+    """
+    import shutil
+
+    # The logs of every environment may not have been merged, if the run was killed
+    merge_worker_monitors(environment, log_dir)
+    shutil.rmtree(log_dir + WORKER_MONITOR_DIR_NAME, ignore_errors=True)
+
+    num_archived = len([name for name in os.listdir(log_dir) if name.startswith(RESUMED_MONITOR_PREFIX)])
+
+    for name in ("monitor.csv", "monitor.eplog"):
+        if os.path.isfile(log_dir + name):
+            os.rename(log_dir + name, log_dir + "{}{}.{}".format(RESUMED_MONITOR_PREFIX, num_archived, name))
+
+
+def train(environment, algorithm, timesteps, n_envs=DEFAULT_N_ENVS, vec_backend=DEFAULT_VEC_BACKEND, seed=None,
+          log_format=DEFAULT_LOG_FORMAT, tag=None, reward_threshold=None, reward_window=None, patience=None,
+          checkpoint_freq=None, keep_checkpoints=None, resume_dir=None, model_kwargs=None, profile=False,
+          profile_stacks=False, tensorboard=True, tensorboard_freq=None):
+    """
+    Trains a model, in a new run directory of training_info/ (or in resume_dir).
+
+    :param reward_threshold: (float) Stop the training once the moving average of the episode rewards, over
+        reward_window episodes, has been at least this for patience episodes (None to always train for timesteps).
+    :param checkpoint_freq: (int) Save a checkpoint every checkpoint_freq timesteps, and at the end of the training,
+        keeping the latest keep_checkpoints (None to not save checkpoints).
+    :param resume_dir: (str) Directory of a run to resume from its latest checkpoint, until it reaches timesteps. The
+        schedules of stable-baselines are built from the timesteps left, not from the whole run: the learning rate of
+        ACKTR (and of A2C or PPO2, if annealed) starts its schedule again, and the exploration of DQN follows a
+        shorter schedule from the restored timestep. A resumed run is therefore not the same as an uninterrupted one.
+    :param model_kwargs: (dict) Hyperparameters of the model, instead of the defaults of stable-baselines.
+    :param profile: (bool) Time every phase of the training, and write the timings to 'profile.json' in the run
+        directory (see profiling.py).
+    :param profile_stacks: (bool) Also sample the stack of the training, into 'profile.stacks.txt'.
+    :param tensorboard: (bool) Write TensorBoard summaries, in a background thread (see summary_writer.py).
+    :param tensorboard_freq: (int) Minimum number of steps between two values of the same summary (None to write every
+        value).
+    :return: (str) The directory of the run.
+    """
+    import callbacks
+    import profiling
+    import summary_writer
+    from catalog import RunCatalog, STATUS_COMPLETED, STATUS_FAILED, STATUS_RUNNING
+
+    if algorithm == 'dqn' and n_envs > 1:
+        raise Exception("Algorithm 'dqn' can only be trained with a single environment.")
+
+    training_info_dir = "training_info" + os.path.sep
+
+    if resume_dir is None:
+        now = datetime.now()
+        # Microseconds are included so that runs started at the same time by a sweep do not share a directory
+        current_time = now.strftime("%Y-%m-%d-%H-%M-%S-%f")
+
+        current_training_info = "{}-{}-{}".format(current_time, algorithm, environment)
+        current_training_info_dir = training_info_dir + current_training_info + os.path.sep
+    else:
+        current_training_info_dir = os.path.join(resume_dir, "")
+        current_training_info = os.path.basename(os.path.dirname(current_training_info_dir))
+
+    model_file_path = current_training_info_dir + "model"
+    checkpoint_dir = current_training_info_dir + callbacks.CHECKPOINT_DIR_NAME + os.path.sep
+
+    tensorboard_dir = training_info_dir + TENSORBOARD_DIR_NAME + os.path.sep if tensorboard else None
+
+    checkpoint_timesteps, checkpoint_path = callbacks.latest_checkpoint(checkpoint_dir)
+
+    if resume_dir is not None:
+        if checkpoint_path is None:
+            raise Exception("Run '{}' has no checkpoint to resume from.".format(resume_dir))
+        archive_monitors(environment, current_training_info_dir)
+
+    with RunCatalog(training_info_dir + CATALOG_FILE_NAME) as catalog:
+        run = catalog.get_run(run_dir=current_training_info_dir)
+
+        if run is None:
+            run_id = catalog.register_run(current_training_info_dir, environment, algorithm, timesteps=timesteps,
+                                          seed=seed, n_envs=n_envs, vec_backend=vec_backend, tag=tag,
+                                          model_path=model_file_path, log_dir=current_training_info_dir,
+                                          tensorboard_dir=tensorboard_dir)
+        else:
+            run_id = run['id']
+            catalog.update_run(run_id, status=STATUS_RUNNING, timesteps=timesteps,
+                               metadata={'resumed_from_timestep': checkpoint_timesteps})
+
+    # Only once the run is registered, or index_existing_runs could add its directory as a completed run
+    dirs_to_create = [model_file_path, model_file_path]
+    if tensorboard:
+        dirs_to_create.append(tensorboard_dir)
+
+    for directory in dirs_to_create:
+        create_dir(directory)
+
+    start_time = time.time()
+
+    try:
+        # Optional: PPO2 requires a vectorized environment to run
+        # the env is now wrapped automatically when passing it to the constructor
+        env = make_monitored_vec_env(environment, n_envs, vec_backend, current_training_info_dir, log_format=log_format,
+                                     seed=seed)
+
+        algorithm_class = get_algorithm_class(algorithm)
+        model_kwargs = model_kwargs or {}
+
+        if resume_dir is None:
+            model = algorithm_class('MlpPolicy', env, verbose=1, tensorboard_log=tensorboard_dir, seed=seed,
+                                    **model_kwargs)
+            start_timesteps = 0
+        else:
+            model = algorithm_class.load(checkpoint_path, env=env, verbose=1, tensorboard_log=tensorboard_dir,
+                                         seed=seed, **model_kwargs)
+            # The number of timesteps is not saved with the model
+            model.num_timesteps = start_timesteps = checkpoint_timesteps
+
+        learn_callbacks = []
+        checkpoint = None
+        stopping = None
+
+        if checkpoint_freq is not None:
+            checkpoint = callbacks.CheckpointCallback(
+                checkpoint_dir, checkpoint_freq,
+                callbacks.DEFAULT_KEEP_CHECKPOINTS if keep_checkpoints is None else keep_checkpoints)
+            learn_callbacks.append(checkpoint)
+
+        if reward_threshold is not None:
+            stopping = callbacks.RewardThresholdStopping(
+                env, reward_threshold,
+                window=callbacks.DEFAULT_REWARD_WINDOW if reward_window is None else reward_window,
+                patience=callbacks.DEFAULT_PATIENCE if patience is None else patience)
+            learn_callbacks.append(stopping)
+
+        profiler = None
+        stack_sampler = None
+        async_writer = None
+
+        if tensorboard:
+            async_writer = summary_writer.AsyncSummaryWriter(log_freq=tensorboard_freq)
+
+        if profile:
+            profiler = profiling.PhaseProfiler()
+            profiler.instrument_env(env)
+            profiler.instrument_model(model)
+        if profile_stacks:
+            stack_sampler = profiling.StackSampler()
+
+        # Train the agent
+        try:
+            # The profiler times the summaries put in the queue of the writer, which is what the training waits for
+            with async_writer.install() if async_writer is not None else contextlib.nullcontext(), \
+                    profiler.instrument_tensorboard() if profiler is not None else contextlib.nullcontext():
+                if profiler is not None:
+                    profiler.start()
+                if stack_sampler is not None:
+                    stack_sampler.start()
+
+                try:
+                    model.learn(total_timesteps=timesteps - start_timesteps, tb_log_name=current_training_info,
+                                callback=callbacks.CallbackList(learn_callbacks) if learn_callbacks else None,
+                                reset_num_timesteps=resume_dir is None)
+                finally:
+                    if profiler is not None:
+                        profiler.stop()
+                    if stack_sampler is not None:
+                        stack_sampler.stop()
+        finally:
+            env.close()
+            merge_worker_monitors(environment, current_training_info_dir)
+
+        if profiler is not None:
+            profiler.write_report(current_training_info_dir + profiling.PROFILE_FILE_NAME, environment=environment,
+                                  algorithm=algorithm, n_envs=n_envs, vec_backend=vec_backend,
+                                  timesteps=model.num_timesteps - start_timesteps)
+        if stack_sampler is not None:
+            stack_sampler.write(current_training_info_dir + profiling.STACKS_FILE_NAME)
+
+        model.save(model_file_path)
+
+        # So that the run can always be resumed to train it for longer
+        if checkpoint is not None:
+            checkpoint.save(model)
+    except BaseException:
+        with RunCatalog(training_info_dir + CATALOG_FILE_NAME) as catalog:
+            catalog.update_run(run_id, status=STATUS_FAILED, end_time=time.time())
+        raise
+
+    end_time = time.time()
+
+    metadata = {'trained_timesteps': model.num_timesteps}
+    if model_kwargs:
+        metadata['model_kwargs'] = model_kwargs
+    if stopping is not None:
+        metadata['stopped_at_timestep'] = stopping.stopped_at_timestep
+
+    with RunCatalog(training_info_dir + CATALOG_FILE_NAME) as catalog:
+        catalog.update_run(run_id, status=STATUS_COMPLETED, end_time=end_time, metadata=metadata,
+                           timesteps_per_second=(model.num_timesteps - start_timesteps) / (end_time - start_time))
 
     print("Finished training model: {}. Saved training info in: {}".format(model, current_training_info_dir))
 
+    return current_training_info_dir
+
     # # Test the trained agent
     # obs = env.reset()
     # n_steps = 20
@@ -108,6 +408,9 @@ def check_arguments(args):
     if (args.timesteps <= 0) or (not isinstance(args.timesteps, int)):
         raise argparse.ArgumentTypeError("Number of timesteps must be a positive integer and different than zero.")
 
+    if args.n_envs <= 0:
+        raise argparse.ArgumentTypeError("Number of environments must be a positive integer and different than zero.")
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Train a DRL model in a CPA env.')
@@ -116,9 +419,53 @@ if __name__ == '__main__':
     parser.add_argument('algorithm', help='The DRL algorithm. One of: '.format(AVAILABLE_ALGORITHMS))
     parser.add_argument('--timesteps', type=int, default=DEFAULT_TIMESTEPS,
                         help='Number of training timesteps (default: {})'.format(DEFAULT_TIMESTEPS))
+    parser.add_argument('--n-envs', type=int, default=DEFAULT_N_ENVS,
+                        help='Number of environments stepped in parallel (default: {})'.format(DEFAULT_N_ENVS))
+    parser.add_argument('--vec-backend', choices=AVAILABLE_VEC_BACKENDS, default=DEFAULT_VEC_BACKEND,
+                        help='How the environments are vectorized (default: {})'.format(DEFAULT_VEC_BACKEND))
+    parser.add_argument('--log-format', choices=AVAILABLE_LOG_FORMATS, default=DEFAULT_LOG_FORMAT,
+                        help='Format of the episode log (default: {})'.format(DEFAULT_LOG_FORMAT))
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the environments and the model')
+    parser.add_argument('--reward-threshold', type=float, default=None,
+                        help='Stop once the average episode reward stays at least this (default: never stop early)')
+    parser.add_argument('--reward-window', type=int, default=None,
+                        help='Number of episodes of the average reward (default: 20)')
+    parser.add_argument('--patience', type=int, default=None,
+                        help='Number of episodes the average reward must stay above the threshold (default: 50)')
+    parser.add_argument('--checkpoint-freq', type=int, default=None,
+                        help='Save a checkpoint every this number of timesteps (default: no checkpoints)')
+    parser.add_argument('--keep-checkpoints', type=int, default=None,
+                        help='Number of checkpoints kept, at least 1 (default: 3)')
+    parser.add_argument('--resume', default=None, metavar='RUN_DIR',
+                        help='Resume a run from its latest checkpoint, until it reaches --timesteps. The learning '
+                             'rate and exploration schedules restart over the remaining timesteps, so the result '
+                             'differs from an uninterrupted run')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time every phase of the training, into profile.json in the run directory')
+    parser.add_argument('--profile-stacks', action='store_true',
+                        help='Also sample the stack of the training, into profile.stacks.txt in the run directory')
+    parser.add_argument('--no-tensorboard', action='store_true', help='Do not write TensorBoard summaries')
+    parser.add_argument('--tensorboard-freq', type=int, default=None,
+                        help='Minimum number of steps between two values of the same TensorBoard summary '
+                             '(default: write every value)')
+    parser.add_argument('--daemon', default=None, metavar='HOST:PORT',
+                        help='Submit the run to a training worker daemon (see worker.py) instead of training here')
 
     args = parser.parse_args()
 
     check_arguments(args)
 
-    train(args.environment, args.algorithm, args.timesteps)
+    train_kwargs = dict(n_envs=args.n_envs, vec_backend=args.vec_backend, log_format=args.log_format,
+                        reward_threshold=args.reward_threshold, reward_window=args.reward_window,
+                        patience=args.patience, checkpoint_freq=args.checkpoint_freq,
+                        keep_checkpoints=args.keep_checkpoints, resume_dir=args.resume, profile=args.profile,
+                        profile_stacks=args.profile_stacks, tensorboard=not args.no_tensorboard,
+                        tensorboard_freq=args.tensorboard_freq)
+
+    if args.daemon is not None:
+        import worker
+
+        worker.submit(args.environment, args.algorithm, args.timesteps, seed=args.seed,
+                      address=worker.parse_address(args.daemon), **train_kwargs)
+    else:
+        train(args.environment, args.algorithm, args.timesteps, seed=args.seed, **train_kwargs)
@@ -0,0 +1,139 @@
+import csv
+import json
+import time
+
+import numpy as np
+
+from stable_baselines.common.vec_env import VecEnvWrapper
+
+from episode_log import EpisodeLogWriter
+
+
+class VecMonitor(VecEnvWrapper):
+    """
+    Monitor wrapper for native vectorized environments.
+
+    stable-baselines' Monitor can only wrap a single gym.Env, so this wrapper keeps track of the episodes of every
+    slot of a VecEnv and writes them to a file with the same format as Monitor's, so that load_results (and therefore
+    plotting.py) can read it. With log_format='binary', the episodes are written to a binary episode log instead
+    (see episode_log.py).
+    """
+    EXT = "monitor.csv"
+
+    def __init__(self, venv, filename, env_id=None, log_format='csv'):
+        VecEnvWrapper.__init__(self, venv)
+
+        self.t_start = time.time()
+
+        self.file_handler = None
+        self.episode_log_writer = None
+
+        if log_format == 'csv':
+            self.file_handler = open(filename, "wt")
+            self.file_handler.write('#%s\n' % json.dumps({"t_start": self.t_start, 'env_id': env_id}))
+            self.logger = csv.DictWriter(self.file_handler, fieldnames=('r', 'l', 't'))
+            self.logger.writeheader()
+            self.file_handler.flush()
+        elif log_format == 'binary':
+            self.episode_log_writer = EpisodeLogWriter(filename, t_start=self.t_start, env_id=env_id)
+        else:
+            raise Exception("Log format '{}' is unknown.".format(log_format))
+
+        self.episode_returns = np.zeros(self.num_envs, dtype=np.float64)
+        self.episode_lengths_so_far = np.zeros(self.num_envs, dtype=np.int64)
+
+        self.episode_rewards = []
+        self.episode_lengths = []
+        self.episode_times = []
+        self.total_steps = 0
+
+    def reset(self):
+        self.episode_returns[:] = 0
+        self.episode_lengths_so_far[:] = 0
+        return self.venv.reset()
+
+    def step_wait(self):
+        observations, rewards, dones, infos = self.venv.step_wait()
+
+        self.episode_returns += rewards
+        self.episode_lengths_so_far += 1
+        self.total_steps += self.num_envs
+
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                ep_info = {"r": round(float(self.episode_returns[i]), 6),
+                           "l": int(self.episode_lengths_so_far[i]),
+                           "t": round(time.time() - self.t_start, 6)}
+
+                self.episode_rewards.append(ep_info["r"])
+                self.episode_lengths.append(ep_info["l"])
+                self.episode_times.append(ep_info["t"])
+
+                if self.file_handler is not None:
+                    self.logger.writerow(ep_info)
+                else:
+                    self.episode_log_writer.write(ep_info["r"], ep_info["l"], ep_info["t"])
+                infos[i]['episode'] = ep_info
+
+            if self.file_handler is not None:
+                self.file_handler.flush()
+
+            self.episode_returns[dones] = 0
+            self.episode_lengths_so_far[dones] = 0
+
+        return observations, rewards, dones, infos
+
+    def close(self):
+        if self.file_handler is not None:
+            self.file_handler.close()
+            self.file_handler = None
+        if self.episode_log_writer is not None:
+            self.episode_log_writer.close()
+            self.episode_log_writer = None
+        return self.venv.close()
+
+    def get_total_steps(self):
+        return self.total_steps
+
+    def get_episode_rewards(self):
+        return self.episode_rewards
+
+    def get_episode_lengths(self):
+        return self.episode_lengths
+
+    def get_episode_times(self):
+        return self.episode_times
+
+
+def merge_monitor_files(monitor_files, filename, env_id=None):
+    """
+    Merges the logs of several monitors into a single file with the same format, with the episodes sorted by the time
+    at which they ended.
+
+    The times of the episodes are made relative to the earliest start time of the merged monitors, so the merged file
+    can be read by load_results exactly like the log of a single environment.
+
+    :param monitor_files: ([str]) The monitor logs to merge.
+    :param filename: (str) The merged log.
+    """
+    t_start = None
+    episodes = []
+
+    for monitor_file in monitor_files:
+        with open(monitor_file, 'rt') as file_handler:
+            header = json.loads(file_handler.readline()[1:])
+            t_start = header['t_start'] if t_start is None else min(t_start, header['t_start'])
+            if env_id is None:
+                env_id = header.get('env_id')
+
+            for row in csv.DictReader(file_handler):
+                episodes.append((header['t_start'] + float(row['t']), float(row['r']), int(row['l'])))
+
+    episodes.sort()
+
+    with open(filename, 'wt') as file_handler:
+        file_handler.write('#%s\n' % json.dumps({"t_start": t_start, 'env_id': env_id}))
+        logger = csv.DictWriter(file_handler, fieldnames=('r', 'l', 't'))
+        logger.writeheader()
+        for end_time, reward, length in episodes:
+            logger.writerow({"r": reward, "l": length, "t": round(end_time - t_start, 6)})
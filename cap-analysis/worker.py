@@ -0,0 +1,279 @@
+"""
+Long-lived training worker daemon.
+
+Importing TensorFlow and stable-baselines takes longer than many of the short CPA runs themselves. The daemon starts a
+number of worker processes that do those imports once, and then train the jobs submitted to it over a local socket,
+one at a time per worker, each in a fresh graph. Runs are written to training_info/ exactly as by training.train.
+
+Start the daemon with:
+    python worker.py --workers 4
+
+And submit jobs with 'python training.py ... --daemon localhost:6000', 'python run_training.py --daemon ...', or
+from Python with submit().
+"""
+
+import argparse
+import gc
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from multiprocessing.connection import Listener, Client
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 6000
+DEFAULT_ADDRESS = (DEFAULT_HOST, DEFAULT_PORT)
+DEFAULT_AUTHKEY = b'cap-analysis'
+DEFAULT_N_WORKERS = 1
+
+# Seconds between two checks that the workers are still alive
+WORKER_CHECK_INTERVAL = 1.0
+# Number of workers in a row that may die before taking a job (e.g. because an import fails) before the daemon stops
+# starting new ones
+MAX_WORKER_START_FAILURES = 3
+
+
+def parse_address(address):
+    """
+    Parses an address in the 'host:port' format (the host is optional).
+    """
+    host, _, port = address.rpartition(':')
+    return host or DEFAULT_HOST, int(port)
+
+
+def run_job(job):
+    """
+    Trains a single job, in a clean TensorFlow default graph.
+
+    stable-baselines models build their own graph and session, so the only state left behind by a run is the default
+    graph and whatever is still referenced by the model. Both are dropped after every job.
+
+    :return: (dict) The status of the job, with its run directory and wall time, or the error that made it fail.
+    """
+    import tensorflow as tf
+    import training
+
+    tf.reset_default_graph()
+
+    start_time = time.time()
+
+    try:
+        run_dir = training.train(job['environment'], job['algorithm'], job['timesteps'], seed=job.get('seed'),
+                                 **job.get('train_kwargs', {}))
+        result = {'status': 'completed', 'run_dir': run_dir}
+    except Exception:
+        result = {'status': 'failed', 'error': traceback.format_exc()}
+    finally:
+        tf.reset_default_graph()
+        gc.collect()
+
+    result['duration'] = time.time() - start_time
+
+    return result
+
+
+def _warm_worker(job_queue, result_queue, current_job):
+    # The heavy imports are done once, before taking the first job
+    import tensorflow  # noqa: F401
+    import stable_baselines  # noqa: F401
+    import training  # noqa: F401
+
+    while True:
+        item = job_queue.get()
+
+        if item is None:
+            break
+
+        job_id, job = item
+        # Written to shared memory right away (unlike the queue), for the daemon to know the job if this process dies
+        current_job[0] = job_id
+        current_job[1] = time.time()
+        result_queue.put((job_id, run_job(job)))
+
+
+class WorkerDaemon:
+    """
+    Accepts jobs from clients and dispatches them to a pool of warm worker processes.
+
+    Each client connection is served by its own thread, which waits for the results of the jobs it submitted. A worker
+    that dies (e.g. killed for running out of memory) fails the job it was training, and is replaced by a new one.
+    If MAX_WORKER_START_FAILURES workers in a row die before taking a job, no more are started, and every job, pending
+    or submitted later, fails.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, n_workers=DEFAULT_N_WORKERS, authkey=DEFAULT_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+
+        # The workers must not inherit anything from this process, so they are spawned rather than forked
+        self.context = multiprocessing.get_context('spawn')
+        self.job_queue = self.context.Queue()
+        self.result_queue = self.context.Queue()
+        self.n_workers = n_workers
+        # Worker processes, and the id and start time of the last job taken by each of them
+        self.workers = []
+        self.current_jobs = []
+
+        self.job_ids = itertools.count()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.num_start_failures = 0
+        # Why the workers can no longer be started, once they failed too many times in a row
+        self.start_error = None
+
+    def _start_worker(self):
+        current_job = self.context.Array('d', [-1, 0], lock=False)
+        worker = self.context.Process(target=_warm_worker, args=(self.job_queue, self.result_queue, current_job),
+                                      daemon=True)
+        worker.start()
+        return worker, current_job
+
+    def serve_forever(self):
+        self.workers, self.current_jobs = map(list, zip(*[self._start_worker() for _ in range(self.n_workers)]))
+
+        threading.Thread(target=self._dispatch_results, daemon=True).start()
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print("Training worker daemon listening on {}:{} with {} workers.".format(
+                self.address[0], self.address[1], len(self.workers)))
+
+            while True:
+                connection = listener.accept()
+                threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def _serve_client(self, connection):
+        with connection:
+            while True:
+                try:
+                    job = connection.recv()
+                except EOFError:
+                    break
+
+                result_ready = threading.Event()
+
+                with self.lock:
+                    job_id = next(self.job_ids)
+                    self.pending[job_id] = [result_ready, None]
+
+                    if self.start_error is not None:
+                        self.pending[job_id][1] = {'status': 'failed', 'error': self.start_error, 'duration': 0.0}
+                        result_ready.set()
+
+                print("Received job {}: {}".format(job_id, job))
+                if not result_ready.is_set():
+                    self.job_queue.put((job_id, job))
+
+                result_ready.wait()
+
+                with self.lock:
+                    _, result = self.pending.pop(job_id)
+
+                print("Job {} {} in {:.1f}s.".format(job_id, result['status'], result['duration']))
+                connection.send(result)
+
+    def _dispatch_results(self):
+        while True:
+            try:
+                self._set_result(*self.result_queue.get(timeout=WORKER_CHECK_INTERVAL))
+                # A worker finished a job, so they can be started
+                self.num_start_failures = 0
+            except queue.Empty:
+                pass
+
+            self._replace_dead_workers()
+
+    def _set_result(self, job_id, result):
+        with self.lock:
+            # The job of a dead worker may already have been failed
+            if job_id not in self.pending or self.pending[job_id][1] is not None:
+                return
+
+            self.pending[job_id][1] = result
+            self.pending[job_id][0].set()
+
+    def _replace_dead_workers(self):
+        for worker_id, worker in enumerate(self.workers):
+            if worker is None or worker.is_alive():
+                continue
+
+            # The results sent by the worker before it died are set first, its last job may have finished
+            while True:
+                try:
+                    self._set_result(*self.result_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            job_id, start_time = self.current_jobs[worker_id]
+
+            if job_id >= 0:
+                self._set_result(int(job_id), {
+                    'status': 'failed',
+                    'error': "The worker training the job died with exit code {}.".format(worker.exitcode),
+                    'duration': time.time() - start_time,
+                })
+            else:
+                self.num_start_failures += 1
+
+            if self.num_start_failures < MAX_WORKER_START_FAILURES:
+                print("Worker {} died with exit code {}, starting a new one.".format(worker_id, worker.exitcode))
+                self.workers[worker_id], self.current_jobs[worker_id] = self._start_worker()
+                continue
+
+            print("Worker {} died with exit code {} before taking a job, {} workers in a row did. Not starting a new "
+                  "one.".format(worker_id, worker.exitcode, self.num_start_failures))
+            self.workers[worker_id] = None
+
+            if all(worker is None for worker in self.workers):
+                self._fail_pending_jobs("The workers died with exit code {} before taking a job, {} times in a row. "
+                                        "See the output of the daemon.".format(worker.exitcode,
+                                                                               self.num_start_failures))
+
+    def _fail_pending_jobs(self, error):
+        with self.lock:
+            self.start_error = error
+
+            for job_id, (result_ready, result) in self.pending.items():
+                if result is None:
+                    self.pending[job_id][1] = {'status': 'failed', 'error': error, 'duration': 0.0}
+                    result_ready.set()
+
+
+def submit(environment, algorithm, timesteps, seed=None, address=DEFAULT_ADDRESS, authkey=DEFAULT_AUTHKEY,
+           **train_kwargs):
+    """
+    Submits a job to a running daemon, and waits until it has been trained.
+
+    :param train_kwargs: Extra keyword arguments passed to training.train.
+    :return: (dict) The result of the job, with the run directory and the wall time of the training.
+    """
+    job = {
+        'environment': environment,
+        'algorithm': algorithm,
+        'timesteps': timesteps,
+        'seed': seed,
+        'train_kwargs': train_kwargs,
+    }
+
+    with Client(address, authkey=authkey) as connection:
+        connection.send(job)
+        result = connection.recv()
+
+    if result['status'] != 'completed':
+        raise Exception("Job failed in the training worker daemon:\n{}".format(result['error']))
+
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start a daemon that trains the jobs submitted to it.')
+    parser.add_argument('--address', default='{}:{}'.format(DEFAULT_HOST, DEFAULT_PORT), metavar='HOST:PORT',
+                        help='Address to listen on (default: {}:{})'.format(DEFAULT_HOST, DEFAULT_PORT))
+    parser.add_argument('--workers', type=int, default=DEFAULT_N_WORKERS,
+                        help='Number of jobs trained at the same time (default: {})'.format(DEFAULT_N_WORKERS))
+
+    args = parser.parse_args()
+
+    WorkerDaemon(parse_address(args.address), args.workers).serve_forever()
@@ -1,64 +1,360 @@
+import argparse
+import csv
+import gc
+import json
+import math
+import os
 import random
 import sys
 import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.special import factorial
+from scipy.stats import ks_2samp
 from tqdm import tqdm
 
 MAX_ITERATIONS = 1e100
 TRIAL_COUNT = 10
+BATCHED_TRIAL_COUNT = 1000
+
+# Maximum number of random keys drawn at once by BatchedRandomSorter (8 bytes each)
+BATCH_MAX_KEYS = 2 ** 20
+
+STATISTICAL_LIST_LENGTHS = range(2, 21)
+VALIDATION_LIST_LENGTHS = range(2, 8)
+VALIDATION_TRIAL_COUNT = 2000
+
+DEFAULT_SEED = 0
+# Number of trials run by a worker process per task of the parallel runner
+TRIALS_PER_TASK = 10
+# Same for the sorters with a sort_batch, which sort all the trials of a task at once
+BATCHED_TRIALS_PER_TASK = 250
+
+# Input lists of the benchmark of the registered sorters
+DISTRIBUTIONS = ["random", "sorted", "reversed", "few-unique"]
+DEFAULT_DISTRIBUTION = "random"
+FEW_UNIQUE_VALUES = 4
+BENCHMARK_LIST_LENGTHS = [2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+BENCHMARK_METRICS = ["comparisons", "swaps"]
+BENCHMARK_TABLE_FILE = "comparison.csv"
+
+# Timing mode: every sample sorts enough copies of the list to last TIMING_MIN_SAMPLE_NS, up to TIMING_MAX_LOOPS copies
+DEFAULT_TIMING_REPEATS = 7
+DEFAULT_TIMING_WARMUP = 1
+TIMING_MIN_SAMPLE_NS = 200000
+TIMING_MAX_LOOPS = 10000
+# Samples further than this many (scaled) median absolute deviations from the median are outliers
+OUTLIER_MADS = 3
+
+# Results of every trial, appended as they finish
+DEFAULT_STORE_FILE = "trials.jsonl"
+TRIAL_METRICS = ["time", "operations", "comparisons", "swaps", "iterations"]
+
+# Sorter classes by the key used to select them in the benchmark
+SORTERS = {}
+
+def register_sorter(key):
+    def register(sorter_class):
+        SORTERS[key] = sorter_class
+        sorter_class.key = key
+        return sorter_class
+    return register
 
 def is_ordered_ascending(some_list):
-    for x, y in zip(some_list[:-1], some_list[1:]):
-        if x > y:
+    # Indexing rather than zipping two slices, which would copy the list on every check
+    for i in range(1, len(some_list)):
+        if some_list[i - 1] > some_list[i]:
             return False
     return True
 
+def splitmix_uniforms(seeds, counters):
+  """
+  Draws uniform numbers in [0, 1) from a SplitMix64 generator per seed, at the given positions of their streams.
+
+  Every number only depends on its seed and counter, so the rows of a batch each draw from their own stream, whatever
+  the other rows of the batch are, while the numbers of all the rows are still computed at once.
+
+  :param seeds: (np.ndarray) Seed of every number, broadcast with counters.
+  :param counters: (np.ndarray) Position of every number in the stream of its seed.
+  """
+  with np.errstate(over="ignore"):
+    z = seeds.astype(np.uint64) + (counters.astype(np.uint64) + np.uint64(1)) * np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+  # The 53 highest bits, which a double holds exactly
+  return (z >> np.uint64(11)) * 2.0 ** -53
+
 class Sorter:
+  # Key of the sorter in SORTERS, set by register_sorter
+  key = None
+  # Longest list the sorter can sort in a reasonable time (None if there is no such limit)
+  max_list_len = None
+
   def __init__(self, name):
     self.name = name
     self.number_iter = 0
     self.number_operations = 0  # An operation is a single swap between two elements of the array (exchanging position of two elements)
+    # The operations are the comparisons of two elements plus the swaps. Sorters that move single elements instead
+    # of exchanging two (e.g. Merge Sort) count a swap per element moved
+    self.number_comparisons = 0
+    self.number_swaps = 0
     self.time_elapsed = 0
 
   def sort():
     pass
 
+  def sort_uninstrumented(self, arr):
+    """
+    Sorts arr with the same algorithm as sort, but without counting anything, for the timing mode.
+    """
+    raise NotImplementedError("{} has no uninstrumented sort.".format(type(self).__name__))
+
+  def reset_counters(self):
+    self.number_iter = 0
+    self.number_operations = 0
+    self.number_comparisons = 0
+    self.number_swaps = 0
+    self.time_elapsed = 0
+
+  def stop_counters(self, start_time):
+    self.time_elapsed = time.time() - start_time
+    self.number_operations = self.number_comparisons + self.number_swaps
+
+  def greater(self, x, y):
+    self.number_comparisons += 1
+    return x > y
+
+  def swap(self, arr, i, j):
+    # Only real swaps are counted: exchanging an element with itself leaves the list as it was
+    if i == j:
+      return
+    self.number_swaps += 1
+    arr[i], arr[j] = arr[j], arr[i]
+
+  def check_ordered(self, arr):
+    # Counted as a full pass, like in Random Sort
+    self.number_comparisons += len(arr) - 1
+    return is_ordered_ascending(arr)
+
+@register_sorter("bogo")
 class RandomSorter(Sorter):
+  max_list_len = 10
 
   def __init__(self):
     super().__init__("Random Sort")
 
   def sort(self, arr):
-    self.number_iter = 0
-    self.number_operations = 0
-    self.time_elapsed = 0
+    self.reset_counters()
 
     start_time = time.time()
 
     while self.number_iter < MAX_ITERATIONS:
+      self.number_iter += 1
       random.shuffle(arr)
       self.number_operations += len(arr) 
+      self.number_swaps += len(arr)
       # The shuffle operations iterates every element, swapping it with an element in a lower index
       # Therefore, it does N operations (where N is the length of the array)
       
       ordered = is_ordered_ascending(arr)
       self.number_operations += len(arr) - 1
+      self.number_comparisons += len(arr) - 1
 
       if(ordered):
         self.time_elapsed = time.time() - start_time
         break
 
+  def sort_uninstrumented(self, arr):
+    while True:
+      random.shuffle(arr)
+      if is_ordered_ascending(arr):
+        return
+
+@register_sorter("bogo-batched")
+class BatchedRandomSorter(Sorter):
+  """
+  Random Sort over many independent trials at once, each trial being a row of a 2-D array.
+
+  Every step shuffles all the unfinished rows together, by sorting random keys, and checks which of them came out
+  ordered with a single diff. Finished rows are retired, and the rows still running are given several shuffles per step,
+  so that the long tail of the slowest trials does not take one step per shuffle. The iterations and operations are
+  counted as in RandomSorter: 2n - 1 operations per shuffle of a list of length n.
+  """
+
+  max_list_len = 10
+
+  def __init__(self, seed=None):
+    super().__init__("Random Sort")
+    self.rng = np.random.default_rng(seed)
+
+  def sort(self, arr):
+    arrays = np.array([arr])
+    self.sort_batch(arrays)
+
+    arr[:] = arrays[0].tolist()
+    self.number_iter = int(self.number_iter[0])
+    self.number_operations = int(self.number_operations[0])
+    self.number_comparisons = int(self.number_comparisons[0])
+    self.number_swaps = int(self.number_swaps[0])
+    self.time_elapsed = float(self.time_elapsed[0])
+
+  def sort_batch(self, arrays, seeds=None):
+    """
+    Sorts every row of arrays in place, each one by its own sequence of random shuffles.
+
+    Afterwards, number_iter, number_operations and time_elapsed are arrays with the value of every row. Rows are not
+    timed individually: each one is given a share of the total time proportional to its number of iterations.
+
+    :param seeds: (np.ndarray) Seed of the shuffles of every row (see splitmix_uniforms), so that the result of a row
+        does not depend on the other rows. Drawn from the generator of the sorter if None.
+    """
+    num_trials, list_len = arrays.shape
+    if seeds is None:
+      seeds = self.rng.integers(2 ** 64, size=num_trials, dtype=np.uint64)
+    seeds = np.asarray(seeds, dtype=np.uint64)
+
+    self.number_iter = np.zeros(num_trials, dtype=np.int64)
+    self.number_operations = np.zeros(num_trials, dtype=np.int64)
+    self.number_comparisons = np.zeros(num_trials, dtype=np.int64)
+    self.number_swaps = np.zeros(num_trials, dtype=np.int64)
+    self.time_elapsed = np.zeros(num_trials)
+
+    # Empty rows are already sorted
+    if list_len == 0:
+      return
+
+    start_time = time.time()
+
+    active = np.arange(num_trials)
+
+    while len(active) > 0:
+      # Shuffles per active row in this step
+      num_shuffles = max(1, BATCH_MAX_KEYS // (len(active) * list_len))
+
+      # Key j of the k-th shuffle of a row is number k * n + j of its stream
+      counters = ((self.number_iter[active, np.newaxis, np.newaxis] + np.arange(num_shuffles)[:, np.newaxis]) *
+                  list_len + np.arange(list_len))
+      keys = splitmix_uniforms(seeds[active, np.newaxis, np.newaxis], counters)
+      shuffled = arrays[active][np.arange(len(active))[:, np.newaxis, np.newaxis], keys.argsort(axis=2)]
+
+      ordered = (np.diff(shuffled, axis=2) >= 0).all(axis=2)
+      finished = ordered.any(axis=1)
+      # Index of the first ordered shuffle of every row (0 if there is none)
+      first_ordered = ordered.argmax(axis=1)
+
+      self.number_iter[active] += np.where(finished, first_ordered + 1, num_shuffles)
+
+      arrays[active[finished]] = shuffled[finished, first_ordered[finished]]
+      active = active[~finished]
+
+    # Every shuffle iterates over the n elements, and every check compares n - 1 pairs
+    self.number_swaps = self.number_iter * list_len
+    self.number_comparisons = self.number_iter * (list_len - 1)
+    self.number_operations = self.number_swaps + self.number_comparisons
+
+    total_time = time.time() - start_time
+    self.time_elapsed = total_time * self.number_iter / self.number_iter.sum()
+
+@register_sorter("bogo-statistical")
+class StatisticalRandomSorter(Sorter):
+  """
+  Random Sort without the shuffles. Every shuffle is ordered independently of the previous ones, with probability
+  p = (number of ordered arrangements) / n! (1 / n! for distinct elements), so the number of iterations follows a
+  geometric distribution, from which it is drawn directly. The operations are then counted as in RandomSorter.
+
+  The counts are floats, since they overflow 64-bit integers from n = 20. The time is not simulated, so time_elapsed
+  is NaN.
+  """
+
+  max_list_len = 20
+
+  def __init__(self, seed=None):
+    super().__init__("Random Sort")
+    self.rng = np.random.default_rng(seed)
+
+  @staticmethod
+  def success_probability(arr):
+    ordered_arrangements = 1
+    for count in Counter(arr).values():
+      ordered_arrangements *= math.factorial(count)
+    return ordered_arrangements / math.factorial(len(arr))
+
+  def sort(self, arr):
+    self.sort_batch(np.array([arr]))
+
+    arr.sort()
+    self.number_iter = float(self.number_iter[0])
+    self.number_operations = float(self.number_operations[0])
+    self.number_comparisons = float(self.number_comparisons[0])
+    self.number_swaps = float(self.number_swaps[0])
+    self.time_elapsed = float(self.time_elapsed[0])
+
+  def sort_batch(self, arrays, seeds=None):
+    """
+    Draws the counts of sorting every row of arrays, which are left as they are.
+
+    :param seeds: (np.ndarray) Seed of the draw of every row (see splitmix_uniforms), so that the result of a row does
+        not depend on the other rows. Drawn from the generator of the sorter if None.
+    """
+    num_trials, list_len = arrays.shape
+    probabilities = np.array([self.success_probability(row.tolist()) for row in arrays])
+
+    # Inversion of the geometric distribution: P(iterations > k) = (1 - p)^k
+    if seeds is None:
+      uniforms = self.rng.random(num_trials)
+    else:
+      uniforms = splitmix_uniforms(np.asarray(seeds, dtype=np.uint64), np.zeros(num_trials))
+    with np.errstate(divide='ignore'):
+      self.number_iter = np.floor(np.log1p(-uniforms) / np.log1p(-probabilities)) + 1
+
+    self.number_swaps = self.number_iter * list_len
+    self.number_comparisons = self.number_iter * (list_len - 1)
+    self.number_operations = self.number_swaps + self.number_comparisons
+    self.time_elapsed = np.full(num_trials, np.nan)
+
+@register_sorter("bozo")
+class BozoSorter(Sorter):
+  """
+  Swaps two random elements until the list is ordered.
+  """
+  max_list_len = 9
+
+  def __init__(self):
+    super().__init__("Bozo Sort")
+
+  def sort(self, arr):
+    self.reset_counters()
+
+    start_time = time.time()
+
+    while not self.check_ordered(arr) and self.number_iter < MAX_ITERATIONS:
+      self.number_iter += 1
+      self.swap(arr, random.randrange(len(arr)), random.randrange(len(arr)))
+
+    self.stop_counters(start_time)
+
+  def sort_uninstrumented(self, arr):
+    list_len = len(arr)
+    while not is_ordered_ascending(arr):
+      i, j = random.randrange(list_len), random.randrange(list_len)
+      arr[i], arr[j] = arr[j], arr[i]
+
+@register_sorter("selection")
 class SelectionSorter(Sorter):
+  """
+  number_swaps only counts the real swaps, as in the other sorters, but number_operations keeps the count of the
+  paper, where every pass counts a swap even when its lowest item is already in place.
+  """
   def __init__(self):
     super().__init__("Selection Sort")
 
   def sort(self, arr):
-    self.number_iter = 0
-    self.number_operations = 0
-    self.time_elapsed = 0
+    self.reset_counters()
 
     start_time = time.time()
     # This value of i corresponds to how many values were sorted
@@ -68,19 +364,234 @@ class SelectionSorter(Sorter):
       # This loop iterates over the unsorted items
       for j in range(i + 1, len(arr)):
         self.number_operations += 1
+        self.number_comparisons += 1
         if arr[j] < arr[lowest_value_index]:
           lowest_value_index = j
       # Swap values of the lowest unsorted element with the first unsorted
       # element
-      arr[i], arr[lowest_value_index] = arr[lowest_value_index], arr[i]
+      self.swap(arr, i, lowest_value_index)
       self.number_operations += 1
 
     self.time_elapsed = time.time() - start_time
 
-def run_trial(sorter, list_len):
+  def sort_uninstrumented(self, arr):
+    for i in range(len(arr)):
+      lowest_value_index = i
+      for j in range(i + 1, len(arr)):
+        if arr[j] < arr[lowest_value_index]:
+          lowest_value_index = j
+      arr[i], arr[lowest_value_index] = arr[lowest_value_index], arr[i]
+
+@register_sorter("insertion")
+class InsertionSorter(Sorter):
+  def __init__(self):
+    super().__init__("Insertion Sort")
+
+  def sort(self, arr):
+    self.reset_counters()
+
+    start_time = time.time()
+    # The first i items are sorted
+    for i in range(1, len(arr)):
+      # Swap the next item down until the item before it is not greater
+      j = i
+      while j > 0 and self.greater(arr[j - 1], arr[j]):
+        self.swap(arr, j - 1, j)
+        j -= 1
+
+    self.stop_counters(start_time)
+
+  def sort_uninstrumented(self, arr):
+    for i in range(1, len(arr)):
+      j = i
+      while j > 0 and arr[j - 1] > arr[j]:
+        arr[j - 1], arr[j] = arr[j], arr[j - 1]
+        j -= 1
+
+@register_sorter("merge")
+class MergeSorter(Sorter):
+  """
+  Bottom-up Merge Sort, which merges runs of width 1, 2, 4... A swap is counted per item written back to the list.
+  """
+
+  def __init__(self):
+    super().__init__("Merge Sort")
+
+  def sort(self, arr):
+    self.reset_counters()
+
+    start_time = time.time()
+    buffer = list(arr)
+    width = 1
+
+    while width < len(arr):
+      for left in range(0, len(arr), 2 * width):
+        middle = min(left + width, len(arr))
+        right = min(left + 2 * width, len(arr))
+        buffer[left:right] = arr[left:right]
+
+        # Merge buffer[left:middle] and buffer[middle:right] into arr[left:right]
+        i, j = left, middle
+        for k in range(left, right):
+          if j >= right or (i < middle and not self.greater(buffer[i], buffer[j])):
+            arr[k] = buffer[i]
+            i += 1
+          else:
+            arr[k] = buffer[j]
+            j += 1
+          self.number_swaps += 1
+
+      width *= 2
+
+    self.stop_counters(start_time)
+
+  def sort_uninstrumented(self, arr):
+    buffer = list(arr)
+    width = 1
+
+    while width < len(arr):
+      for left in range(0, len(arr), 2 * width):
+        middle = min(left + width, len(arr))
+        right = min(left + 2 * width, len(arr))
+        buffer[left:right] = arr[left:right]
+
+        i, j = left, middle
+        for k in range(left, right):
+          if j >= right or (i < middle and not buffer[i] > buffer[j]):
+            arr[k] = buffer[i]
+            i += 1
+          else:
+            arr[k] = buffer[j]
+            j += 1
+
+      width *= 2
+
+@register_sorter("quick")
+class QuickSorter(Sorter):
+  """
+  Quick Sort with the middle item as pivot and a three-way partition, so that sorted lists and lists with few unique
+  values are not worst cases. The partitions are kept in a stack rather than recursing.
+  """
+
+  def __init__(self):
+    super().__init__("Quick Sort")
+
+  def sort(self, arr):
+    self.reset_counters()
+
+    start_time = time.time()
+    partitions = [(0, len(arr) - 1)]
+
+    while partitions:
+      low, high = partitions.pop()
+      if low >= high:
+        continue
+
+      # Items in [low, lower) are smaller than the pivot, in [lower, i) equal and in (upper, high] greater
+      pivot = arr[(low + high) // 2]
+      lower, i, upper = low, low, high
+      while i <= upper:
+        if self.greater(pivot, arr[i]):
+          self.swap(arr, lower, i)
+          lower += 1
+          i += 1
+        elif self.greater(arr[i], pivot):
+          self.swap(arr, i, upper)
+          upper -= 1
+        else:
+          i += 1
+
+      partitions.append((low, lower - 1))
+      partitions.append((upper + 1, high))
+
+    self.stop_counters(start_time)
+
+  def sort_uninstrumented(self, arr):
+    partitions = [(0, len(arr) - 1)]
+
+    while partitions:
+      low, high = partitions.pop()
+      if low >= high:
+        continue
+
+      pivot = arr[(low + high) // 2]
+      lower, i, upper = low, low, high
+      while i <= upper:
+        if pivot > arr[i]:
+          arr[lower], arr[i] = arr[i], arr[lower]
+          lower += 1
+          i += 1
+        elif arr[i] > pivot:
+          arr[i], arr[upper] = arr[upper], arr[i]
+          upper -= 1
+        else:
+          i += 1
+
+      partitions.append((low, lower - 1))
+      partitions.append((upper + 1, high))
+
+@register_sorter("heap")
+class HeapSorter(Sorter):
+  def __init__(self):
+    super().__init__("Heap Sort")
+
+  def sift_down(self, arr, root, end):
+    # Swap the root down until it is not smaller than its children, in arr[:end]
+    while 2 * root + 1 < end:
+      child = 2 * root + 1
+      if child + 1 < end and self.greater(arr[child + 1], arr[child]):
+        child += 1
+      if not self.greater(arr[child], arr[root]):
+        return
+      self.swap(arr, root, child)
+      root = child
+
+  def sort(self, arr):
+    self.reset_counters()
+
+    start_time = time.time()
+
+    for root in range(len(arr) // 2 - 1, -1, -1):
+      self.sift_down(arr, root, len(arr))
+
+    # Move the largest item of the heap after it, and restore the heap in the items left
+    for end in range(len(arr) - 1, 0, -1):
+      self.swap(arr, 0, end)
+      self.sift_down(arr, 0, end)
+
+    self.stop_counters(start_time)
+
+  @staticmethod
+  def sift_down_uninstrumented(arr, root, end):
+    while 2 * root + 1 < end:
+      child = 2 * root + 1
+      if child + 1 < end and arr[child + 1] > arr[child]:
+        child += 1
+      if not arr[child] > arr[root]:
+        return
+      arr[root], arr[child] = arr[child], arr[root]
+      root = child
+
+  def sort_uninstrumented(self, arr):
+    for root in range(len(arr) // 2 - 1, -1, -1):
+      self.sift_down_uninstrumented(arr, root, len(arr))
+
+    for end in range(len(arr) - 1, 0, -1):
+      arr[0], arr[end] = arr[end], arr[0]
+      self.sift_down_uninstrumented(arr, 0, end)
+
+def run_trial(sorter, list_len, trial_count=TRIAL_COUNT):
   trials = {"name": sorter.name, "time": [], "operations": []}
 
-  for _ in tqdm(range(TRIAL_COUNT)):
+  if hasattr(sorter, "sort_batch"):
+    random_arrays = np.array([random.sample(list(range(list_len)), k=list_len) for _ in range(trial_count)])
+    sorter.sort_batch(random_arrays)
+
+    trials["time"] = sorter.time_elapsed.tolist()
+    trials["operations"] = sorter.number_operations.tolist()
+    return trials
+
+  for _ in tqdm(range(trial_count)):
   # for _ in range(TRIAL_COUNT):
     random_array = random.sample(list(range(list_len)), k=list_len)
     sorter.sort(random_array)
@@ -90,6 +601,288 @@ def run_trial(sorter, list_len):
 
   return trials
 
+def make_input(distribution, list_len, rng):
+  """
+  :param rng: (random.Random) Generator of the random distributions.
+  :return: (list) A list of list_len items, from the given distribution.
+  """
+  if distribution == "random":
+    return rng.sample(list(range(list_len)), k=list_len)
+  elif distribution == "sorted":
+    return list(range(list_len))
+  elif distribution == "reversed":
+    return list(range(list_len - 1, -1, -1))
+  elif distribution == "few-unique":
+    return [rng.randrange(FEW_UNIQUE_VALUES) for _ in range(list_len)]
+  else:
+    raise Exception("Distribution '{}' is unknown.".format(distribution))
+
+def derive_input_seed(seed, distribution, list_len, trial):
+  """
+  Derives the seed of the input list of a trial, which is the same for every sorter so that they sort the same lists.
+  """
+  distribution_key = zlib.crc32(distribution.encode())
+  return int(np.random.SeedSequence(seed, spawn_key=(0, distribution_key, list_len, trial)).generate_state(1)[0])
+
+def derive_trial_seed(seed, sorter_class, list_len, trial):
+  """
+  Derives the seed of a single trial, which only depends on the sorter, the list length and the trial number, so that
+  results are the same whatever the number of worker processes and the order in which they run the trials.
+  """
+  sorter_key = zlib.crc32(sorter_class.__name__.encode())
+  return int(np.random.SeedSequence(seed, spawn_key=(sorter_key, list_len, trial)).generate_state(1)[0])
+
+def run_seeded_trials(sorter_class, list_len, trials, seed, distribution=DEFAULT_DISTRIBUTION):
+  """
+  Runs some trials of a sorter, each with the random streams of its own seed. This is the task of the worker processes.
+
+  Sorters with a sort_batch sort all the trials with a single call instead, every row drawing from the stream of its
+  own trial seed, so that the result of a trial does not depend on the other trials of the task.
+
+  :return: (list) The record of every trial: its cell, seed and TRIAL_METRICS.
+  """
+  input_arrays = [make_input(distribution, list_len, random.Random(derive_input_seed(seed, distribution, list_len,
+                                                                                     trial)))
+                  for trial in trials]
+
+  if hasattr(sorter_class, "sort_batch"):
+    trial_seeds = [derive_trial_seed(seed, sorter_class, list_len, trial) for trial in trials]
+    sorter = sorter_class()
+    sorter.sort_batch(np.array(input_arrays), np.array(trial_seeds, dtype=np.uint64))
+
+    trial_metrics = zip(sorter.time_elapsed, sorter.number_operations, sorter.number_comparisons, sorter.number_swaps,
+                        sorter.number_iter)
+  else:
+    trial_seeds = []
+    trial_metrics = []
+
+    for trial, input_array in zip(trials, input_arrays):
+      trial_seed = derive_trial_seed(seed, sorter_class, list_len, trial)
+      # RandomSorter shuffles with the global random module
+      random.seed(random.Random(trial_seed).getrandbits(64))
+
+      sorter = sorter_class()
+      sorter.sort(input_array)
+
+      trial_seeds.append(trial_seed)
+      trial_metrics.append([sorter.time_elapsed, sorter.number_operations, sorter.number_comparisons,
+                            sorter.number_swaps, sorter.number_iter])
+
+  results = []
+
+  for trial, trial_seed, metrics in zip(trials, trial_seeds, trial_metrics):
+    record = {"sorter": sorter_class.key, "distribution": distribution, "list_len": list_len, "seed": seed,
+              "trial": trial, "trial_seed": trial_seed}
+    # NumPy numbers are converted so that the records can be written as JSON
+    record.update((name, value.item() if isinstance(value, np.generic) else value)
+                  for name, value in zip(TRIAL_METRICS, metrics))
+    results.append(record)
+
+  return results
+
+class ResultStore:
+  """
+  Append-only store of the records of the trials (see run_seeded_trials), one JSON object per line.
+
+  Records are written as soon as their trials finish, so that a sweep that is stopped or crashes can be resumed with
+  only the missing trials, and its results plotted without running anything.
+  """
+
+  def __init__(self, path=DEFAULT_STORE_FILE):
+    self.path = path
+    # Records by (sorter, distribution, list_len, seed) and trial
+    self.records = {}
+
+    ends_with_newline = True
+
+    if os.path.exists(path):
+      with open(path) as store_file:
+        for line in store_file:
+          ends_with_newline = line.endswith("\n")
+          try:
+            self.add(json.loads(line))
+          except ValueError:
+            # The last line may have been cut short by a crash
+            pass
+
+    self.store_file = open(path, "a")
+    if not ends_with_newline:
+      self.store_file.write("\n")
+
+  def close(self):
+    self.store_file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def add(self, record):
+    cell = (record["sorter"], record["distribution"], record["list_len"], record["seed"])
+    self.records.setdefault(cell, {})[record["trial"]] = record
+
+  def append(self, record):
+    self.store_file.write(json.dumps(record) + "\n")
+    self.store_file.flush()
+    self.add(record)
+
+  def get_records(self, sorter_class, distribution, list_len, seed):
+    """
+    :return: (dict) The records stored for a sorter, distribution, list length and seed, by trial.
+    """
+    return self.records.get((sorter_class.key, distribution, list_len, seed), {})
+
+  def trial_results(self, sorter_class, list_lengths, seed=DEFAULT_SEED, distribution=DEFAULT_DISTRIBUTION):
+    """
+    Gathers every trial stored for the given list lengths, without running anything.
+
+    :return: (list, list) The list lengths that have trials, and their trials in the format of run_trials_parallel.
+    """
+    stored_lengths = []
+    trial_results = []
+
+    for list_len in list_lengths:
+      records = self.get_records(sorter_class, distribution, list_len, seed)
+      if not records:
+        continue
+
+      trials = {"name": sorter_class().name}
+      for metric in TRIAL_METRICS:
+        trials[metric] = [records[trial][metric] for trial in sorted(records)]
+
+      stored_lengths.append(list_len)
+      trial_results.append(trials)
+
+    return stored_lengths, trial_results
+
+def run_trials_parallel(sorter_class, list_lengths, trial_count=TRIAL_COUNT, seed=DEFAULT_SEED, max_workers=None,
+                        distribution=DEFAULT_DISTRIBUTION, store=None):
+  """
+  Runs trial_count trials of a sorter for every list length, spread across a pool of processes.
+
+  Trials run at the same time compete for the CPU, so their times are less precise than those of run_trial.
+
+  :param store: (ResultStore) Store where every trial is appended as soon as it finishes. The trials already in it
+      are not run again.
+  :return: (list) The trials of every list length, in the format of run_trial plus the other TRIAL_METRICS.
+  """
+  sorter_name = sorter_class().name
+  trial_results = [{"name": sorter_name, **{metric: [None] * trial_count for metric in TRIAL_METRICS}}
+                   for _ in list_lengths]
+  pending_trials = []
+
+  for i, list_len in enumerate(list_lengths):
+    stored_records = store.get_records(sorter_class, distribution, list_len, seed) if store is not None else {}
+
+    for trial in range(trial_count):
+      if trial in stored_records:
+        for metric in TRIAL_METRICS:
+          trial_results[i][metric][trial] = stored_records[trial][metric]
+      else:
+        pending_trials.append((i, trial))
+
+  if len(pending_trials) < len(list_lengths) * trial_count:
+    print("{} of the trials of {} are already in the store.".format(
+      len(list_lengths) * trial_count - len(pending_trials), sorter_name))
+
+  with ProcessPoolExecutor(max_workers=max_workers) as executor, \
+      tqdm(total=len(pending_trials), desc=sorter_name) as progress:
+    futures = {}
+
+    # The trials of a task all have the same list length
+    trials_per_task = BATCHED_TRIALS_PER_TASK if hasattr(sorter_class, "sort_batch") else TRIALS_PER_TASK
+
+    for i, list_len in enumerate(list_lengths):
+      trials = [trial for trial_i, trial in pending_trials if trial_i == i]
+      for start in range(0, len(trials), trials_per_task):
+        task_trials = trials[start:start + trials_per_task]
+        futures[executor.submit(run_seeded_trials, sorter_class, list_len, task_trials, seed, distribution)] = i
+
+    for future in as_completed(futures):
+      i = futures[future]
+
+      for record in future.result():
+        for metric in TRIAL_METRICS:
+          trial_results[i][metric][record["trial"]] = record[metric]
+        if store is not None:
+          store.append(record)
+
+      progress.update(len(future.result()))
+
+  return trial_results
+
+def supports_timing(sorter_class):
+  return sorter_class.sort_uninstrumented is not Sorter.sort_uninstrumented
+
+def robust_statistics(samples):
+  """
+  :param samples: (list) Durations, in nanoseconds.
+  :return: (dict) Their median, median absolute deviation (scaled to estimate the standard deviation), interquartile
+      range and minimum, and the mean of the samples that are not outliers.
+  """
+  samples = np.asarray(samples, dtype=np.float64)
+  median = np.median(samples)
+  mad = 1.4826 * np.median(np.abs(samples - median))
+  q1, q3 = np.percentile(samples, [25, 75])
+
+  inliers = samples[np.abs(samples - median) <= OUTLIER_MADS * mad] if mad > 0 else samples
+
+  return {"median_ns": float(median), "mad_ns": float(mad), "iqr_ns": float(q3 - q1), "min_ns": float(samples.min()),
+          "mean_ns": float(inliers.mean()), "outliers": len(samples) - len(inliers)}
+
+def time_sort(sorter, input_array, loops, disable_gc=True):
+  """
+  :return: (float) The time, in nanoseconds, of sorting a copy of input_array, averaged over loops copies.
+  """
+  # The copies are made before starting the clock
+  arrays = [list(input_array) for _ in range(loops)]
+  sort = sorter.sort_uninstrumented
+
+  gc.collect()
+  gc_was_enabled = gc.isenabled()
+  if disable_gc:
+    gc.disable()
+
+  try:
+    start_time = time.perf_counter_ns()
+    for arr in arrays:
+      sort(arr)
+    end_time = time.perf_counter_ns()
+  finally:
+    if gc_was_enabled:
+      gc.enable()
+
+  return (end_time - start_time) / loops
+
+def time_sorter(sorter_class, list_len, distribution=DEFAULT_DISTRIBUTION, seed=DEFAULT_SEED,
+                repeats=DEFAULT_TIMING_REPEATS, warmup=DEFAULT_TIMING_WARMUP, disable_gc=True):
+  """
+  Times the uninstrumented sort of a list, in the same input as the first trial of the counting mode.
+
+  Every sample sorts enough copies of the list for its duration to be well above the resolution of the clock. The
+  first warmup samples are discarded, and the garbage collector is off while a sample is taken.
+
+  :return: (dict) The robust statistics of the repeats samples (see robust_statistics), and the loops per sample.
+  """
+  sorter = sorter_class()
+  input_array = make_input(distribution, list_len, random.Random(derive_input_seed(seed, distribution, list_len, 0)))
+  random.seed(derive_trial_seed(seed, sorter_class, list_len, 0))
+
+  # Double the copies per sample until a sample is long enough, like timeit does
+  loops = 1
+  while loops < TIMING_MAX_LOOPS and time_sort(sorter, input_array, loops, disable_gc) * loops < TIMING_MIN_SAMPLE_NS:
+    loops = min(2 * loops, TIMING_MAX_LOOPS)
+
+  for _ in range(warmup):
+    time_sort(sorter, input_array, loops, disable_gc)
+
+  samples = [time_sort(sorter, input_array, loops, disable_gc) for _ in range(repeats)]
+
+  timing = robust_statistics(samples)
+  timing.update(loops=loops, repeats=repeats)
+  return timing
+
 def plot_chart(sorter, list_lengths, results):
     # init chart
     fig, axarr = plt.subplots(1, 1, figsize=(8, 3))
@@ -112,7 +905,7 @@ def plot_chart(sorter, list_lengths, results):
     # average operation graph
     # plot cycles to graph
     for i, (length, trial) in enumerate(zip(list_lengths, results)):
-        trial_ops = np.ones(TRIAL_COUNT) * length
+        trial_ops = np.ones(len(trial["operations"])) * length
         axarr.plot(trial_ops, np.log(trial["operations"]), "rx", alpha=0.4)
 
     # plot average result
@@ -139,23 +932,227 @@ def plot_chart(sorter, list_lengths, results):
     file_name = file_name.replace(" ","-")
     plt.savefig(file_name + ".png")
 
+def run_benchmark(sorter_keys, list_lengths=BENCHMARK_LIST_LENGTHS, distributions=DISTRIBUTIONS,
+                  trial_count=TRIAL_COUNT, seed=DEFAULT_SEED, max_workers=None, timing=False,
+                  repeats=DEFAULT_TIMING_REPEATS, warmup=DEFAULT_TIMING_WARMUP, disable_gc=True, store=None,
+                  plot_only=False):
+    """
+    Runs the registered sorters over every list length and input distribution. The lengths above the max_list_len of
+    a sorter are skipped.
+
+    With timing, every sorter is also timed by time_sorter, one length at a time in this process so that the timings
+    do not compete for the CPU. The timing is added to the trials of every length, as "timing" (None for the sorters
+    that cannot be timed).
+
+    With plot_only, the trials are only read from the store, and nothing is run or timed.
+
+    :return: (dict) The list lengths run and their trials (see run_trials_parallel), by sorter key and distribution.
+    """
+    results = {}
+
+    for distribution in distributions:
+      for key in sorter_keys:
+        sorter_class = SORTERS[key]
+        sorter_lengths = [list_len for list_len in list_lengths
+                          if sorter_class.max_list_len is None or list_len <= sorter_class.max_list_len]
+
+        if len(sorter_lengths) < len(list_lengths):
+          print("Skipping the lengths of {} above {}.".format(key, sorter_class.max_list_len))
+
+        if plot_only:
+          results[(key, distribution)] = store.trial_results(sorter_class, sorter_lengths, seed, distribution)
+          continue
+
+        trial_results = run_trials_parallel(sorter_class, sorter_lengths, trial_count, seed=seed,
+                                            max_workers=max_workers, distribution=distribution, store=store)
+
+        if timing:
+          for list_len, trials in zip(sorter_lengths, trial_results):
+            trials["timing"] = None
+            if supports_timing(sorter_class):
+              trials["timing"] = time_sorter(sorter_class, list_len, distribution, seed, repeats, warmup, disable_gc)
+
+        results[(key, distribution)] = (sorter_lengths, trial_results)
+
+    return results
+
+def summarize_benchmark(results):
+    """
+    :return: (list) A row per sorter, distribution and list length, with the mean of every metric over the trials.
+    """
+    rows = []
+
+    for (key, distribution), (list_lengths, trial_results) in results.items():
+      for list_len, trials in zip(list_lengths, trial_results):
+        row = {"sorter": key, "distribution": distribution, "n": list_len, "trials": len(trials["operations"])}
+        for metric in BENCHMARK_METRICS + ["operations", "time"]:
+          row[metric] = float(np.mean(trials[metric]))
+        if "timing" in trials:
+          timing = trials["timing"] or {}
+          for statistic in ["median_ns", "mad_ns", "iqr_ns", "min_ns"]:
+            row[statistic] = timing.get(statistic, np.nan)
+        rows.append(row)
+
+    return rows
+
+def write_benchmark_table(rows, file_name=BENCHMARK_TABLE_FILE):
+    with open(file_name, "w", newline="") as table_file:
+      writer = csv.DictWriter(table_file, fieldnames=list(rows[0]))
+      writer.writeheader()
+      writer.writerows(rows)
+
+def print_benchmark_table(rows):
+    # The time of the counting mode is left out when there is a precise one
+    timed = "median_ns" in rows[0]
+
+    print("{:<18} {:<12} {:>6} {:>16} {:>16} {:>16}".format("sorter", "distribution", "n", "comparisons", "swaps",
+                                                          "median (ns)" if timed else "time (s)"))
+    for row in rows:
+      line = "{sorter:<18} {distribution:<12} {n:>6} {comparisons:>16.1f} {swaps:>16.1f}".format(**row)
+      if timed:
+        line += " {median_ns:>16.0f} +/- {mad_ns:.0f}".format(**row)
+      else:
+        line += " {time:>16.6f}".format(**row)
+      print(line)
+
+def plot_benchmark(results, distribution):
+    """
+    Plots the mean comparisons and swaps of every sorter for one input distribution, in 'comparison-<distribution>.png'.
+    """
+    fig, axarr = plt.subplots(1, len(BENCHMARK_METRICS), figsize=(12, 4))
+
+    for (key, result_distribution), (list_lengths, trial_results) in results.items():
+      if result_distribution != distribution or not list_lengths:
+        continue
+
+      for axis, metric in zip(axarr, BENCHMARK_METRICS):
+        # Sorted lists cost some sorters no swaps at all, which cannot be drawn on a log scale
+        means = [np.mean(trials[metric]) or np.nan for trials in trial_results]
+        axis.plot(list_lengths, means, marker="o", label=key)
+
+    for axis, metric in zip(axarr, BENCHMARK_METRICS):
+      axis.set_xscale("log", basex=2)
+      axis.set_yscale("log")
+      axis.set_xlabel("Length of Initial List")
+      axis.set_ylabel("Average {}".format(metric.capitalize()))
+      axis.legend(loc=0)
+
+    fig.suptitle("Input: {}".format(distribution))
+    plt.tight_layout()
+    plt.savefig("comparison-{}.png".format(distribution))
+    plt.close(fig)
+
+def validate_statistical_sorter(list_lengths=VALIDATION_LIST_LENGTHS, trial_count=VALIDATION_TRIAL_COUNT, seed=0):
+    """
+    Compares the distribution of the iterations drawn by StatisticalRandomSorter with the one simulated by
+    BatchedRandomSorter, with a two-sample Kolmogorov-Smirnov test for every list length.
+
+    :return: (list) A dict per list length, with the mean iterations of both sorters and the p-value of the test.
+    """
+    explicit_sorter = BatchedRandomSorter(seed)
+    statistical_sorter = StatisticalRandomSorter(seed + 1)
+    validation = []
+
+    print("{:>3} {:>12} {:>12} {:>12} {:>8}".format("n", "n!", "explicit", "statistical", "p-value"))
+
+    for list_len in list_lengths:
+      operations_per_iter = 2 * list_len - 1
+      explicit_iter = np.array(run_trial(explicit_sorter, list_len, trial_count)["operations"]) / operations_per_iter
+      statistical_iter = np.array(run_trial(statistical_sorter, list_len, trial_count)["operations"]) / operations_per_iter
+      p_value = ks_2samp(explicit_iter, statistical_iter).pvalue
+
+      validation.append({"list_len": list_len, "explicit_mean": explicit_iter.mean(),
+                         "statistical_mean": statistical_iter.mean(), "p_value": p_value})
+      print("{:>3} {:>12} {:>12.1f} {:>12.1f} {:>8.3f}".format(list_len, math.factorial(list_len), explicit_iter.mean(),
+                                                             statistical_iter.mean(), p_value))
+
+    return validation
+
 def main():
+    parser = argparse.ArgumentParser(description="Measure the cost of sorting lists of increasing length.")
+    parser.add_argument("--statistical", action="store_true",
+                        help="Draw the iterations of Random Sort from their geometric distribution, for lengths up to "
+                             "{}".format(STATISTICAL_LIST_LENGTHS[-1]))
+    parser.add_argument("--validate", action="store_true",
+                        help="Only check the statistical Random Sort against the simulated one, for small lengths")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Number of worker processes running the trials (default: number of CPUs)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="Seed from which the seed of every trial is derived (default: {})".format(DEFAULT_SEED))
+    parser.add_argument("--sorters", nargs="+", choices=sorted(SORTERS), default=None,
+                        help="Benchmark these sorters against each other, instead of plotting Random Sort and "
+                             "Selection Sort")
+    parser.add_argument("--lengths", nargs="+", type=int, default=BENCHMARK_LIST_LENGTHS,
+                        help="List lengths of the benchmark (default: {})".format(BENCHMARK_LIST_LENGTHS))
+    parser.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=DISTRIBUTIONS,
+                        help="Input distributions of the benchmark (default: all)")
+    parser.add_argument("--trials", type=int, default=TRIAL_COUNT,
+                        help="Trials per sorter, length and distribution of the benchmark (default: {})".format(
+                          TRIAL_COUNT))
+    parser.add_argument("--timing", action="store_true",
+                        help="Also time the uninstrumented sorters of the benchmark precisely")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_TIMING_REPEATS,
+                        help="Timed samples per sorter, length and distribution (default: {})".format(
+                          DEFAULT_TIMING_REPEATS))
+    parser.add_argument("--warmup", type=int, default=DEFAULT_TIMING_WARMUP,
+                        help="Samples discarded before the timed ones (default: {})".format(DEFAULT_TIMING_WARMUP))
+    parser.add_argument("--keep-gc", action="store_true", help="Leave the garbage collector on while timing")
+    parser.add_argument("--store", default=DEFAULT_STORE_FILE,
+                        help="File where the trials are stored, and from which they are resumed (default: {})".format(
+                          DEFAULT_STORE_FILE))
+    parser.add_argument("--no-store", action="store_true", help="Neither read nor write the trials from the store")
+    parser.add_argument("--plot-only", action="store_true",
+                        help="Only plot the trials already in the store, without running any")
+    args = parser.parse_args()
+
+    if args.validate:
+      validate_statistical_sorter()
+      return
+
+    if args.plot_only and args.no_store:
+      parser.error("--plot-only needs the store.")
+
+    store = None if args.no_store else ResultStore(args.store)
+
+    if args.sorters is not None:
+      results = run_benchmark(args.sorters, args.lengths, args.distributions, args.trials, seed=args.seed,
+                              max_workers=args.jobs, timing=args.timing and not args.plot_only,
+                              repeats=args.repeats, warmup=args.warmup, disable_gc=not args.keep_gc, store=store,
+                              plot_only=args.plot_only)
+      rows = summarize_benchmark(results)
+      if not rows:
+        print("There are no trials to plot.")
+        return
+
+      print_benchmark_table(rows)
+      write_benchmark_table(rows)
+      for distribution in args.distributions:
+        plot_benchmark(results, distribution)
+      return
+
     list_sorters = []
 
-    list_sorters.append(RandomSorter())
-    list_sorters.append(SelectionSorter())
+    if args.statistical:
+      list_sorters.append((StatisticalRandomSorter, STATISTICAL_LIST_LENGTHS, BATCHED_TRIAL_COUNT))
+    else:
+      list_sorters.append((BatchedRandomSorter, range(2, 10), BATCHED_TRIAL_COUNT))
+    list_sorters.append((SelectionSorter, range(2, 10), TRIAL_COUNT))
 
-    for sorter in list_sorters:
-      list_lengths = range(2, 10)  # random length for the unsorted lists
+    for sorter_class, list_lengths, trial_count in list_sorters:
+      sorter = sorter_class()
       # results = {"sorter": sorter.name, }
-      trial_results = []
 
-      print ("Running trial with {}.".format(sorter.name))
+      if args.plot_only:
+        list_lengths, trial_results = store.trial_results(sorter_class, list_lengths, args.seed)
+        if not list_lengths:
+          print("There are no trials of {} to plot.".format(sorter.name))
+          continue
+      else:
+        print ("Running trial with {}.".format(sorter.name))
 
-      # run trials and add results to array
-      for list_len in list_lengths:
-          trial_info = run_trial(sorter, list_len)
-          trial_results.append(trial_info)
+        # run trials and add results to array
+        trial_results = run_trials_parallel(sorter_class, list_lengths, trial_count, seed=args.seed,
+                                            max_workers=args.jobs, store=store)
 
       # print(trial_results)
 